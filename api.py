@@ -0,0 +1,248 @@
+"""
+API HTTP/WebSocket del asistente, sin interfaz (para widgets web, WhatsApp, etc.).
+
+Expone el mismo agente de load_graph() que la aplicación de Streamlit. Cada
+conversación se identifica por su thread_id:
+
+    POST /threads                          -> {"thread_id": ...} (lo genera y firma el servidor)
+    POST /threads/{thread_id}/messages     -> respuesta completa (JSON)
+    POST /threads/{thread_id}/stream       -> eventos Server-Sent Events
+    WS   /threads/{thread_id}/ws           -> eventos por WebSocket
+    GET  /health
+    GET  /metrics                          -> métricas en formato Prometheus (ver metrics.py)
+
+Uso:
+    uvicorn api:app --host 0.0.0.0 --port 8000 --workers 4
+
+Con varios workers las conversaciones deben vivir en un checkpointer compartido
+(CHECKPOINTER=sqlite); con 'memory' cada proceso tendría su propia memoria.
+Las métricas también son por proceso: /metrics muestra las del worker que atiende.
+
+Sin API_TOKEN la API no arranca, salvo con API_INSECURE_DEV=1 (solo desarrollo
+local). Los thread_id los genera el servidor y van firmados (HMAC): un cliente no
+puede elegir ni adivinar el de otra conversación.
+"""
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from langgraph_components.graph import load_graph, astream_response
+from langgraph_components.google_services import async_http
+from langgraph_components.metrics import metrics, anonymize
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+import logging
+import asyncio
+import weakref
+import secrets
+import hashlib
+import hmac
+import json
+import uuid
+import os
+
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+# Token obligatorio para las peticiones (cabecera "Authorization: Bearer <token>");
+# API_INSECURE_DEV=1 permite arrancar sin él, solo para desarrollo local
+API_TOKEN = os.getenv('API_TOKEN')
+API_INSECURE_DEV = os.getenv('API_INSECURE_DEV') == '1'
+# Clave con la que se firman los thread_id (por defecto API_TOKEN); todos los workers deben compartirla
+THREAD_ID_SECRET = os.getenv('THREAD_ID_SECRET')
+API_WORKERS = int(os.getenv('API_WORKERS', '4'))
+# Longitud máxima de un mensaje del usuario (caracteres)
+MAX_MESSAGE_CHARS = 4000
+
+
+def build_inputs(content):
+    return {"messages": [{"role": "user", "content": content}], "remaining_steps": 10}
+
+
+def build_config(thread_id):
+    return {"configurable": {"thread_id": thread_id, "recursion_limit": 50}}
+
+
+# Clave de este proceso cuando no hay THREAD_ID_SECRET ni API_TOKEN (desarrollo)
+_PROCESS_SECRET = secrets.token_hex(32)
+
+
+def thread_secret():
+    """Clave con la que se firman los thread_id (sin configurar, los ids solo valen en este proceso)."""
+    return (THREAD_ID_SECRET or API_TOKEN or _PROCESS_SECRET).encode()
+
+
+def thread_signature(secret, token):
+    return hmac.new(secret, token.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def new_thread_id(secret):
+    """thread_id aleatorio y firmado: '<aleatorio>.<firma>' (no contiene datos del cliente)."""
+    token = uuid.uuid4().hex
+    return f"{token}.{thread_signature(secret, token)}"
+
+
+def valid_thread_id(secret, thread_id):
+    token, _, signature = thread_id.partition('.')
+    return bool(token) and hmac.compare_digest(signature, thread_signature(secret, token))
+
+
+def sse_event(kind, value):
+    return f"event: {kind}\ndata: {json.dumps({'type': kind, 'data': value}, ensure_ascii=False)}\n\n"
+
+
+def create_app(graph_factory=None):
+    """Crea la aplicación ASGI; graph_factory permite inyectar otro grafo (pruebas, benchmarks)."""
+    state = {}
+    # Un turno a la vez por conversación (dentro de este proceso)
+    thread_locks = weakref.WeakValueDictionary()
+
+    def thread_lock(thread_id):
+        lock = thread_locks.get(thread_id)
+        if lock is None:
+            lock = thread_locks[thread_id] = asyncio.Lock()
+        return lock
+
+    @asynccontextmanager
+    async def lifespan(app):
+        load_dotenv()
+        if not API_TOKEN and not API_INSECURE_DEV:
+            raise RuntimeError("API_TOKEN no está definido; usa API_INSECURE_DEV=1 solo en desarrollo local")
+        state['secret'] = thread_secret()
+        state['graph'] = (graph_factory or load_graph)()
+        yield
+        await async_http.aclose()
+
+    def authorized(request):
+        if not API_TOKEN:
+            return True
+        return request.headers.get('authorization') == f"Bearer {API_TOKEN}"
+
+    def unauthorized():
+        return JSONResponse({"error": "No autorizado"}, status_code=401)
+
+    def unknown_thread():
+        return JSONResponse({"error": "Conversación no encontrada"}, status_code=404)
+
+    async def read_message(request):
+        """Contenido del mensaje del cuerpo JSON, o una respuesta de error."""
+        try:
+            body = await request.json()
+        except ValueError:
+            return None, JSONResponse({"error": "El cuerpo debe ser JSON"}, status_code=400)
+        content = str(body.get("content", "")).strip() if isinstance(body, dict) else ""
+        if not content:
+            return None, JSONResponse({"error": "Falta el campo 'content'"}, status_code=400)
+        if len(content) > MAX_MESSAGE_CHARS:
+            return None, JSONResponse({"error": "El mensaje es demasiado largo"}, status_code=413)
+        return content, None
+
+    async def run_turn(thread_id, content):
+        """Eventos (tipo, valor) de un turno; los turnos de una misma conversación van en serie."""
+        async with thread_lock(thread_id):
+            async for kind, value in astream_response(state['graph'], build_inputs(content), build_config(thread_id)):
+                yield kind, value
+
+    async def health(request):
+        return JSONResponse({"status": "ok"})
+
+    async def metrics_endpoint(request):
+        if not authorized(request):
+            return unauthorized()
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    async def create_thread(request):
+        if not authorized(request):
+            return unauthorized()
+        # El cuerpo (p. ej. {"email": ...}) ya no forma parte del thread_id: así no queda
+        # en checkpoints, trazas ni URLs
+        return JSONResponse({"thread_id": new_thread_id(state['secret'])}, status_code=201)
+
+    async def post_message(request):
+        if not authorized(request):
+            return unauthorized()
+        content, error = await read_message(request)
+        if error:
+            return error
+        thread_id = request.path_params["thread_id"]
+        if not valid_thread_id(state['secret'], thread_id):
+            return unknown_thread()
+        tools, response = [], ""
+        try:
+            async for kind, value in run_turn(thread_id, content):
+                if kind == "tool_start":
+                    tools.append(value)
+                elif kind == "final":
+                    response = value
+        except Exception:
+            logger.exception("Error procesando el mensaje de %s", anonymize(thread_id))
+            return JSONResponse({"error": "Error procesando el mensaje"}, status_code=500)
+        return JSONResponse({"thread_id": thread_id, "response": response, "tools": tools})
+
+    async def stream_message(request):
+        if not authorized(request):
+            return unauthorized()
+        content, error = await read_message(request)
+        if error:
+            return error
+        thread_id = request.path_params["thread_id"]
+        if not valid_thread_id(state['secret'], thread_id):
+            return unknown_thread()
+
+        async def events():
+            try:
+                async for kind, value in run_turn(thread_id, content):
+                    yield sse_event(kind, value)
+            except Exception:
+                logger.exception("Error en el stream de %s", anonymize(thread_id))
+                yield sse_event("error", "Error procesando el mensaje")
+
+        return StreamingResponse(events(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    async def websocket_thread(websocket):
+        if API_TOKEN and websocket.headers.get('authorization') != f"Bearer {API_TOKEN}" \
+                and websocket.query_params.get('token') != API_TOKEN:
+            await websocket.close(code=1008)
+            return
+        thread_id = websocket.path_params["thread_id"]
+        if not valid_thread_id(state['secret'], thread_id):
+            await websocket.close(code=1008)
+            return
+        await websocket.accept()
+        try:
+            while True:
+                message = await websocket.receive_json()
+                content = str(message.get("content", "")).strip() if isinstance(message, dict) else ""
+                if not content or len(content) > MAX_MESSAGE_CHARS:
+                    await websocket.send_json({"type": "error", "data": "Mensaje vacío o demasiado largo"})
+                    continue
+                try:
+                    async for kind, value in run_turn(thread_id, content):
+                        await websocket.send_json({"type": kind, "data": value})
+                except Exception:
+                    logger.exception("Error en el WebSocket de %s", anonymize(thread_id))
+                    await websocket.send_json({"type": "error", "data": "Error procesando el mensaje"})
+        except WebSocketDisconnect:
+            pass
+
+    return Starlette(
+        routes=[
+            Route("/health", health),
+            Route("/metrics", metrics_endpoint),
+            Route("/threads", create_thread, methods=["POST"]),
+            Route("/threads/{thread_id}/messages", post_message, methods=["POST"]),
+            Route("/threads/{thread_id}/stream", stream_message, methods=["POST"]),
+            WebSocketRoute("/threads/{thread_id}/ws", websocket_thread),
+        ],
+        lifespan=lifespan,
+    )
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("api:app", host="0.0.0.0", port=int(os.getenv('API_PORT', '8000')), workers=API_WORKERS)
@@ -1,14 +1,36 @@
 from dotenv import load_dotenv
 from langgraph_components.states import State
-from langgraph_components.graph import load_graph
+from langgraph_components.graph import load_graph, stream_response
+from langgraph_components.router import validate_email
+from langgraph_components.metrics import METRICS_PORT, start_metrics_server
+from api import new_thread_id, thread_secret
 import streamlit as st
-import re
+import logging
+import os
 
-def validate_email(email: str) -> bool:
-    """Valida que el email tenga un formato correcto"""
-    email = email.strip()
-    email_pattern = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
-    return bool(email_pattern.match(email))
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+# Texto que se muestra mientras se ejecuta cada herramienta
+TOOL_LABELS = {
+    "create_calendar_event": "Agendando la cita",
+    "modify_calendar_event": "Modificando la cita",
+    "modify_calendar_events": "Modificando las citas",
+    "cancel_calendar_event": "Cancelando la cita",
+    "cancel_calendar_events": "Cancelando las citas",
+    "search_calendar_event": "Buscando citas en el calendario",
+    "find_available_slots": "Buscando horarios disponibles",
+    "get_current_datetime": "Consultando la fecha y hora",
+    "send_verification_code": "Enviando el código de verificación",
+    "verify_code": "Verificando el código",
+}
+
+@st.cache_resource
+def get_graph():
+    """Grafo compilado y cliente LLM compartidos por todas las sesiones del proceso"""
+    load_dotenv()
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT))
+    return load_graph()
 
 def initialize_session_state():
     """Inicializa el estado de la sesión si no existe"""
@@ -16,11 +38,10 @@ def initialize_session_state():
         st.session_state.messages = []
     if "email" not in st.session_state:
         st.session_state.email = None
+    if "thread_id" not in st.session_state:
+        st.session_state.thread_id = None
     if "current_state" not in st.session_state:
         st.session_state.current_state = None
-    if "graph" not in st.session_state:
-        load_dotenv()
-        st.session_state.graph = load_graph()
     if "waiting_for_response" not in st.session_state:
         st.session_state.waiting_for_response = False
 
@@ -28,8 +49,9 @@ def main():
     st.markdown("<h1 style='text-align: center;'>Temis - Asistente Legal Virtual</h1>", 
                 unsafe_allow_html=True)
     
-    # Inicializar estado de sesión
+    # Inicializar estado de sesión (el grafo se construye una sola vez por proceso)
     initialize_session_state()
+    get_graph()
     
     # Solicitar email en el sidebar
     email = st.sidebar.text_input(
@@ -41,6 +63,10 @@ def main():
     # Validar email
     if email:
         if validate_email(email):
+            if email != st.session_state.email or st.session_state.thread_id is None:
+                # Cada correo validado en esta sesión tiene su propia conversación; el
+                # thread_id es aleatorio y firmado, sin el correo (ver api.new_thread_id)
+                st.session_state.thread_id = new_thread_id(thread_secret())
             st.session_state.email = email
             if st.session_state.current_state is None:
                 st.session_state.current_state = State(
@@ -73,51 +99,58 @@ def main():
         with st.chat_message("user"):
             st.markdown(user_input)
         
-        # Mostrar indicador de carga mientras se procesa la respuesta
+        # Mostrar la respuesta a medida que se genera
         with st.chat_message("assistant"):
-            with st.spinner("Generando respuesta..."):
-                try:
-                    # Configurar el estado inicial y config para el stream
-                    config = {"configurable": {"thread_id": "thread-1", "recursion_limit": 50}}
-                    initial_state = {
-                        "messages": [{"role": "user", "content": user_input}],
-                        "remaining_steps": 10
-                    }
-                    
-                    # Obtener el stream de eventos
-                    events = st.session_state.graph.stream(
-                        initial_state,
-                        config,
-                        stream_mode="updates"
-                    )
+            placeholder = st.empty()
+            placeholder.markdown("Generando respuesta...")
+            status = None
+            try:
+                # Configurar el estado inicial y config para el stream
+                config = {"configurable": {"thread_id": st.session_state.thread_id, "recursion_limit": 50}}
+                initial_state = {
+                    "messages": [{"role": "user", "content": user_input}],
+                    "remaining_steps": 10
+                }
+
+                partial = ""
+                for kind, value in stream_response(get_graph(), initial_state, config):
+                    if kind == "token":
+                        partial += value
+                        placeholder.markdown(partial + "▌")
+                    elif kind == "tool_start":
+                        # El texto previo a una llamada a herramienta no es la respuesta final
+                        partial = ""
+                        if status is None:
+                            status = st.status("Consultando...", expanded=False)
+                        label = TOOL_LABELS.get(value, value)
+                        status.update(label=f"{label}...", state="running")
+                        status.write(f"{label}...")
+                        placeholder.markdown("Generando respuesta...")
+                    elif kind == "tool_end":
+                        status.update(label="Consulta completada", state="complete")
+                    elif kind == "final":
+                        response = value or partial
+                        placeholder.markdown(response)
+
+                        # Agregar respuesta al historial
+                        st.session_state.messages.append({
+                            "role": "assistant",
+                            "content": response
+                        })
+
+                        # Actualizar el estado actual
+                        if st.session_state.current_state is None:
+                            st.session_state.current_state = State(
+                                messages=st.session_state.messages.copy(),
+                                remaining_steps=10
+                            )
+                        else:
+                            st.session_state.current_state["messages"] = st.session_state.messages.copy()
+
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
 
-                    # Procesar los eventos
-                    for event in events:
-                        if "agent" in event:
-                            # Obtener el mensaje del asistente (AIMessage)
-                            ai_message = event["agent"]["messages"][-1]
-                            response = ai_message.content
-                            
-                            # Agregar respuesta al historial
-                            st.session_state.messages.append({
-                                "role": "assistant", 
-                                "content": response
-                            })
-                            st.markdown(response)
-                            
-                            # Actualizar el estado actual
-                            if st.session_state.current_state is None:
-                                st.session_state.current_state = State(
-                                    messages=st.session_state.messages.copy(),
-                                    remaining_steps=10
-                                )
-                            else:
-                                st.session_state.current_state["messages"] = st.session_state.messages.copy()
-                    
-                except Exception as e:
-                    st.error(f"Error: {str(e)}")
-                
-                st.session_state.waiting_for_response = False
+            st.session_state.waiting_for_response = False
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
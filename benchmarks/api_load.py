@@ -0,0 +1,98 @@
+"""
+Prueba de carga de la API (api.py): peticiones por segundo y latencias de
+POST /threads/{thread_id}/messages con muchas conversaciones concurrentes.
+
+Contra la API real:
+    uvicorn api:app --workers 4
+    python benchmarks/api_load.py --url http://127.0.0.1:8000
+
+Sin red ni credenciales, con un modelo falso con latencia (fake_app):
+    API_INSECURE_DEV=1 THREAD_ID_SECRET=bench uvicorn --factory benchmarks.api_load:fake_app --workers 4
+    python benchmarks/api_load.py --url http://127.0.0.1:8000
+
+Uso:
+    python benchmarks/api_load.py [--url ...] [--concurrency 50] [--requests 500]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+
+def fake_app():
+    """API con un agente falso: una herramienta y dos llamadas al modelo de FAKE_LLM_LATENCY segundos."""
+    from langgraph.checkpoint.memory import MemorySaver
+    from benchmarks.fakes import ScriptedAgentModel
+    from langgraph_components.graph import load_graph
+    from api import create_app
+
+    def graph_factory():
+        model = ScriptedAgentModel(
+            tool_calls=[("get_current_datetime", {})],
+            answer="Hola, ¿en qué puedo ayudarte con tu agenda?",
+            latency=float(os.getenv('FAKE_LLM_LATENCY', '0.3')),
+        )
+        return load_graph(checkpointer=MemorySaver(), llm=model)
+
+    return create_app(graph_factory)
+
+
+async def run(url, concurrency, total, token):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async def worker(client):
+        nonlocal errors
+        # Cada worker es una conversación: sus turnos van en serie, como un usuario real
+        response = await client.post("/threads")
+        response.raise_for_status()
+        thread_id = response.json()["thread_id"]
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"/threads/{thread_id}/messages", json={"content": "Hola"})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            except httpx.HTTPError:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, headers=headers, limits=limits, timeout=120) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return elapsed, latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--token", default=os.getenv('API_TOKEN'))
+    args = parser.parse_args()
+
+    elapsed, latencies, errors = asyncio.run(run(args.url, args.concurrency, args.requests, args.token))
+    latencies.sort()
+    print(f"{len(latencies)} respuestas, {errors} errores en {elapsed:.1f} s: "
+          f"{len(latencies) / elapsed:.1f} peticiones/s")
+    if latencies:
+        print(f"p50: {statistics.median(latencies) * 1000:.0f} ms  "
+              f"p95: {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Prueba de carga: conversaciones concurrentes por la ruta síncrona (graph.stream
+en un pool de hilos, como los hilos de script de Streamlit) frente a la
+asíncrona (graph.astream en un solo bucle de eventos).
+
+Cada conversación hace un turno con dos herramientas (búsqueda y horarios
+libres) contra un modelo y un Calendar falsos con latencia, así que no necesita
+red ni credenciales.
+
+Uso:
+    python benchmarks/async_load.py [--sessions 200] [--workers 8] [--llm-latency 0.3] [--api-latency 0.1]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# La prueba mide el servidor, no la cuota de Google: se relajan los límites por herramienta
+os.environ.setdefault('CALENDAR_TOOL_CONCURRENCY', '1000')
+
+from concurrent.futures import ThreadPoolExecutor
+from langgraph.checkpoint.memory import MemorySaver
+from benchmarks.fakes import FakeCalendarService, ScriptedAgentModel
+from langgraph_components import graph_tools
+from langgraph_components.availability import FreeBusyIndex
+from langgraph_components.calendar_mirror import CalendarMirror
+from langgraph_components.graph import load_graph, stream_response, astream_response
+
+
+def build_graph(service, llm_latency):
+    # Espejo sin sincronizar e índice con TTL 0: cada herramienta va a la API (falsa)
+    graph_tools.get_calendar_service = lambda: service
+    mirror = CalendarMirror(lambda: service)
+    availability = FreeBusyIndex(lambda: service, ttl=0)
+    graph_tools.get_mirror = lambda: mirror
+    graph_tools.get_availability = lambda: availability
+
+    model = ScriptedAgentModel(
+        tool_calls=[("search_calendar_event", {"query": "Cita"}), ("find_available_slots", {"count": 3})],
+        answer="Estos son los horarios disponibles.",
+        latency=llm_latency,
+    )
+    return load_graph(checkpointer=MemorySaver(), llm=model)
+
+
+def session_inputs():
+    config = {"configurable": {"thread_id": uuid.uuid4().hex}}
+    inputs = {"messages": [("user", "¿Qué horarios tienes libres?")], "remaining_steps": 10}
+    return inputs, config
+
+
+def run_sync(graph, sessions, workers):
+    def session():
+        inputs, config = session_inputs()
+        start = time.perf_counter()
+        for _ in stream_response(graph, inputs, config):
+            pass
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(lambda _: session(), range(sessions)))
+    return time.perf_counter() - start, latencies
+
+
+async def run_async(graph, sessions):
+    async def session():
+        inputs, config = session_inputs()
+        start = time.perf_counter()
+        async for _ in astream_response(graph, inputs, config):
+            pass
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(session() for _ in range(sessions)))
+    return time.perf_counter() - start, latencies
+
+
+def report(label, elapsed, latencies):
+    latencies = sorted(latencies)
+    print(f"{label:<28} {len(latencies) / elapsed:8.1f} conversaciones/s  "
+          f"p50: {statistics.median(latencies) * 1000:7.0f} ms  "
+          f"p95: {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8, help="hilos de la ruta síncrona")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--api-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    print(f"{args.sessions} conversaciones, 2 llamadas al modelo de {args.llm_latency * 1000:.0f} ms "
+          f"y 2 herramientas con peticiones de {args.api_latency * 1000:.0f} ms por turno")
+    service = FakeCalendarService(latency=args.api_latency)
+    graph = build_graph(service, args.llm_latency)
+    report(f"Síncrono ({args.workers} hilos)", *run_sync(graph, args.sessions, args.workers))
+    report("Asíncrono (1 bucle)", *asyncio.run(run_async(graph, args.sessions)))
+
+
+if __name__ == "__main__":
+    main()
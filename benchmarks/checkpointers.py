@@ -0,0 +1,74 @@
+"""
+Compara la latencia por turno de MemorySaver, BoundedMemorySaver y SQLiteSaver.
+
+Usa un grafo mínimo sin LLM para aislar el coste del checkpointer.
+
+Uso:
+    python benchmarks/checkpointers.py [--turns 200] [--threads 20]
+"""
+import argparse
+import statistics
+import tempfile
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import StateGraph, START, END
+from langgraph_components.checkpointers import BoundedMemorySaver, SQLiteSaver
+from langgraph_components.states import State
+
+
+def build_graph(checkpointer):
+    def agent(state):
+        return {"messages": [AIMessage(content="Respuesta de prueba del asistente. " * 10)]}
+
+    workflow = StateGraph(State)
+    workflow.add_node("agent", agent)
+    workflow.add_edge(START, "agent")
+    workflow.add_edge("agent", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def bench(checkpointer, turns, threads):
+    graph = build_graph(checkpointer)
+    latencies = []
+    for turn in range(turns):
+        config = {"configurable": {"thread_id": f"thread-{turn % threads}"}}
+        start = time.perf_counter()
+        graph.invoke({"messages": [("user", f"Mensaje {turn}")], "remaining_steps": 10}, config)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_saver = SQLiteSaver(os.path.join(tmp, "checkpoints.db"))
+        for name, checkpointer in [
+            ("MemorySaver", MemorySaver()),
+            ("BoundedMemorySaver", BoundedMemorySaver()),
+            ("SQLiteSaver", sqlite_saver),
+        ]:
+            result = bench(checkpointer, args.turns, args.threads)
+            print(f"{name:<20} p50: {result['p50']:7.2f} ms  p95: {result['p95']:7.2f} ms")
+
+        start = time.perf_counter()
+        deleted = sqlite_saver.compact(keep_last=5)
+        print(f"compact(): {deleted} checkpoints eliminados en {(time.perf_counter() - start) * 1000:.1f} ms, "
+              f"estado: {sqlite_saver.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
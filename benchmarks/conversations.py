@@ -0,0 +1,384 @@
+"""
+Banco de pruebas sin red de conversaciones completas: N sesiones concurrentes
+repiten guiones realistas (agendar, reprogramar, cancelar y consultar citas,
+siempre verificando antes el correo) contra load_graph() con un modelo
+guionizado y Calendar/Gmail falsos con latencia configurable.
+
+Informa la latencia por turno (p50/p95/p99, en total y por tipo de turno), el
+throughput, las llamadas a herramientas, al modelo y a las APIs falsas, y la
+memoria máxima del proceso. Los resultados se guardan en JSON para comparar
+versiones:
+
+    python benchmarks/conversations.py --sessions 100 --output benchmarks/results/base.json
+    python benchmarks/conversations.py --sessions 100 --compare benchmarks/results/base.json
+
+Con --compare el proceso termina con código 1 si el p95 o el throughput
+empeoran más que --tolerance (20 % por defecto), para usarlo en CI.
+
+Uso:
+    python benchmarks/conversations.py [--sessions 50] [--mode async|sync] [--workers 8]
+        [--llm-latency 0.3] [--api-latency 0.1] [--gmail-latency 0.1]
+        [--output FILE] [--compare FILE] [--tolerance 0.2] [--tracemalloc]
+"""
+import argparse
+import itertools
+import tracemalloc
+import platform
+import resource
+import tempfile
+import asyncio
+import json
+import time
+import uuid
+import sys
+import re
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from langchain_core.messages import ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+from benchmarks.fakes import ConversationModel, FakeCalendarService, FakeGmailService
+from langgraph_components import graph_tools, verification_store
+from langgraph_components.availability import FreeBusyIndex
+from langgraph_components.calendar_mirror import CalendarMirror
+from langgraph_components.graph import load_graph, stream_response, astream_response
+from langgraph_components.llm import ResponseCache
+from langgraph_components.outbox import EmailOutbox, GmailBatchSender
+from langgraph_components.router import fast_path_stats
+from langgraph_components.verification_store import MemoryVerificationStore
+
+SCENARIOS = ('book', 'modify', 'cancel', 'verify')
+# Tiempo máximo que un cliente espera el correo con el código (segundos)
+CODE_TIMEOUT = 10.0
+BOGOTA = ZoneInfo('America/Bogota')
+
+
+def future_slots():
+    """Horarios de una hora en días hábiles desde pasado mañana, sin repetir."""
+    day = datetime.now(BOGOTA).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+    day += timedelta(days=2)
+    while True:
+        if day.weekday() < 5:
+            for hour in range(9, 17):
+                yield day.replace(hour=hour)
+        day += timedelta(days=1)
+
+
+def found_event_id(messages):
+    """ID de la primera cita en el último resultado de search_calendar_event."""
+    for message in reversed(messages):
+        if isinstance(message, ToolMessage):
+            # Formato compacto ("id|inicio|...") o JSON ("id": "...")
+            match = re.search(r'^([^|\n]+)\|\d\d/\d\d|"id":\s*"([^"]+)"', str(message.content), re.M)
+            return (match.group(1) or match.group(2)) if match else ""
+    return ""
+
+
+class Session:
+    """Una conversación guionizada: turnos (tipo, texto) y cita previa si el guion la necesita."""
+
+    def __init__(self, index, scenario):
+        self.index = index
+        self.scenario = scenario
+        self.thread_id = f"bench-{uuid.uuid4().hex}"
+        self.email = f"cliente{index}@example.com"
+        self.name = f"Cliente {index}"
+        self.turns = []
+        self.existing = None
+
+
+def build_session(index, scenario, slots, script):
+    """Crea la sesión y añade al guion del modelo las respuestas de sus turnos."""
+    session = Session(index, scenario)
+    email, name = session.email, session.name
+
+    # Apertura: el modelo consulta la fecha (y los huecos libres si es para agendar) y pide el correo
+    if scenario == 'book':
+        opening = "Hola, quiero agendar una cita"
+        script[opening] = [[("get_current_datetime", {}), ("find_available_slots", {"count": 3})],
+                           "Tengo estos horarios disponibles. Para continuar, ¿cuál es tu correo electrónico?"]
+    else:
+        opening = {"modify": "Necesito cambiar mi cita", "cancel": "Quiero cancelar mi cita",
+                   "verify": "¿Qué citas tengo agendadas?"}[scenario]
+        script[opening] = [[("get_current_datetime", {})],
+                           "Claro. Primero necesito verificar tu identidad: ¿cuál es tu correo electrónico?"]
+        session.existing = next(slots)
+
+    # Correo y código los resuelve el router sin el modelo; el código se lee del Gmail falso
+    session.turns = [("opening", opening), ("email", email), ("code", None)]
+
+    if scenario == 'book':
+        slot = next(slots)
+        action = f"Soy {name}. Quiero la cita el {slot:%d/%m/%Y} a las {slot:%H:%M}, motivo: asesoría laboral"
+        script[action] = [[("create_calendar_event", {
+            "date": f"{slot:%d/%m/%Y}", "time": f"{slot:%H:%M}", "client_name": name,
+            "client_email": email, "reason": "asesoría laboral", "is_verified": True})],
+            "¡Listo! Tu cita quedó agendada. 📅"]
+    elif scenario == 'modify':
+        slot = next(slots)
+        action = f"Soy {name}. Muévela al {slot:%d/%m/%Y} a las {slot:%H:%M}"
+        script[action] = [
+            [("search_calendar_event", {"client_email": email})],
+            lambda messages: [("modify_calendar_event", {
+                "event_id": found_event_id(messages), "client_email": email,
+                "new_date": f"{slot:%d/%m/%Y}", "new_time": f"{slot:%H:%M}", "is_verified": True})],
+            "Tu cita quedó reprogramada. ✅"]
+    elif scenario == 'cancel':
+        action = f"Soy {name}. Sí, cancélala"
+        script[action] = [
+            [("search_calendar_event", {"client_email": email})],
+            lambda messages: [("cancel_calendar_event", {
+                "event_id": found_event_id(messages), "client_email": email, "is_verified": True})],
+            "Tu cita fue cancelada."]
+    else:
+        action = f"Soy {name}. ¿Cuándo es mi próxima cita?"
+        script[action] = [[("search_calendar_event", {"client_email": email})], "Esta es tu próxima cita."]
+    session.turns.append(("action", action))
+    return session
+
+
+def build_environment(args, directory):
+    """Calendar, Gmail, espejo, índice de disponibilidad, outbox y almacén de códigos falsos o locales."""
+    calendar = FakeCalendarService(latency=args.api_latency)
+    gmail = FakeGmailService(latency=args.gmail_latency)
+    mirror = CalendarMirror(lambda: calendar)
+    availability = FreeBusyIndex(lambda: calendar)
+    outbox = EmailOutbox(GmailBatchSender(lambda: gmail), path=os.path.join(directory, 'outbox.db'))
+
+    graph_tools.get_calendar_service = lambda: calendar
+    graph_tools.get_mirror = lambda: mirror
+    graph_tools.get_availability = lambda: availability
+    graph_tools.get_email_outbox = lambda: outbox
+    verification_store._store = MemoryVerificationStore()
+    return calendar, gmail, mirror, outbox
+
+
+def seed(calendar, sessions):
+    """Citas previas de las sesiones que reprograman, cancelan o consultan."""
+    latency, calendar.latency = calendar.latency, 0
+    for session in sessions:
+        if session.existing is not None:
+            event = graph_tools.build_event(session.existing, session.name, session.email, "consulta previa")
+            calendar.events().insert(calendarId='primary', body=event).execute()
+    calendar.latency = latency
+
+
+def inputs(text):
+    return {"messages": [{"role": "user", "content": text}], "remaining_steps": 10}
+
+
+def read_code(gmail, email):
+    inbox = gmail.inbox(email)
+    match = re.search(r"\b(\d{6})\b", inbox[-1]) if inbox else None
+    return match.group(1) if match else None
+
+
+def turn_result(session, kind, elapsed, tools, answer):
+    return {"scenario": session.scenario, "kind": kind, "latency": elapsed, "tools": tools, "ok": bool(answer)}
+
+
+def tool_errors(graph, session):
+    """Resultados de herramientas de la sesión que indican un fallo (error, sin verificar, horario ocupado...)."""
+    config = {"configurable": {"thread_id": session.thread_id}}
+    failures = ("Error", "Se requiere", "No se encontr", "ya está ocupado", "false")
+    return [
+        f"{session.scenario}/{message.name}: {str(message.content)[:80]}"
+        for message in graph.get_state(config).values["messages"]
+        if isinstance(message, ToolMessage) and str(message.content).startswith(failures)
+    ]
+
+
+def run_sync(graph, gmail, sessions, workers):
+    def run(session):
+        results = []
+        config = {"configurable": {"thread_id": session.thread_id, "recursion_limit": 50}}
+        for kind, text in session.turns:
+            if text is None:
+                deadline = time.time() + CODE_TIMEOUT
+                while (text := read_code(gmail, session.email)) is None and time.time() < deadline:
+                    time.sleep(0.02)
+            start = time.perf_counter()
+            tools, answer = [], ""
+            for event, value in stream_response(graph, inputs(text or "000000"), config):
+                if event == "tool_start":
+                    tools.append(value)
+                elif event == "final":
+                    answer = value
+            results.append(turn_result(session, kind, time.perf_counter() - start, tools, answer))
+        return results
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(itertools.chain.from_iterable(pool.map(run, sessions)))
+
+
+async def run_async(graph, gmail, sessions):
+    async def run(session):
+        results = []
+        config = {"configurable": {"thread_id": session.thread_id, "recursion_limit": 50}}
+        for kind, text in session.turns:
+            if text is None:
+                deadline = time.time() + CODE_TIMEOUT
+                while (text := read_code(gmail, session.email)) is None and time.time() < deadline:
+                    await asyncio.sleep(0.02)
+            start = time.perf_counter()
+            tools, answer = [], ""
+            async for event, value in astream_response(graph, inputs(text or "000000"), config):
+                if event == "tool_start":
+                    tools.append(value)
+                elif event == "final":
+                    answer = value
+            results.append(turn_result(session, kind, time.perf_counter() - start, tools, answer))
+        return results
+
+    results = await asyncio.gather(*(run(session) for session in sessions))
+    return list(itertools.chain.from_iterable(results))
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {}
+
+    def at(q):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+
+    return {"p50": at(0.5), "p95": at(0.95), "p99": at(0.99), "max": latencies[-1] * 1000}
+
+
+def summarize(args, turns, errors, elapsed, model, calendar, gmail, peak_traced):
+    by_kind = {}
+    for turn in turns:
+        by_kind.setdefault(f"{turn['scenario']}/{turn['kind']}", []).append(turn['latency'])
+    fast = fast_path_stats.get_stats()
+    return {
+        "date": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "config": {key: getattr(args, key) for key in
+                   ("sessions", "mode", "workers", "llm_latency", "api_latency", "gmail_latency")},
+        "elapsed": elapsed,
+        "turns": len(turns),
+        "failed_turns": sum(1 for turn in turns if not turn['ok']),
+        "tool_errors": errors,
+        "throughput": {"turns_per_s": len(turns) / elapsed, "sessions_per_s": args.sessions / elapsed},
+        "latency_ms": percentiles([turn['latency'] for turn in turns]),
+        "latency_by_turn_ms": {kind: percentiles(values) for kind, values in sorted(by_kind.items())},
+        "tool_calls": dict(Counter(tool for turn in turns for tool in turn['tools']).most_common()),
+        "model_calls": model.calls,
+        "fast_path_turns": fast['fast_path'],
+        "calendar_api_calls": calendar.calls,
+        "gmail_batches": gmail.batches,
+        "emails_sent": len(gmail.sent),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_traced_mb": peak_traced / (1024 * 1024) if peak_traced is not None else None,
+    }
+
+
+def report(result):
+    latency = result["latency_ms"]
+    print(f"{result['turns']} turnos ({result['failed_turns']} fallidos, "
+          f"{len(result['tool_errors'])} herramientas con error) en {result['elapsed']:.1f} s: "
+          f"{result['throughput']['turns_per_s']:.1f} turnos/s, "
+          f"{result['throughput']['sessions_per_s']:.1f} conversaciones/s")
+    print(f"Latencia por turno  p50: {latency['p50']:7.0f} ms  p95: {latency['p95']:7.0f} ms  "
+          f"p99: {latency['p99']:7.0f} ms")
+    for kind, values in result["latency_by_turn_ms"].items():
+        print(f"  {kind:<18} p50: {values['p50']:7.0f} ms  p95: {values['p95']:7.0f} ms  "
+              f"p99: {values['p99']:7.0f} ms")
+    print("Herramientas:", ", ".join(f"{name} {count}" for name, count in result["tool_calls"].items()))
+    print(f"Llamadas al modelo: {result['model_calls']}  turnos sin modelo: {result['fast_path_turns']}  "
+          f"Calendar: {result['calendar_api_calls']}  lotes de Gmail: {result['gmail_batches']} "
+          f"({result['emails_sent']} correos)")
+    memory = f"Memoria máxima (RSS): {result['peak_rss_mb']:.0f} MB"
+    if result["peak_traced_mb"] is not None:
+        memory += f"  asignada por Python: {result['peak_traced_mb']:.1f} MB"
+    print(memory)
+
+
+def compare(result, baseline, tolerance):
+    """Imprime la variación frente a `baseline`; devuelve False si hay una regresión."""
+    checks = [
+        ("p50 (ms)", result["latency_ms"]["p50"], baseline["latency_ms"]["p50"], False),
+        ("p95 (ms)", result["latency_ms"]["p95"], baseline["latency_ms"]["p95"], True),
+        ("p99 (ms)", result["latency_ms"]["p99"], baseline["latency_ms"]["p99"], False),
+        ("turnos/s", result["throughput"]["turns_per_s"], baseline["throughput"]["turns_per_s"], True),
+        ("memoria (MB)", result["peak_rss_mb"], baseline["peak_rss_mb"], False),
+    ]
+    ok = True
+    print(f"\nComparación con la referencia del {baseline['date']}:")
+    for label, current, previous, gate in checks:
+        change = (current - previous) / previous if previous else 0.0
+        # Para el throughput, bajar es empeorar
+        worse = -change if label == "turnos/s" else change
+        regression = gate and worse > tolerance
+        ok = ok and not regression
+        print(f"  {label:<14} {previous:10.1f} -> {current:10.1f}  ({change:+.1%})"
+              f"{'  REGRESIÓN' if regression else ''}")
+    if result["config"] != baseline["config"]:
+        print("  Aviso: la configuración difiere de la de la referencia")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--mode", choices=("async", "sync"), default="async")
+    parser.add_argument("--workers", type=int, default=8, help="hilos en modo sync")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--api-latency", type=float, default=0.1)
+    parser.add_argument("--gmail-latency", type=float, default=0.1)
+    parser.add_argument("--output", help="archivo JSON donde guardar los resultados")
+    parser.add_argument("--compare", help="resultados JSON de referencia")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="medir también la memoria asignada por Python (más lento)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        calendar, gmail, mirror, outbox = build_environment(args, directory)
+        script, slots = {}, future_slots()
+        sessions = [build_session(i, SCENARIOS[i % len(SCENARIOS)], slots, script) for i in range(args.sessions)]
+        seed(calendar, sessions)
+        mirror.sync()
+        mirror.start()
+        outbox.start_worker()
+
+        model = ConversationModel(script=script, latency=args.llm_latency)
+        graph = load_graph(checkpointer=MemorySaver(), llm=model, cache=ResponseCache())
+
+        print(f"{args.sessions} conversaciones ({args.mode}), modelo {args.llm_latency * 1000:.0f} ms, "
+              f"Calendar {args.api_latency * 1000:.0f} ms, Gmail {args.gmail_latency * 1000:.0f} ms")
+        if args.tracemalloc:
+            tracemalloc.start()
+        start = time.perf_counter()
+        if args.mode == "async":
+            turns = asyncio.run(run_async(graph, gmail, sessions))
+        else:
+            turns = run_sync(graph, gmail, sessions, args.workers)
+        elapsed = time.perf_counter() - start
+        peak_traced = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+
+    errors = [error for session in sessions for error in tool_errors(graph, session)]
+    result = summarize(args, turns, errors, elapsed, model, calendar, gmail, peak_traced)
+    report(result)
+    for error in errors[:5]:
+        print(f"  {error}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.output}")
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if not compare(result, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
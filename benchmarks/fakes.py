@@ -0,0 +1,500 @@
+"""
+Dobles en memoria de los servicios externos, para pruebas y benchmarks sin red.
+
+FakeCalendarService imita la interfaz de googleapiclient para Calendar v3
+(events().list/get/insert/patch/update/delete(...), freebusy().query(...) y
+new_batch_http_request(), con execute() o aexecute()) incluyendo paginación,
+sincronización incremental con syncToken y cabeceras If-Match (412 si el ETag
+no coincide). La latencia de cada petición es configurable.
+
+FakeGmailService imita users().messages().send() y new_batch_http_request(),
+y permite simular errores de la API con fail_next().
+
+FakeToolCallingModel es un modelo de chat guionizado: devuelve en orden los
+mensajes que recibe (con o sin tool_calls) y acepta bind_tools como los reales.
+ScriptedAgentModel decide según el último mensaje (pide herramientas tras el
+mensaje del usuario y responde tras sus resultados), así que una misma
+instancia sirve a muchas conversaciones concurrentes.
+
+ConversationModel sigue un guion por mensaje del usuario (varios pasos con
+herramientas y la respuesta), para reproducir conversaciones completas. Los dos
+emiten tokens como un proveedor real cuando el grafo transmite mensajes.
+
+FakeChatCompletionsServer es un servidor HTTP local compatible con
+/v1/chat/completions (con y sin streaming) para probar clientes reales
+(ChatOpenAI) con latencia y errores inyectados.
+"""
+from googleapiclient.errors import HttpError
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langgraph_components.calendar_mirror import parse_event_time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from email import message_from_bytes
+from datetime import datetime
+import itertools
+import asyncio
+import base64
+import threading
+import httplib2
+import copy
+import json
+import time
+
+
+def _http_error(status, message):
+    return HttpError(httplib2.Response({'status': status}), json.dumps({'error': {'message': message}}).encode())
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class FakeRequest:
+    def __init__(self, service, fn):
+        self.service = service
+        self.fn = fn
+        self.headers = {}
+
+    def execute(self, **kwargs):
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        with self.service.lock:
+            self.service.calls += 1
+            return self.fn()
+
+    async def aexecute(self):
+        if self.service.latency:
+            await asyncio.sleep(self.service.latency)
+        with self.service.lock:
+            self.service.calls += 1
+            return self.fn()
+
+
+class FakeEvents:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, calendarId, syncToken=None, pageToken=None, maxResults=250, q=None,
+             timeMin=None, timeMax=None, singleEvents=None, orderBy=None, **kwargs):
+        def run():
+            service = self.service
+            if syncToken is not None:
+                if int(syncToken) < service.oldest_sync_version:
+                    raise _http_error(410, 'Sync token is no longer valid')
+                ids = [event_id for version, event_id in service.changes if version > int(syncToken)]
+                items = [copy.deepcopy(service.all_events[event_id]) for event_id in dict.fromkeys(ids)]
+            else:
+                items = [copy.deepcopy(e) for e in service.all_events.values() if e.get('status') != 'cancelled']
+                if q:
+                    terms = q.lower().split()
+                    items = [e for e in items if all(t in json.dumps(e, ensure_ascii=False).lower() for t in terms)]
+                if timeMin:
+                    items = [e for e in items if e['start'].get('dateTime', '') >= timeMin[:19]]
+                if timeMax:
+                    items = [e for e in items if e['start'].get('dateTime', '') < timeMax[:19]]
+                if orderBy == 'startTime':
+                    items.sort(key=lambda e: e['start'].get('dateTime', e['start'].get('date', '')))
+
+            offset = int(pageToken or 0)
+            page = items[offset:offset + maxResults]
+            result = {'items': page}
+            if offset + maxResults < len(items):
+                result['nextPageToken'] = str(offset + maxResults)
+            else:
+                result['nextSyncToken'] = str(service.version)
+            return result
+        return FakeRequest(self.service, run)
+
+    def get(self, calendarId, eventId, **kwargs):
+        def run():
+            event = self.service.all_events.get(eventId)
+            if event is None or event.get('status') == 'cancelled':
+                raise _http_error(404, 'Not Found')
+            return copy.deepcopy(event)
+        return FakeRequest(self.service, run)
+
+    def insert(self, calendarId, body, **kwargs):
+        def run():
+            event = copy.deepcopy(body)
+            event.setdefault('id', f"evt{next(self.service.ids)}")
+            event['status'] = 'confirmed'
+            event['htmlLink'] = f"https://calendar.google.com/event?eid={event['id']}"
+            return copy.deepcopy(self.service.save(event))
+        return FakeRequest(self.service, run)
+
+    def _current(self, request, eventId):
+        """Evento vigente; respeta If-Match como la API (412 si el ETag no coincide)."""
+        event = self.service.all_events.get(eventId)
+        if event is None or event.get('status') == 'cancelled':
+            raise _http_error(404, 'Not Found')
+        expected = request.headers.get('If-Match')
+        if expected and expected != event['etag']:
+            raise _http_error(412, 'Precondition Failed')
+        return event
+
+    def patch(self, calendarId, eventId, body, **kwargs):
+        request = FakeRequest(self.service, None)
+
+        def run():
+            event = copy.deepcopy(self._current(request, eventId))
+            event.update(copy.deepcopy(body))
+            return copy.deepcopy(self.service.save(event))
+        request.fn = run
+        return request
+
+    def update(self, calendarId, eventId, body, **kwargs):
+        def run():
+            if eventId not in self.service.all_events:
+                raise _http_error(404, 'Not Found')
+            event = copy.deepcopy(body)
+            event['id'] = eventId
+            return copy.deepcopy(self.service.save(event))
+        return FakeRequest(self.service, run)
+
+    def delete(self, calendarId, eventId, **kwargs):
+        request = FakeRequest(self.service, None)
+
+        def run():
+            event = self.service.all_events.get(eventId)
+            if event is None or event.get('status') == 'cancelled':
+                raise _http_error(410, 'Resource has been deleted')
+            self._current(request, eventId)
+            self.service.save({'id': eventId, 'status': 'cancelled'})
+            return ''
+        request.fn = run
+        return request
+
+
+class FakeFreeBusy:
+    def __init__(self, service):
+        self.service = service
+
+    def query(self, body):
+        def run():
+            time_min = _parse_time(body['timeMin'])
+            time_max = _parse_time(body['timeMax'])
+            busy = []
+            for event in self.service.all_events.values():
+                if event.get('status') == 'cancelled':
+                    continue
+                start, end = parse_event_time(event, 'start'), parse_event_time(event, 'end')
+                if start < time_max and end > time_min:
+                    busy.append({'start': start.isoformat(), 'end': end.isoformat()})
+            busy.sort(key=lambda b: b['start'])
+            return {'calendars': {item['id']: {'busy': busy} for item in body['items']}}
+        return FakeRequest(self.service, run)
+
+
+class FakeCalendarService:
+    """Calendario falso en memoria con el mismo estilo de llamadas que googleapiclient."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.RLock()
+        self.calls = 0
+        self.batches = 0
+        self.version = 0
+        self.oldest_sync_version = 0
+        self.changes = []
+        self.all_events = {}
+        self.ids = itertools.count(1)
+
+    def save(self, event):
+        self.version += 1
+        event['etag'] = f'"{self.version}"'
+        event['updated'] = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+        self.all_events[event['id']] = event
+        self.changes.append((self.version, event['id']))
+        return event
+
+    def expire_sync_tokens(self):
+        """Invalida los syncToken emitidos hasta ahora (la API responde 410)."""
+        self.oldest_sync_version = self.version + 1
+
+    def events(self):
+        return FakeEvents(self)
+
+    def freebusy(self):
+        return FakeFreeBusy(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchRequest(self, callback)
+
+
+class FakeGmailMessages:
+    def __init__(self, service):
+        self.service = service
+
+    def send(self, userId, body):
+        def run():
+            if self.service.failures:
+                raise _http_error(self.service.failures.pop(0), 'Simulated Gmail error')
+            self.service.sent.append(copy.deepcopy(body))
+            return {'id': f"msg{len(self.service.sent)}"}
+        return FakeRequest(self.service, run)
+
+
+class FakeGmailUsers:
+    def __init__(self, service):
+        self.service = service
+
+    def messages(self):
+        return FakeGmailMessages(self.service)
+
+
+class FakeBatchRequest:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id or str(len(self.requests)), request, callback or self.callback))
+
+    def execute(self):
+        # Una sola petición HTTP para todo el lote
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        with self.service.lock:
+            self.service.calls += 1
+            self.service.batches += 1
+        for request_id, request, callback in self.requests:
+            try:
+                response, exception = request.fn(), None
+            except Exception as e:
+                response, exception = None, e
+            callback(request_id, response, exception)
+
+
+class FakeGmailService:
+    """Gmail falso: guarda los mensajes enviados en `sent`."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.RLock()
+        self.calls = 0
+        self.batches = 0
+        self.sent = []
+        self.failures = []
+
+    def fail_next(self, *statuses):
+        """Las próximas llamadas a send() fallan con estos códigos HTTP, en orden."""
+        self.failures.extend(statuses)
+
+    def users(self):
+        return FakeGmailUsers(self)
+
+    def inbox(self, recipient):
+        """Texto de los correos enviados a `recipient`, del más antiguo al más reciente."""
+        texts = []
+        with self.lock:
+            sent = list(self.sent)
+        for body in sent:
+            message = message_from_bytes(base64.urlsafe_b64decode(body['raw']))
+            if message['to'] == recipient:
+                texts.append(message.get_payload(decode=True).decode())
+        return texts
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchRequest(self, callback)
+
+
+class FakeToolCallingModel(FakeMessagesListChatModel):
+    """Modelo de chat que responde con los mensajes de `responses`, en orden."""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Base de los modelos guionizados: la subclase decide el mensaje en _message().
+    `latency` simula el tiempo hasta la respuesta (asyncio.sleep en la ruta async).
+    Con streaming (stream_mode="messages") el texto se emite palabra a palabra,
+    `token_latency` segundos cada una, y las tool_calls en un solo fragmento.
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    # Llamadas recibidas (para comprobar cuándo se evita el modelo)
+    calls: int = 0
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _message(self, messages):
+        raise NotImplementedError
+
+    def _respond(self, messages):
+        self.calls += 1
+        return self._message(messages)
+
+    def _chunks(self, message):
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                for i, c in enumerate(message.tool_calls)
+            ]))
+            return
+        for i, word in enumerate(str(message.content).split(" ")):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else f" {word}"))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        for chunk in self._chunks(self._respond(messages)):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for chunk in self._chunks(self._respond(messages)):
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield chunk
+
+
+class ScriptedAgentModel(ScriptedChatModel):
+    """
+    Modelo de chat falso para un turno típico: tras el mensaje del usuario pide
+    `tool_calls` (lista de (nombre, args)) y, con los resultados, responde `answer`.
+    `max_tokens` recorta la respuesta a ese número de palabras.
+    """
+
+    tool_calls: list = []
+    answer: str = "Listo."
+    max_tokens: int | None = None
+
+    def _message(self, messages):
+        if isinstance(messages[-1], ToolMessage) or not self.tool_calls:
+            return AIMessage(content=" ".join(self.answer.split(" ")[:self.max_tokens]))
+        return AIMessage(content="", tool_calls=[
+            {"name": name, "args": args, "id": f"call-{next(_call_ids)}"} for name, args in self.tool_calls
+        ])
+
+    @property
+    def _llm_type(self):
+        return "scripted-agent"
+
+
+class ConversationModel(ScriptedChatModel):
+    """
+    Modelo de chat guionizado por turno: `script` asocia el texto de cada mensaje
+    del usuario a la lista de pasos del agente en ese turno. Un paso es una lista
+    de (nombre, args), una función que recibe los mensajes y devuelve esa lista
+    (para usar resultados de herramientas anteriores) o el texto de la respuesta.
+
+    El paso se elige contando las llamadas a herramientas desde el último mensaje
+    del usuario, así que una instancia sirve a muchas conversaciones concurrentes.
+    """
+
+    script: dict = {}
+    default_answer: str = "¿En qué más puedo ayudarte?"
+
+    def _message(self, messages):
+        last_user = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+        steps = self.script.get(str(messages[last_user].content), [self.default_answer])
+        done = sum(1 for m in messages[last_user:] if isinstance(m, AIMessage) and m.tool_calls)
+        step = steps[min(done, len(steps) - 1)]
+        if callable(step):
+            step = step(messages)
+        if isinstance(step, str):
+            return AIMessage(content=step)
+        return AIMessage(content="", tool_calls=[
+            {"name": name, "args": args, "id": f"call-{next(_call_ids)}"} for name, args in step
+        ])
+
+    @property
+    def _llm_type(self):
+        return "conversation-script"
+
+_call_ids = itertools.count(1)
+
+
+class FakeChatCompletionsServer:
+    """
+    Proveedor de chat falso en 127.0.0.1: responde `answer` tras `latency`
+    segundos; fail_next(503, ...) hace que las siguientes peticiones devuelvan
+    esos códigos. base_url sirve directamente para ChatOpenAI(base_url=...).
+    """
+
+    def __init__(self, answer="Hola, soy el proveedor falso.", latency=0.0):
+        self.answer = answer
+        self.latency = latency
+        self.requests = 0
+        self._failures = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                with server._lock:
+                    server.requests += 1
+                    status = server._failures.pop(0) if server._failures else None
+                    latency = server.latency
+                time.sleep(latency)
+                if status is not None:
+                    payload = json.dumps({'error': {'message': f'Error simulado {status}', 'type': 'server_error'}})
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload.encode())
+                    return
+                completion = {'id': f'chatcmpl-{next(_call_ids)}', 'created': int(time.time()),
+                              'model': body.get('model', 'fake')}
+                if body.get('stream'):
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/event-stream')
+                    self.end_headers()
+                    for word in server.answer.split(' '):
+                        chunk = dict(completion, object='chat.completion.chunk', choices=[
+                            {'index': 0, 'delta': {'role': 'assistant', 'content': word + ' '}, 'finish_reason': None}])
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    chunk = dict(completion, object='chat.completion.chunk',
+                                 choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode())
+                    return
+                payload = json.dumps(dict(completion, object='chat.completion', choices=[
+                    {'index': 0, 'message': {'role': 'assistant', 'content': server.answer}, 'finish_reason': 'stop'}],
+                    usage={'prompt_tokens': 10, 'completion_tokens': 10, 'total_tokens': 20}))
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload.encode())
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def fail_next(self, *statuses):
+        with self._lock:
+            self._failures.extend(statuses)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,94 @@
+"""
+Mide el tiempo de un turno de load_graph() que necesita varias herramientas
+independientes, ejecutadas:
+
+- en secuencia: el modelo pide una herramienta por paso (cada una espera a la
+  anterior, como haría un agente que no agrupa llamadas);
+- en paralelo: el modelo pide todas en un mismo paso y stream_response() las
+  ejecuta a la vez con max_concurrency=MAX_PARALLEL_TOOLS, respetando los
+  límites por herramienta de concurrency.py.
+
+Usa un modelo guionizado y un Calendar falso con latencia por petición
+(inyectado en el registro de clientes de Google), sin red ni credenciales. El
+espejo local y la caché de freebusy se desactivan para que cada llamada pague
+la latencia de Calendar, como en el primer turno tras arrancar.
+
+Uso:
+    python benchmarks/parallel_tools.py [--latency 0.2] [--searches 4] [--runs 5]
+"""
+import argparse
+import statistics
+import time
+import uuid
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+from langgraph.checkpoint.memory import MemorySaver
+from benchmarks.fakes import ConversationModel, FakeCalendarService
+from langgraph_components import graph_tools
+from langgraph_components.availability import FreeBusyIndex
+from langgraph_components.calendar_mirror import CalendarMirror
+from langgraph_components.concurrency import MAX_PARALLEL_TOOLS, get_concurrency_stats
+from langgraph_components.google_services import service_registry
+from langgraph_components.graph import load_graph, stream_response
+from langgraph_components.llm import ResponseCache
+
+QUESTION = "Necesito revisar mi agenda de los próximos días y los horarios libres"
+
+
+def tool_calls(searches):
+    """get_current_datetime, find_available_slots y `searches` búsquedas por día."""
+    today = datetime.now()
+    calls = [("get_current_datetime", {}), ("find_available_slots", {"count": 3})]
+    for i in range(searches):
+        day = (today + timedelta(days=i)).strftime("%d/%m/%Y")
+        calls.append(("search_calendar_event", {"time_min": day, "time_max": day}))
+    return calls
+
+
+def run_turn(graph):
+    config = {"configurable": {"thread_id": uuid.uuid4().hex}}
+    inputs = {"messages": [("user", QUESTION)], "remaining_steps": 20}
+    start = time.perf_counter()
+    tools = sum(1 for kind, _ in stream_response(graph, inputs, config) if kind == "tool_end")
+    return (time.perf_counter() - start) * 1000, tools
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.2, help="segundos por petición a Calendar")
+    parser.add_argument("--searches", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    service = FakeCalendarService(latency=args.latency)
+    # Todas las herramientas obtienen el cliente de Calendar del registro compartido
+    service_registry.get = lambda api, version: service
+    # Espejo nunca sincronizado y freebusy sin vigencia: cada llamada va a Calendar
+    graph_tools.get_mirror = lambda: CalendarMirror(lambda: service)
+    graph_tools.get_availability = lambda: FreeBusyIndex(lambda: service, ttl=0)
+
+    calls = tool_calls(args.searches)
+    answer = "Estos son los horarios."
+    variants = [
+        ("En secuencia (1 por paso)", [[call] for call in calls] + [answer]),
+        (f"En paralelo (max_concurrency={MAX_PARALLEL_TOOLS})", [calls, answer]),
+    ]
+    print(f"{len(calls)} herramientas por turno, {args.latency * 1000:.0f} ms por petición a Calendar")
+    for label, steps in variants:
+        model = ConversationModel(script={QUESTION: steps})
+        graph = load_graph(checkpointer=MemorySaver(), llm=model, cache=ResponseCache(max_entries=0))
+        results = [run_turn(graph) for _ in range(args.runs)]
+        timings = [ms for ms, _ in results]
+        assert all(tools == len(calls) for _, tools in results), "el turno no ejecutó todas las herramientas"
+        print(f"{label:<32} mediana: {statistics.median(timings):8.1f} ms  mín: {min(timings):8.1f} ms")
+    for name, stats in get_concurrency_stats().items():
+        if stats['calls']:
+            print(f"{name:<32} límite: {stats['limit']}  máx. simultáneas: {stats['peak']}  esperas: {stats['waits']}")
+
+
+if __name__ == "__main__":
+    main()
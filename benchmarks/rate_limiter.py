@@ -0,0 +1,73 @@
+"""
+Coste por comprobación del limitador de la verificación con muchas claves
+activas: si es O(1), el tiempo por operación no crece con el número de claves.
+
+Cada ronda registra primero --keys claves distintas y después mide
+acquire() (envío de códigos) y attempt() (comprobación del bloqueo y registro
+del intento de verificación) sobre claves al azar.
+
+Uso:
+    python benchmarks/rate_limiter.py [--keys 1000 10000 100000] [--ops 100000] [--sqlite]
+"""
+import argparse
+import tempfile
+import random
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph_components.rate_limiter import MemoryRateLimiter, SQLiteRateLimiter
+
+LIMIT = 3
+WINDOW = 900
+LOCKOUT = 900
+
+
+def per_op(func, keys, ops):
+    picks = [random.choice(keys) for _ in range(ops)]
+    start = time.perf_counter()
+    for key in picks:
+        func(key)
+    return (time.perf_counter() - start) / ops * 1e6
+
+
+def bench(limiter, keys_count, ops):
+    keys = [f"send:email:cliente{i}@example.com" for i in range(keys_count)]
+    for key in keys:
+        limiter.acquire(key, LIMIT, WINDOW)
+    return {
+        "acquire": per_op(lambda key: limiter.acquire(key, LIMIT, WINDOW), keys, ops),
+        "attempt": per_op(lambda key: limiter.attempt(key, LIMIT, WINDOW, LOCKOUT), keys, ops),
+        "keys": limiter.count(),
+        "rejected": limiter.get_stats()['rejected'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--ops", type=int, default=100000)
+    parser.add_argument("--sqlite", action="store_true", help="mide también el backend SQLite (más lento)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for keys_count in args.keys:
+            limiters = [("memory", MemoryRateLimiter())]
+            if args.sqlite:
+                limiters.append(("sqlite", SQLiteRateLimiter(os.path.join(tmp, f"limits-{keys_count}.db"))))
+            for name, limiter in limiters:
+                # SQLite hace una transacción por operación: se miden menos
+                ops = args.ops if name == "memory" else min(args.ops, 5000)
+                result = bench(limiter, keys_count, ops)
+                print(
+                    f"{name:<7} {keys_count:>8} claves  "
+                    f"acquire: {result['acquire']:>7.2f} µs  "
+                    f"attempt: {result['attempt']:>7.2f} µs  "
+                    f"rechazos: {result['rejected']}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Mide el arranque en frío: tiempo de importación, construcción del grafo y
+primer render de app.py (con streamlit.testing).
+
+Uso:
+    python benchmarks/startup.py
+"""
+import subprocess
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cada medición corre en un intérprete nuevo para que sea realmente en frío
+IMPORT_SNIPPET = """
+import sys, time
+t = time.perf_counter()
+import langgraph_components.graph
+print(f"{time.perf_counter() - t:.3f}", 'googleapiclient' in sys.modules)
+"""
+
+LOAD_GRAPH_SNIPPET = """
+import sys, time
+t = time.perf_counter()
+from langgraph_components.graph import load_graph
+load_graph()
+print(f"{time.perf_counter() - t:.3f}", 'googleapiclient' in sys.modules)
+"""
+
+FIRST_RENDER_SNIPPET = """
+import sys, time
+t = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=60)
+at.run()
+print(f"{time.perf_counter() - t:.3f}", 'googleapiclient' in sys.modules)
+"""
+
+
+def run(snippet):
+    env = dict(os.environ)
+    # ChatOpenAI exige una API key al construirse, aunque aquí no se llama al modelo
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    result = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", snippet],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    seconds, google_loaded = result.stdout.strip().splitlines()[-1].split()
+    return float(seconds), google_loaded == "True"
+
+
+def main():
+    for name, snippet in [
+        ("import langgraph_components.graph", IMPORT_SNIPPET),
+        ("load_graph()", LOAD_GRAPH_SNIPPET),
+        ("primer render de app.py", FIRST_RENDER_SNIPPET),
+    ]:
+        seconds, google_loaded = run(snippet)
+        print(f"{name:<36} {seconds:7.3f}s  googleapiclient cargado: {google_loaded}")
+
+
+if __name__ == "__main__":
+    main()
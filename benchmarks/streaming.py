@@ -0,0 +1,82 @@
+"""
+Mide el tiempo hasta el primer token frente al tiempo hasta la respuesta completa.
+
+Cada prompt va en una conversación nueva contra load_graph() con un modelo
+guionizado que emite la respuesta palabra a palabra (ver fakes.ConversationModel)
+y un Calendar falso con latencia, así que no necesita red ni credenciales. Hay
+turnos sin herramientas, con una herramienta y uno resuelto por el atajo del
+router (sin modelo).
+
+Uso:
+    python benchmarks/streaming.py [--llm-latency 0.5] [--token-latency 0.02] [--api-latency 0.1]
+"""
+import argparse
+import statistics
+import time
+import uuid
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.checkpoint.memory import MemorySaver
+from benchmarks.fakes import ConversationModel, FakeCalendarService
+from langgraph_components import graph_tools
+from langgraph_components.availability import FreeBusyIndex
+from langgraph_components.calendar_mirror import CalendarMirror
+from langgraph_components.graph import load_graph, stream_response
+from langgraph_components.llm import ResponseCache
+
+SCRIPT = {
+    "Hola": ["¡Hola! Soy Temis, la asistente virtual del Dr. Saul. ¿En qué puedo ayudarte hoy?"],
+    "¿Cuál es el horario de atención del Dr. Saul?": [
+        "El Dr. Saul atiende de lunes a viernes entre las 9:00 y las 17:00, en citas de una hora."],
+    "¿Qué documentos debo llevar a la consulta?": [
+        "Lleva tu documento de identidad, los contratos o escritos relacionados con tu caso "
+        "y cualquier comunicación que hayas recibido de la otra parte."],
+    "¿Qué horarios hay libres esta semana?": [
+        [("find_available_slots", {"count": 3})],
+        "Estos son los próximos horarios libres; dime cuál prefieres y te pido tu correo para agendarlo."],
+    "¿Qué día es hoy?": [],  # Atajo del router: no llega al modelo
+}
+
+
+def measure(graph, prompt):
+    config = {"configurable": {"thread_id": f"bench-{uuid.uuid4().hex}", "recursion_limit": 50}}
+    inputs = {"messages": [{"role": "user", "content": prompt}], "remaining_steps": 10}
+    start = time.perf_counter()
+    first_token = None
+    for kind, _ in stream_response(graph, inputs, config):
+        if kind == "token" and first_token is None:
+            first_token = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return first_token if first_token is not None else total, total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="segundos hasta el primer token del modelo")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="segundos entre palabras")
+    parser.add_argument("--api-latency", type=float, default=0.1, help="segundos por petición a Calendar")
+    args = parser.parse_args()
+
+    # Espejo sin sincronizar e índice con TTL 0: cada herramienta va a la API (falsa)
+    service = FakeCalendarService(latency=args.api_latency)
+    graph_tools.get_calendar_service = lambda: service
+    graph_tools.get_mirror = lambda: CalendarMirror(lambda: service)
+    graph_tools.get_availability = lambda: FreeBusyIndex(lambda: service, ttl=0)
+    model = ConversationModel(script=SCRIPT, latency=args.llm_latency, token_latency=args.token_latency)
+    graph = load_graph(checkpointer=MemorySaver(), llm=model, cache=ResponseCache(max_entries=0))
+
+    ttft, totals = [], []
+    for prompt in SCRIPT:
+        first_token, total = measure(graph, prompt)
+        ttft.append(first_token)
+        totals.append(total)
+        print(f"{prompt[:45]:<47} primer token: {first_token:6.2f}s  completa: {total:6.2f}s")
+    print(f"{'mediana':<47} primer token: {statistics.median(ttft):6.2f}s  "
+          f"completa: {statistics.median(totals):6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
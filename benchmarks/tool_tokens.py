@@ -0,0 +1,176 @@
+"""
+Tokens del prompt por turno con los resultados de herramientas en JSON frente
+al formato compacto (graph_tools.TOOL_RESULT_FORMAT).
+
+Repite las conversaciones guionizadas de benchmarks/conversations.py (sin
+latencias) con cada formato y cuenta los tokens de cada llamada al modelo: el
+resultado de una búsqueda se relee en todos los pasos siguientes del turno.
+Cada cliente tiene además --follow-ups citas de seguimiento ya agendadas, así
+que sus búsquedas devuelven varias citas, como las de un cliente recurrente.
+
+También mide un listado de citas (search_calendar_event sin filtro) con un
+calendario de --events citas: sin presupuesto se ve el efecto del formato y con
+TOOL_RESULT_MAX_CHARS cuántas citas caben en el mismo tamaño.
+
+Los tokens se cuentan con tiktoken (o200k_base, el de gpt-4o) si está
+instalado y si no con la estimación de history.estimate_tokens.
+
+Uso:
+    python benchmarks/tool_tokens.py [--sessions 20] [--follow-ups 5] [--events 30]
+"""
+import argparse
+import itertools
+import asyncio
+import tempfile
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from types import SimpleNamespace
+from langgraph.checkpoint.memory import MemorySaver
+from benchmarks.conversations import (SCENARIOS, build_environment, build_session, future_slots,
+                                      run_async, seed)
+from benchmarks.fakes import ConversationModel
+from langgraph_components import graph_tools
+from langgraph_components.graph import load_graph
+from langgraph_components.history import estimate_tokens
+from langgraph_components.llm import ResponseCache
+
+FORMATS = ('json', 'compact')
+REASON = ("consulta sobre un contrato de arrendamiento comercial con cláusulas de "
+          "renovación automática y penalidades por terminación anticipada")
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding('o200k_base')
+
+    def count_tokens(text):
+        return len(_encoding.encode(text))
+    TOKENIZER = 'tiktoken o200k_base'
+except Exception:
+    count_tokens = estimate_tokens
+    TOKENIZER = 'estimación (~4 caracteres por token)'
+
+
+def prompt_tokens(messages):
+    """(tokens del prompt, de ellos los de resultados de herramientas)."""
+    tokens = tool_tokens = 0
+    for message in messages:
+        content = count_tokens(str(message.content))
+        tokens += content
+        if message.type == "tool":
+            tool_tokens += content
+        for tool_call in getattr(message, 'tool_calls', None) or []:
+            tokens += count_tokens(json.dumps(tool_call['args'], ensure_ascii=False))
+    return tokens, tool_tokens
+
+
+class MeasuredModel(ConversationModel):
+    """ConversationModel que anota (último mensaje del usuario, tokens del prompt, de herramientas) de cada llamada."""
+
+    prompts: list = []
+
+    def _respond(self, messages):
+        last_user = [m for m in messages if m.type == "human"][-1]
+        self.prompts.append((str(last_user.content), *prompt_tokens(messages)))
+        return super()._respond(messages)
+
+
+def seed_follow_ups(calendar, sessions, count):
+    """`count` citas de seguimiento por cliente, meses después de su cita actual (que sigue siendo la primera)."""
+    slots = itertools.islice(future_slots(), 2000, None)
+    for session in sessions:
+        for _ in range(count):
+            event = graph_tools.build_event(next(slots), session.name, session.email, REASON)
+            calendar.events().insert(calendarId='primary', body=event).execute()
+
+
+def run_conversations(style, sessions_count, follow_ups):
+    graph_tools.TOOL_RESULT_FORMAT = style
+    args = SimpleNamespace(api_latency=0, gmail_latency=0)
+    with tempfile.TemporaryDirectory() as directory:
+        calendar, gmail, mirror, outbox = build_environment(args, directory)
+        script, slots = {}, future_slots()
+        sessions = [build_session(i, SCENARIOS[i % len(SCENARIOS)], slots, script)
+                    for i in range(sessions_count)]
+        seed(calendar, sessions)
+        seed_follow_ups(calendar, sessions, follow_ups)
+        mirror.sync()
+        mirror.start()
+        outbox.start_worker()
+        model = MeasuredModel(script=script)
+        graph = load_graph(checkpointer=MemorySaver(), llm=model, cache=ResponseCache(max_entries=0))
+        turns = asyncio.run(run_async(graph, gmail, sessions))
+
+    # Tokens por turno que llega al modelo, agrupados por el mensaje del usuario
+    kinds = {text: f"{session.scenario}/{kind}" for session in sessions for kind, text in session.turns if text}
+    by_kind = {}
+    for text, tokens, _ in model.prompts:
+        by_kind.setdefault(kinds.get(text, "otros"), []).append(tokens)
+    model_turns = sum(1 for turn in turns if turn['ok']) or 1
+    return {
+        "model_calls": len(model.prompts),
+        "prompt_tokens": sum(tokens for _, tokens, _ in model.prompts),
+        "tool_tokens": sum(tool_tokens for _, _, tool_tokens in model.prompts),
+        "turns": model_turns,
+        "by_kind": {kind: sum(values) for kind, values in sorted(by_kind.items())},
+        "failed_turns": sum(1 for turn in turns if not turn['ok']),
+    }
+
+
+def listing_tokens(style, events, max_chars):
+    """(tokens, caracteres, citas visibles) de search_calendar_event sin filtro con `events` citas."""
+    graph_tools.TOOL_RESULT_FORMAT = style
+    graph_tools.TOOL_RESULT_MAX_CHARS = max_chars
+    args = SimpleNamespace(api_latency=0, gmail_latency=0)
+    with tempfile.TemporaryDirectory() as directory:
+        calendar, *_ = build_environment(args, directory)
+        slots = future_slots()
+        for i in range(events):
+            event = graph_tools.build_event(next(slots), f"Cliente {i}", f"cliente{i}@example.com", REASON)
+            calendar.events().insert(calendarId='primary', body=event).execute()
+        result = graph_tools.search_calendar_event.invoke({})
+    shown = result.count('"id"') if style == 'json' else sum(1 for line in result.split("\n")[1:] if "|" in line)
+    return count_tokens(result), len(result), shown
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--follow-ups", type=int, default=5, help="citas de seguimiento por cliente")
+    parser.add_argument("--events", type=int, default=30, help="citas del calendario para el listado")
+    args = parser.parse_args()
+    original = graph_tools.TOOL_RESULT_FORMAT, graph_tools.TOOL_RESULT_MAX_CHARS
+
+    print(f"Tokens contados con {TOKENIZER}\n")
+    print(f"Listado de citas (search_calendar_event, {args.events} citas en el calendario):")
+    # Sin límite, 'json' es el resultado de antes; con presupuesto, las dos caben en el mismo tamaño
+    listings = {f"{style} sin límite": listing_tokens(style, args.events, sys.maxsize) for style in FORMATS}
+    listings.update({f"{style} con límite": listing_tokens(style, args.events, original[1]) for style in FORMATS})
+    graph_tools.TOOL_RESULT_MAX_CHARS = original[1]
+    for label, (tokens, chars, shown) in listings.items():
+        print(f"  {label:<20} {tokens:6d} tokens  {chars:6d} caracteres  {shown:3d} citas "
+              f"({tokens / max(shown, 1):.0f} tokens por cita)")
+
+    print(f"\n{args.sessions} conversaciones guionizadas, {args.follow_ups} citas de seguimiento por cliente:")
+    results = {style: run_conversations(style, args.sessions, args.follow_ups) for style in FORMATS}
+    graph_tools.TOOL_RESULT_FORMAT = original[0]
+    for style, result in results.items():
+        print(f"  {style:<8} {result['prompt_tokens']:8d} tokens de prompt en {result['model_calls']} llamadas "
+              f"({result['prompt_tokens'] / result['turns']:.0f} por turno, "
+              f"{result['prompt_tokens'] / max(result['model_calls'], 1):.0f} por llamada), "
+              f"{result['tool_tokens']} de resultados de herramientas; {result['failed_turns']} turnos fallidos")
+
+    print("\nTokens de prompt por tipo de turno (json -> compact):")
+    before, after = results['json']['by_kind'], results['compact']['by_kind']
+    for kind in sorted(set(before) | set(after)):
+        old, new = before.get(kind, 0), after.get(kind, 0)
+        change = (new - old) / old if old else 0.0
+        print(f"  {kind:<18} {old:8d} -> {new:8d}  ({change:+.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Mide el rendimiento de emisión y verificación de códigos con 10k+ códigos pendientes.
+
+Uso:
+    python benchmarks/verification_store.py [--pending 10000]
+"""
+import argparse
+import tempfile
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph_components.verification_store import (
+    MemoryVerificationStore,
+    SQLiteVerificationStore,
+)
+
+
+def bench(store, pending):
+    emails = [f"cliente{i}@example.com" for i in range(pending)]
+
+    start = time.perf_counter()
+    for i, email in enumerate(emails):
+        store.save(email, f"{i % 1000000:06d}")
+    issue_elapsed = time.perf_counter() - start
+
+    # La mitad de los intentos usa un código incorrecto
+    start = time.perf_counter()
+    accepted = 0
+    for i, email in enumerate(emails):
+        code = f"{i % 1000000:06d}" if i % 2 == 0 else "000000x"
+        accepted += store.consume(email, code)
+    verify_elapsed = time.perf_counter() - start
+
+    return {
+        "issue_ops": pending / issue_elapsed,
+        "verify_ops": pending / verify_elapsed,
+        "accepted": accepted,
+        "remaining": store.count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pending", type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = [
+            ("memory", MemoryVerificationStore()),
+            ("sqlite", SQLiteVerificationStore(os.path.join(tmp, "codes.db"))),
+        ]
+        for name, store in stores:
+            result = bench(store, args.pending)
+            print(
+                f"{name:<7} emitir: {result['issue_ops']:>10.0f} ops/s  "
+                f"verificar: {result['verify_ops']:>10.0f} ops/s  "
+                f"aceptados: {result['accepted']}  pendientes: {result['remaining']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+from .google_services import aexecute
+from . import metrics
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from collections import OrderedDict, deque
+import threading
+import asyncio
+import bisect
+import time
+import os
+
+BOGOTA_TZ = ZoneInfo('America/Bogota')
+
+# Horario de atención: citas de una hora que empiezan entre las 9:00 y las 16:00, de lunes a viernes
+OPENING_HOUR = 9
+CLOSING_HOUR = 17
+SLOT_DURATION = timedelta(hours=1)
+
+# Días que cubre cada consulta a freebusy y vigencia de su resultado (segundos)
+FREEBUSY_WINDOW_DAYS = int(os.getenv('FREEBUSY_WINDOW_DAYS', '14'))
+FREEBUSY_TTL = float(os.getenv('FREEBUSY_TTL', '300'))
+# Ventanas consultadas que se conservan a la vez (las fechas lejanas no expulsan las próximas)
+FREEBUSY_MAX_WINDOWS = int(os.getenv('FREEBUSY_MAX_WINDOWS', '4'))
+# Cambios propios recordados para aplicarlos a las consultas asíncronas en curso
+CHANGE_LOG_SIZE = 256
+# Hasta dónde se buscan huecos libres como máximo
+MAX_LOOKAHEAD_DAYS = 60
+
+
+def _parse(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class FreeBusyIndex:
+    """
+    Intervalos ocupados del calendario, obtenidos con una sola llamada a
+    freebusy.query por ventana de FREEBUSY_WINDOW_DAYS días y cacheados durante
+    FREEBUSY_TTL segundos. Se guardan hasta FREEBUSY_MAX_WINDOWS ventanas (LRU),
+    para que una consulta de una fecha lejana no expulse la de los próximos días.
+    Nuestras propias altas, cambios y cancelaciones actualizan el índice al
+    momento, también las que ocurren mientras una consulta asíncrona está en
+    curso. Los métodos a* son las variantes asíncronas.
+    """
+
+    def __init__(self, service_factory, calendar_id='primary',
+                 window_days=FREEBUSY_WINDOW_DAYS, ttl=FREEBUSY_TTL, max_windows=FREEBUSY_MAX_WINDOWS):
+        self.service_factory = service_factory
+        self.calendar_id = calendar_id
+        self.window = timedelta(days=window_days)
+        self.ttl = ttl
+        self.max_windows = max_windows
+        self._lock = threading.RLock()
+        # (inicio, fin) -> (consultada en, intervalos ocupados ordenados)
+        self._windows = OrderedDict()
+        # Cambios propios recientes (número, alta?, inicio, fin) para aplicarlos a las consultas en curso
+        self._changes = deque(maxlen=CHANGE_LOG_SIZE)
+        self._seq = 0
+        self.stats = {'queries': 0, 'hits': 0}
+
+    def _cached(self, start, end):
+        """Intervalos de una ventana vigente que cubre [start, end), o None."""
+        now = time.time()
+        for key, (fetched_at, busy) in list(self._windows.items()):
+            if now - fetched_at > self.ttl:
+                del self._windows[key]
+            elif key[0] <= start and end <= key[1]:
+                self._windows.move_to_end(key)
+                return busy
+        return None
+
+    def _query(self, start, end):
+        body = {
+            'timeMin': start.isoformat(),
+            'timeMax': end.isoformat(),
+            'timeZone': 'America/Bogota',
+            'items': [{'id': self.calendar_id}],
+        }
+        return self.service_factory().freebusy().query(body=body)
+
+    def _store(self, result, start, end, since=None):
+        """
+        Guarda el resultado de la consulta de [start, end). `since` es el número
+        del último cambio propio anterior a la consulta: los posteriores se le
+        aplican encima, porque la respuesta de Google puede no incluirlos.
+        """
+        busy = result.get('calendars', {}).get(self.calendar_id, {}).get('busy', [])
+        busy = sorted((_parse(b['start']), _parse(b['end'])) for b in busy)
+        self.stats['queries'] += 1
+        complete = True
+        if since is not None:
+            # Si el registro ya descartó cambios de la consulta, el resultado se usa pero no se cachea
+            complete = not self._changes or self._changes[0][0] <= since + 1
+            for seq, added, change_start, change_end in self._changes:
+                if seq > since and change_start < end and change_end > start:
+                    complete = self._apply(busy, added, change_start, change_end) and complete
+        if complete:
+            self._windows[(start, end)] = (time.time(), busy)
+            self._windows.move_to_end((start, end))
+            while len(self._windows) > self.max_windows:
+                self._windows.popitem(last=False)
+        return busy
+
+    @staticmethod
+    def _apply(busy, added, start, end):
+        """Aplica un alta o una baja propia; False si la baja no se encuentra tal cual."""
+        if added:
+            if (start, end) not in busy:
+                bisect.insort(busy, (start, end))
+            return True
+        try:
+            busy.remove((start, end))
+            return True
+        except ValueError:
+            return False
+
+    @staticmethod
+    def _overlapping(busy, start, end):
+        return [(s, e) for s, e in busy if s < end and e > start]
+
+    def busy_between(self, start, end):
+        """Intervalos ocupados que se solapan con [start, end)."""
+        with self._lock:
+            busy = self._cached(start, end)
+            if busy is not None:
+                self.stats['hits'] += 1
+                return self._overlapping(busy, start, end)
+            since = self._seq
+        # La consulta a Google va sin el cerrojo, para no bloquear las demás búsquedas;
+        # los cambios propios que ocurran mientras tanto se aplican al guardar
+        fetch_end = max(end, start + self.window)
+        result = self._query(start, fetch_end).execute()
+        with self._lock:
+            return self._overlapping(self._store(result, start, fetch_end, since), start, end)
+
+    async def abusy_between(self, start, end):
+        with self._lock:
+            busy = self._cached(start, end)
+            if busy is not None:
+                self.stats['hits'] += 1
+                return self._overlapping(busy, start, end)
+            since = self._seq
+        # La petición se construye en un hilo (service_factory puede refrescar el token)
+        # y se espera sin el cerrojo para no bloquear a otros hilos
+        fetch_end = max(end, start + self.window)
+        request = await asyncio.to_thread(self._query, start, fetch_end)
+        result = await aexecute(request)
+        with self._lock:
+            return self._overlapping(self._store(result, start, fetch_end, since), start, end)
+
+    def is_free(self, start, end):
+        return not self.busy_between(start, end)
+
+    async def ais_free(self, start, end):
+        return not await self.abusy_between(start, end)
+
+    def _record(self, added, start, end):
+        self._seq += 1
+        self._changes.append((self._seq, added, start, end))
+        for key, (_, busy) in list(self._windows.items()):
+            if key[0] < end and start < key[1] and not self._apply(busy, added, start, end):
+                # freebusy fusiona eventos contiguos: si no está tal cual, se descarta esa ventana
+                del self._windows[key]
+
+    def add_busy(self, start, end):
+        with self._lock:
+            self._record(True, start, end)
+
+    def remove_busy(self, start, end):
+        with self._lock:
+            self._record(False, start, end)
+
+    def invalidate(self):
+        with self._lock:
+            self._windows.clear()
+
+    def _first_slot(self, after):
+        now = datetime.now(BOGOTA_TZ)
+        after = max(after or now, now).astimezone(BOGOTA_TZ)
+        # Redondear a la siguiente hora en punto
+        if after.minute or after.second or after.microsecond:
+            after = after.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        return after
+
+    def _free_slots(self, busy, window_start, window_end, count):
+        slots = []
+        day = window_start.replace(hour=0)
+        while day < window_end and len(slots) < count:
+            if day.weekday() < 5:
+                for hour in range(OPENING_HOUR, CLOSING_HOUR):
+                    slot_start = day.replace(hour=hour)
+                    slot_end = slot_start + SLOT_DURATION
+                    if slot_start < window_start or slot_start >= window_end:
+                        continue
+                    if any(s < slot_end and e > slot_start for s, e in busy):
+                        continue
+                    slots.append(slot_start)
+                    if len(slots) >= count:
+                        break
+            day = (day + timedelta(days=1)).replace(hour=0)
+        return slots
+
+    def next_open_slots(self, count=5, after=None):
+        """Próximos `count` huecos de una hora, en días hábiles y horario de atención."""
+        slots = []
+        window_start = self._first_slot(after)
+        limit = window_start + timedelta(days=MAX_LOOKAHEAD_DAYS)
+        while len(slots) < count and window_start < limit:
+            window_end = min(window_start + self.window, limit)
+            busy = self.busy_between(window_start, window_end)
+            slots += self._free_slots(busy, window_start, window_end, count - len(slots))
+            window_start = window_end
+        return slots
+
+    async def anext_open_slots(self, count=5, after=None):
+        slots = []
+        window_start = self._first_slot(after)
+        limit = window_start + timedelta(days=MAX_LOOKAHEAD_DAYS)
+        while len(slots) < count and window_start < limit:
+            window_end = min(window_start + self.window, limit)
+            busy = await self.abusy_between(window_start, window_end)
+            slots += self._free_slots(busy, window_start, window_end, count - len(slots))
+            window_start = window_end
+        return slots
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, windows=len(self._windows),
+                        busy_intervals=sum(len(busy) for _, busy in self._windows.values()))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_freebusy_index(service_factory):
+    """Índice compartido del proceso (se crea en el primer uso)."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = FreeBusyIndex(service_factory)
+    return _index
+
+
+metrics.register_collector(metrics.stats_collector(
+    'freebusy', lambda: _index.get_stats() if _index is not None else None,
+    counters=('queries', 'hits'), gauges=('windows', 'busy_intervals')))
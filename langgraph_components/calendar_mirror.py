@@ -0,0 +1,332 @@
+from . import metrics
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import threading
+import bisect
+import copy
+import time
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Intervalo entre sincronizaciones incrementales (segundos)
+MIRROR_SYNC_INTERVAL = float(os.getenv('CALENDAR_MIRROR_SYNC_INTERVAL', '60'))
+# Antigüedad máxima del espejo para responder búsquedas sin ir a la API (segundos)
+MIRROR_MAX_STALENESS = float(os.getenv('CALENDAR_MIRROR_MAX_STALENESS', '300'))
+# Días hacia atrás que copia la sincronización completa; las búsquedas anteriores van a la API
+MIRROR_PAST_DAYS = float(os.getenv('CALENDAR_MIRROR_PAST_DAYS', '30'))
+
+BOGOTA_TZ = ZoneInfo('America/Bogota')
+
+
+def parse_event_time(event, key='start'):
+    """Inicio (o fin) del evento como datetime con zona horaria; los eventos de día completo, a las 00:00 de Bogotá."""
+    value = event.get(key, {})
+    if 'dateTime' in value:
+        # Python 3.10 no acepta el sufijo 'Z' en fromisoformat
+        parsed = datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=ZoneInfo(value.get('timeZone', 'America/Bogota')))
+        return parsed
+    if 'date' in value:
+        return datetime.fromisoformat(value['date']).replace(tzinfo=BOGOTA_TZ)
+    return None
+
+
+def parse_event_start(event):
+    return parse_event_time(event, 'start')
+
+
+def event_attendee_emails(event):
+    return {att['email'].lower() for att in event.get('attendees', []) if att.get('email')}
+
+
+def _event_text(event):
+    parts = [event.get('summary', ''), event.get('description', ''), event.get('location', '')]
+    for att in event.get('attendees', []):
+        parts.append(att.get('email', ''))
+        parts.append(att.get('displayName', ''))
+    return " ".join(parts).lower()
+
+
+class CalendarMirror:
+    """
+    Copia local del calendario, indexada por id de evento, correo de asistente y
+    hora de inicio, que se mantiene al día con la sincronización incremental de la
+    API (syncToken). Las herramientas leen de aquí y solo van a la API si el espejo
+    no está listo, está desactualizado o no conoce el evento.
+
+    Solo se copian los eventos desde `past_days` días antes de la sincronización
+    completa (None: todo el calendario); las búsquedas sin fecha inicial o que
+    empiezan antes de ese límite no se responden desde el espejo.
+    """
+
+    def __init__(self, service_factory, calendar_id='primary', sync_interval=MIRROR_SYNC_INTERVAL,
+                 max_staleness=MIRROR_MAX_STALENESS, past_days=MIRROR_PAST_DAYS):
+        self.service_factory = service_factory
+        self.calendar_id = calendar_id
+        self.sync_interval = sync_interval
+        self.max_staleness = max_staleness
+        self.past_days = past_days
+        self._lock = threading.RLock()
+        self._events = {}
+        self._by_attendee = {}
+        self._by_start = []
+        self._sync_token = None
+        self._last_sync = None
+        self._horizon = None
+        # Cambios propios hechos mientras una sincronización consulta la API
+        self._pending = None
+        self._syncer = None
+        self.stats = {'hits': 0, 'misses': 0, 'full_syncs': 0, 'incremental_syncs': 0, 'sync_errors': 0}
+
+    # --- Índices ---
+
+    def _index(self, event):
+        self._unindex(event['id'])
+        start = parse_event_start(event)
+        self._events[event['id']] = (event, start)
+        for email in event_attendee_emails(event):
+            self._by_attendee.setdefault(email, set()).add(event['id'])
+        if start is not None:
+            bisect.insort(self._by_start, (start.timestamp(), event['id']))
+
+    def _unindex(self, event_id):
+        entry = self._events.pop(event_id, None)
+        if entry is None:
+            return
+        event, start = entry
+        for email in event_attendee_emails(event):
+            ids = self._by_attendee.get(email)
+            if ids is not None:
+                ids.discard(event_id)
+                if not ids:
+                    del self._by_attendee[email]
+        if start is not None:
+            key = (start.timestamp(), event_id)
+            i = bisect.bisect_left(self._by_start, key)
+            if i < len(self._by_start) and self._by_start[i] == key:
+                del self._by_start[i]
+
+    def _apply(self, event):
+        if event.get('status') == 'cancelled':
+            self._unindex(event['id'])
+        else:
+            self._index(event)
+
+    def upsert(self, event):
+        """Registra un evento creado o modificado por nosotros sin esperar a la próxima sincronización."""
+        with self._lock:
+            self._apply(event)
+            if self._pending is not None:
+                self._pending.append(event)
+
+    def remove(self, event_id):
+        with self._lock:
+            self._unindex(event_id)
+            if self._pending is not None:
+                self._pending.append({'id': event_id, 'status': 'cancelled'})
+
+    def _begin_sync(self):
+        with self._lock:
+            self._pending = []
+
+    def _replay_pending(self):
+        """
+        Vuelve a aplicar los cambios propios hechos durante la consulta, que la
+        respuesta de la API puede no incluir todavía. Las borradas se quitan siempre;
+        las demás, salvo que la API ya traiga una versión más reciente. Llamar con
+        el cerrojo tomado.
+        """
+        for event in self._pending or []:
+            entry = self._events.get(event['id'])
+            if (entry is not None and event.get('status') != 'cancelled'
+                    and entry[0].get('updated', '') > event.get('updated', '')):
+                continue
+            self._apply(event)
+        self._pending = None
+
+    # --- Sincronización ---
+
+    def _list_pages(self, service, **params):
+        page_token = None
+        while True:
+            if page_token:
+                params['pageToken'] = page_token
+            result = service.events().list(calendarId=self.calendar_id, **params).execute()
+            yield result
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return
+
+    def _full_sync(self, service):
+        events = {}
+        sync_token = None
+        params = {'singleEvents': True, 'maxResults': 2500}
+        horizon = None
+        if self.past_days is not None:
+            horizon = datetime.now(BOGOTA_TZ) - timedelta(days=self.past_days)
+            params['timeMin'] = horizon.isoformat()
+        for page in self._list_pages(service, **params):
+            for event in page.get('items', []):
+                if event.get('status') != 'cancelled':
+                    events[event['id']] = event
+            sync_token = page.get('nextSyncToken', sync_token)
+        with self._lock:
+            self._events, self._by_attendee, self._by_start = {}, {}, []
+            for event in events.values():
+                self._index(event)
+            self._replay_pending()
+            self._horizon = horizon
+            self._sync_token = sync_token
+            self._last_sync = time.time()
+            self.stats['full_syncs'] += 1
+
+    def _incremental_sync(self, service):
+        changes = []
+        sync_token = self._sync_token
+        for page in self._list_pages(service, singleEvents=True, syncToken=self._sync_token):
+            changes.extend(page.get('items', []))
+            sync_token = page.get('nextSyncToken', sync_token)
+        with self._lock:
+            for event in changes:
+                self._apply(event)
+            self._replay_pending()
+            self._sync_token = sync_token
+            self._last_sync = time.time()
+            self.stats['incremental_syncs'] += 1
+
+    def sync(self):
+        """Sincroniza con la API: completa la primera vez, incremental después."""
+        service = self.service_factory()
+        self._begin_sync()
+        try:
+            if self._sync_token is None:
+                self._full_sync(service)
+            else:
+                try:
+                    self._incremental_sync(service)
+                except Exception as e:
+                    # 410 Gone: el syncToken caducó, hay que volver a sincronizar todo
+                    if getattr(getattr(e, 'resp', None), 'status', None) != 410:
+                        raise
+                    self._sync_token = None
+                    self._full_sync(service)
+        except Exception:
+            with self._lock:
+                self._pending = None
+            self.stats['sync_errors'] += 1
+            raise
+
+    def start(self):
+        """Inicia la sincronización periódica en un hilo daemon."""
+        if self._syncer is not None:
+            return self._syncer
+
+        def run():
+            while True:
+                try:
+                    self.sync()
+                except Exception as e:
+                    logger.warning("Error sincronizando el calendario: %s", e)
+                time.sleep(self.sync_interval)
+
+        self._syncer = threading.Thread(target=run, name='calendar-mirror-sync', daemon=True)
+        self._syncer.start()
+        return self._syncer
+
+    def staleness(self):
+        """Segundos desde la última sincronización correcta (None si nunca se sincronizó)."""
+        if self._last_sync is None:
+            return None
+        return time.time() - self._last_sync
+
+    def is_fresh(self):
+        staleness = self.staleness()
+        return staleness is not None and staleness <= self.max_staleness
+
+    def covers(self, time_min):
+        """True si el espejo tiene todos los eventos desde `time_min`."""
+        if self._horizon is None:
+            return True
+        return time_min is not None and time_min >= self._horizon
+
+    # --- Consultas ---
+
+    def get(self, event_id):
+        """Evento por id, o None si el espejo no lo conoce (el llamador debe ir a la API)."""
+        with self._lock:
+            entry = self._events.get(event_id) if self.is_fresh() else None
+            self.stats['hits' if entry else 'misses'] += 1
+            # Copia: el llamador puede modificar el evento antes de enviarlo a la API
+            return copy.deepcopy(entry[0]) if entry else None
+
+    def search(self, query=None, time_min=None, max_results=10, attendee=None, time_max=None):
+        """
+        Eventos ordenados por inicio que contienen todos los términos de `query`
+        (y al asistente `attendee`) en [time_min, time_max). Devuelve None si el espejo
+        no está listo, está desactualizado o no cubre la ventana, para que el
+        llamador use la API.
+        """
+        with self._lock:
+            if not self.is_fresh() or not self.covers(time_min):
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+
+            terms = query.lower().split() if query else []
+            candidates = None
+            if attendee:
+                candidates = self._by_attendee.get(attendee.lower(), set())
+            start = 0
+            if time_min is not None:
+                start = bisect.bisect_left(self._by_start, (time_min.timestamp(), ''))
+
+            end = time_max.timestamp() if time_max is not None else None
+            results = []
+            for timestamp, event_id in self._by_start[start:]:
+                if end is not None and timestamp >= end:
+                    break
+                if candidates is not None and event_id not in candidates:
+                    continue
+                event = self._events[event_id][0]
+                if terms:
+                    text = _event_text(event)
+                    if not all(term in text for term in terms):
+                        continue
+                results.append(event)
+                if len(results) >= max_results:
+                    break
+            return results
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(
+                self.stats,
+                events=len(self._events),
+                hit_rate=self.stats['hits'] / lookups if lookups else None,
+                staleness=self.staleness(),
+            )
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_calendar_mirror(service_factory):
+    """Espejo compartido del proceso; se crea y arranca su sincronización en el primer uso."""
+    global _mirror
+    if _mirror is None:
+        with _mirror_lock:
+            if _mirror is None:
+                _mirror = CalendarMirror(service_factory)
+                _mirror.start()
+    return _mirror
+
+
+metrics.register_collector(metrics.stats_collector(
+    'calendar_mirror', lambda: _mirror.get_stats() if _mirror is not None else None,
+    counters=('hits', 'misses', 'full_syncs', 'incremental_syncs', 'sync_errors'),
+    gauges=('events', 'staleness')))
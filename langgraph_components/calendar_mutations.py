@@ -0,0 +1,177 @@
+"""
+Cambios en Google Calendar con el menor número de peticiones.
+
+- Las citas se modifican con patch (solo los campos que cambian) y se
+  cancelan con delete, condicionados al ETag de la copia que se validó
+  (cabecera If-Match): si otra persona cambió la cita entretanto, Google
+  responde 412 en vez de pisar su cambio. En ese caso la cita se vuelve a leer,
+  se valida de nuevo y se reintenta una vez.
+- Varias citas (reprogramar o cancelar una serie) van en una sola petición
+  batch, de hasta CALENDAR_BATCH_SIZE operaciones, con un resultado por cita.
+
+apply() no sabe de herramientas: recibe una función `plan(evento)` que
+devuelve un mensaje (no hay nada que enviar: sin permiso, horario ocupado...)
+o (petición, al_terminar), donde al_terminar(respuesta) actualiza el estado
+local y devuelve el mensaje para el agente.
+"""
+from .google_services import aexecute
+from . import metrics
+import inspect
+import asyncio
+
+# Operaciones por petición batch (límite de la API de Calendar)
+CALENDAR_BATCH_SIZE = 50
+
+NOT_FOUND_MESSAGE = "No se encontró la cita especificada"
+CONFLICT_MESSAGE = "La cita cambió mientras se procesaba; búscala de nuevo antes de reintentar"
+
+
+def status_of(error):
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    return int(status) if status is not None else None
+
+
+def if_match(request, event):
+    """Condiciona la petición al ETag de `event` (sin ETag conocido va sin condición)."""
+    etag = event.get('etag')
+    if etag:
+        request.headers['If-Match'] = etag
+    return request
+
+
+def execute_batch(service, requests):
+    """
+    Ejecuta {clave: petición} y devuelve {clave: (respuesta, excepción)}. Una
+    sola petición se ejecuta directamente; varias, en lotes de CALENDAR_BATCH_SIZE.
+    """
+    results = {}
+    if len(requests) == 1:
+        (key, request), = requests.items()
+        try:
+            results[key] = (request.execute(), None)
+        except Exception as e:
+            results[key] = (None, e)
+        return results
+
+    items = list(requests.items())
+    for offset in range(0, len(items), CALENDAR_BATCH_SIZE):
+        chunk = items[offset:offset + CALENDAR_BATCH_SIZE]
+
+        def callback(request_id, response, exception, chunk=chunk):
+            results[chunk[int(request_id)][0]] = (response, exception)
+
+        batch = service.new_batch_http_request(callback=callback)
+        for i, (_, request) in enumerate(chunk):
+            batch.add(request, request_id=str(i))
+        with metrics.span("google", "calendar.batch", operations=len(chunk)):
+            batch.execute()
+    return results
+
+
+async def aexecute_batch(service, requests):
+    if len(requests) == 1:
+        (key, request), = requests.items()
+        try:
+            return {key: (await aexecute(request), None)}
+        except Exception as e:
+            return {key: (None, e)}
+    # El cliente HTTP asíncrono no arma peticiones batch: el lote va en un hilo
+    return await asyncio.to_thread(execute_batch, service, requests)
+
+
+def get_requests(service, event_ids):
+    return {event_id: service.events().get(calendarId='primary', eventId=event_id) for event_id in event_ids}
+
+
+def _fetched(results):
+    """{id: evento} de las lecturas que funcionaron (las citas borradas o inexistentes no aparecen)."""
+    return {event_id: response for event_id, (response, error) in results.items() if error is None and response}
+
+
+def _outcomes(plans, results, outcomes):
+    """Aplica al_terminar a las peticiones que funcionaron; devuelve los ids con conflicto de ETag."""
+    conflicts = []
+    for event_id, (response, error) in results.items():
+        if error is None:
+            outcomes[event_id] = plans[event_id][1](response)
+        elif status_of(error) == 412:
+            conflicts.append(event_id)
+        elif status_of(error) in (404, 410):
+            outcomes[event_id] = NOT_FOUND_MESSAGE
+        else:
+            outcomes[event_id] = error
+    return conflicts
+
+
+def apply(service, mirror, event_ids, plan):
+    """
+    Valida y envía los cambios de `event_ids`. Devuelve {id: mensaje o excepción}
+    en el orden de `event_ids`. Las citas que el espejo no conoce se leen en un solo batch.
+    """
+    events = {event_id: mirror.get(event_id) for event_id in event_ids}
+    missing = [event_id for event_id, event in events.items() if event is None]
+    if missing:
+        events.update(_fetched(execute_batch(service, get_requests(service, missing))))
+
+    outcomes = {}
+    pending = event_ids
+    for attempt in range(2):
+        plans = {}
+        for event_id in pending:
+            event = events.get(event_id)
+            planned = plan(event) if event else NOT_FOUND_MESSAGE
+            if isinstance(planned, str):
+                outcomes[event_id] = planned
+            else:
+                plans[event_id] = planned
+        if not plans:
+            break
+        conflicts = _outcomes(plans, execute_batch(service, {k: p[0] for k, p in plans.items()}), outcomes)
+        if not conflicts:
+            break
+        if attempt == 1:
+            outcomes.update({event_id: CONFLICT_MESSAGE for event_id in conflicts})
+            break
+        # Alguien cambió estas citas después de nuestra copia: se releen y se validan otra vez
+        fresh = _fetched(execute_batch(service, get_requests(service, conflicts)))
+        for event in fresh.values():
+            mirror.upsert(event)
+        events.update({event_id: fresh.get(event_id) for event_id in conflicts})
+        pending = conflicts
+    return {event_id: outcomes[event_id] for event_id in event_ids}
+
+
+async def aapply(service, mirror, event_ids, plan):
+    """Variante asíncrona de apply(); `plan` puede ser una corrutina."""
+    events = {event_id: mirror.get(event_id) for event_id in event_ids}
+    missing = [event_id for event_id, event in events.items() if event is None]
+    if missing:
+        events.update(_fetched(await aexecute_batch(service, get_requests(service, missing))))
+
+    outcomes = {}
+    pending = event_ids
+    for attempt in range(2):
+        plans = {}
+        for event_id in pending:
+            event = events.get(event_id)
+            planned = plan(event) if event else NOT_FOUND_MESSAGE
+            if inspect.isawaitable(planned):
+                planned = await planned
+            if isinstance(planned, str):
+                outcomes[event_id] = planned
+            else:
+                plans[event_id] = planned
+        if not plans:
+            break
+        conflicts = _outcomes(plans, await aexecute_batch(service, {k: p[0] for k, p in plans.items()}), outcomes)
+        if not conflicts:
+            break
+        if attempt == 1:
+            outcomes.update({event_id: CONFLICT_MESSAGE for event_id in conflicts})
+            break
+        fresh = _fetched(await aexecute_batch(service, get_requests(service, conflicts)))
+        for event in fresh.values():
+            mirror.upsert(event)
+        events.update({event_id: fresh.get(event_id) for event_id in conflicts})
+        pending = conflicts
+    return {event_id: outcomes[event_id] for event_id in event_ids}
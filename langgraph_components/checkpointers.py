@@ -0,0 +1,544 @@
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import MemorySaver
+from . import metrics
+from collections import OrderedDict
+import threading
+import asyncio
+import sqlite3
+import random
+import json
+import time
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Checkpointer a usar: 'memory' (un solo proceso) o 'sqlite' (compartido entre réplicas)
+CHECKPOINTER = os.getenv('CHECKPOINTER', 'memory')
+CHECKPOINT_DB = os.getenv('CHECKPOINT_DB', 'config/checkpoints.db')
+
+# Intervalo entre compactaciones del checkpointer SQLite (segundos)
+COMPACT_INTERVAL = float(os.getenv('CHECKPOINT_COMPACT_INTERVAL', '600'))
+
+# Límites por defecto del checkpointer en memoria (configurables por entorno)
+CHECKPOINT_MAX_THREADS = int(os.getenv('CHECKPOINT_MAX_THREADS', '1000'))
+CHECKPOINT_TTL = float(os.getenv('CHECKPOINT_TTL', str(2 * 60 * 60)))
+CHECKPOINT_MAX_PER_THREAD = int(os.getenv('CHECKPOINT_MAX_PER_THREAD', '20'))
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    MemorySaver con memoria acotada.
+
+    - Conserva como máximo `max_checkpoints_per_thread` checkpoints por conversación
+      (los más recientes) junto con los blobs y writes que estos referencian.
+    - Expulsa conversaciones por LRU cuando hay más de `max_threads` y por TTL
+      cuando llevan `ttl` segundos sin usarse.
+    """
+
+    def __init__(self, *, max_threads=CHECKPOINT_MAX_THREADS, ttl=CHECKPOINT_TTL,
+                 max_checkpoints_per_thread=CHECKPOINT_MAX_PER_THREAD, **kwargs):
+        super().__init__(**kwargs)
+        self.max_threads = max_threads
+        self.ttl = ttl
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+        self._lock = threading.RLock()
+        self._last_access = OrderedDict()
+        # (thread_id, checkpoint_ns, checkpoint_id) -> channel_versions del checkpoint
+        self._versions = {}
+        self.stats = {'evicted_threads': 0, 'pruned_checkpoints': 0}
+
+    def _touch(self, thread_id):
+        self._last_access[thread_id] = time.monotonic()
+        self._last_access.move_to_end(thread_id)
+
+    def _delete(self, thread_id):
+        self.storage.pop(thread_id, None)
+        for key in [k for k in self.writes if k[0] == thread_id]:
+            del self.writes[key]
+        for key in [k for k in self.blobs if k[0] == thread_id]:
+            del self.blobs[key]
+        for key in [k for k in self._versions if k[0] == thread_id]:
+            del self._versions[key]
+        self._last_access.pop(thread_id, None)
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._last_access:
+            thread_id, last_access = next(iter(self._last_access.items()))
+            if len(self._last_access) <= self.max_threads and now - last_access < self.ttl:
+                break
+            self._delete(thread_id)
+            self.stats['evicted_threads'] += 1
+
+    def _prune(self, thread_id, checkpoint_ns):
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        excess = len(checkpoints) - self.max_checkpoints_per_thread
+        if excess <= 0:
+            return
+        # Los checkpoints se insertan en orden cronológico: se descartan los primeros
+        for checkpoint_id in list(checkpoints)[:excess]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self._versions.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self.stats['pruned_checkpoints'] += 1
+
+        referenced = set()
+        for checkpoint_id in checkpoints:
+            versions = self._versions.get((thread_id, checkpoint_ns, checkpoint_id), {})
+            referenced.update(versions.items())
+        for key in [k for k in self.blobs
+                    if k[0] == thread_id and k[1] == checkpoint_ns and (k[2], k[3]) not in referenced]:
+            del self.blobs[key]
+
+    def get_tuple(self, config):
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            if thread_id in self._last_access:
+                self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        with self._lock:
+            items = [*super().list(config, filter=filter, before=before, limit=limit)]
+        yield from items
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = config["configurable"]["thread_id"]
+            checkpoint_ns = config["configurable"]["checkpoint_ns"]
+            self._versions[(thread_id, checkpoint_ns, checkpoint["id"])] = dict(checkpoint["channel_versions"])
+            self._touch(thread_id)
+            self._prune(thread_id, checkpoint_ns)
+            self._evict()
+            return next_config
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            self._delete(thread_id)
+
+    def get_stats(self):
+        """Métricas de memoria: conversaciones activas, checkpoints y bytes retenidos."""
+        with self._lock:
+            self._evict()
+            checkpoints = sum(len(c) for ns in self.storage.values() for c in ns.values())
+            retained = 0
+            for ns in self.storage.values():
+                for c in ns.values():
+                    for checkpoint, metadata, _ in c.values():
+                        retained += len(checkpoint[1]) + len(metadata[1])
+            for w in self.writes.values():
+                retained += sum(len(value[1]) for _, _, value, _ in w.values())
+            retained += sum(len(value[1]) for value in self.blobs.values())
+            return dict(self.stats, threads=len(self._last_access),
+                        checkpoints=checkpoints, bytes_retained=retained)
+
+
+class SQLiteSaver(BaseCheckpointSaver):
+    """
+    Checkpointer persistente en SQLite (modo WAL), compartible entre procesos y réplicas
+    que monten el mismo archivo.
+
+    Igual que MemorySaver, cada paso guarda solo los canales que cambiaron (blobs por
+    versión de canal), no el estado completo. compact() elimina los checkpoints
+    antiguos, los writes y blobs que ya nadie referencia y las conversaciones inactivas.
+    """
+
+    def __init__(self, path=CHECKPOINT_DB, *, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                parent_checkpoint_id TEXT,
+                type TEXT,
+                checkpoint BLOB,
+                metadata_type TEXT,
+                metadata BLOB,
+                versions TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                channel TEXT NOT NULL,
+                version TEXT NOT NULL,
+                type TEXT NOT NULL,
+                blob BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+            );
+            CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT,
+                value BLOB,
+                task_path TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS idx_checkpoints_updated ON checkpoints (updated_at);
+            """
+        )
+
+    def _connection(self):
+        # Una conexión por hilo; las transacciones se abren explícitamente
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _load_blobs(self, conn, thread_id, checkpoint_ns, versions):
+        channel_values = {}
+        for channel, version in versions.items():
+            row = conn.execute(
+                "SELECT type, blob FROM blobs"
+                " WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version))
+            ).fetchone()
+            if row and row[0] != "empty":
+                channel_values[channel] = self.serde.loads_typed((row[0], row[1]))
+        return channel_values
+
+    def _to_tuple(self, conn, row):
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, checkpoint_b, \
+            metadata_type, metadata_b = row
+        checkpoint = self.serde.loads_typed((type_, checkpoint_b))
+        writes = conn.execute(
+            "SELECT task_id, channel, type, value FROM writes"
+            " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?"
+            " ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id)
+        ).fetchall()
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_blobs(
+                    conn, thread_id, checkpoint_ns, checkpoint["channel_versions"]
+                ),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata_b)),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((value_type, value)))
+                for task_id, channel, value_type, value in writes
+            ],
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+        )
+
+    _SELECT = (
+        "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id,"
+        " type, checkpoint, metadata_type, metadata FROM checkpoints"
+    )
+
+    def get_tuple(self, config):
+        conn = self._connection()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        if checkpoint_id := get_checkpoint_id(config):
+            row = conn.execute(
+                self._SELECT + " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id)
+            ).fetchone()
+        else:
+            row = conn.execute(
+                self._SELECT + " WHERE thread_id = ? AND checkpoint_ns = ?"
+                " ORDER BY checkpoint_id DESC LIMIT 1",
+                (thread_id, checkpoint_ns)
+            ).fetchone()
+        if row is None:
+            return None
+        return self._to_tuple(conn, row)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        conn = self._connection()
+        where, params = [], []
+        if config:
+            where.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            checkpoint_ns = config["configurable"].get("checkpoint_ns")
+            if checkpoint_ns is not None:
+                where.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_checkpoint_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id < ?")
+            params.append(before_checkpoint_id)
+        query = self._SELECT
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY checkpoint_id DESC"
+
+        rows = conn.execute(query, params).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            if filter:
+                metadata = self.serde.loads_typed((row[6], row[7]))
+                if not all(metadata.get(k) == v for k, v in filter.items()):
+                    continue
+            if limit is not None:
+                limit -= 1
+            yield self._to_tuple(conn, row)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        conn = self._connection()
+        c = checkpoint.copy()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        values = c.pop("channel_values")
+        blobs = []
+        for k, v in new_versions.items():
+            type_, blob = self.serde.dumps_typed(values[k]) if k in values else ("empty", b"")
+            blobs.append((thread_id, checkpoint_ns, k, str(v), type_, blob))
+        type_, checkpoint_b = self.serde.dumps_typed(c)
+        metadata_type, metadata_b = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        versions = json.dumps({k: str(v) for k, v in checkpoint["channel_versions"].items()})
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO blobs (thread_id, checkpoint_ns, channel, version, type, blob)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                blobs
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id,"
+                " parent_checkpoint_id, type, checkpoint, metadata_type, metadata, versions, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 type_, checkpoint_b, metadata_type, metadata_b, versions, time.time())
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        conn = self._connection()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # Los canales especiales (error, interrupt...) se reemplazan; el resto no se duplica
+        replace = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, value_b = self.serde.dumps_typed(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id,
+                         WRITES_IDX_MAP.get(channel, idx), channel, type_, value_b, task_path))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO writes (thread_id, checkpoint_ns,"
+                " checkpoint_id, task_id, idx, channel, type, value, task_path)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete_thread(self, thread_id):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in ("checkpoints", "blobs", "writes"):
+                conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def compact(self, keep_last=CHECKPOINT_MAX_PER_THREAD, ttl=CHECKPOINT_TTL):
+        """
+        Elimina las conversaciones inactivas hace más de `ttl` segundos y, en el resto,
+        los checkpoints más allá de los `keep_last` más recientes junto con los writes
+        y blobs que ya no se referencian. Devuelve cuántos checkpoints se borraron.
+        """
+        conn = self._connection()
+        deleted = 0
+        stale = conn.execute(
+            "SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(updated_at) < ?",
+            (time.time() - ttl,)
+        ).fetchall()
+        for (thread_id,) in stale:
+            deleted += conn.execute(
+                "SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", (thread_id,)
+            ).fetchone()[0]
+            self.delete_thread(thread_id)
+
+        groups = conn.execute(
+            "SELECT thread_id, checkpoint_ns FROM checkpoints"
+            " GROUP BY thread_id, checkpoint_ns HAVING COUNT(*) > ?",
+            (keep_last,)
+        ).fetchall()
+        for thread_id, checkpoint_ns in groups:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                old = conn.execute(
+                    "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+                    " ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+                    (thread_id, checkpoint_ns, keep_last)
+                ).fetchall()
+                conn.executemany(
+                    "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    [(thread_id, checkpoint_ns, checkpoint_id) for (checkpoint_id,) in old]
+                )
+                conn.executemany(
+                    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    [(thread_id, checkpoint_ns, checkpoint_id) for (checkpoint_id,) in old]
+                )
+                referenced = set()
+                for (versions,) in conn.execute(
+                    "SELECT versions FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+                    (thread_id, checkpoint_ns)
+                ):
+                    referenced.update(json.loads(versions).items())
+                unreferenced = [
+                    (thread_id, checkpoint_ns, channel, version)
+                    for channel, version in conn.execute(
+                        "SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+                        (thread_id, checkpoint_ns)
+                    ).fetchall()
+                    if (channel, version) not in referenced
+                ]
+                conn.executemany(
+                    "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                    unreferenced
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            deleted += len(old)
+        return deleted
+
+    def start_compactor(self, interval=COMPACT_INTERVAL):
+        """Inicia un hilo daemon que ejecuta compact() periódicamente."""
+        if getattr(self, '_compactor', None) is not None:
+            return self._compactor
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.warning("Error compactando checkpoints: %s", e)
+
+        self._compactor = threading.Thread(target=run, name='checkpoint-compactor', daemon=True)
+        self._compactor.start()
+        return self._compactor
+
+    def get_stats(self):
+        conn = self._connection()
+        threads, checkpoints = conn.execute(
+            "SELECT COUNT(DISTINCT thread_id), COUNT(*) FROM checkpoints"
+        ).fetchone()
+        retained = sum(
+            conn.execute(f"SELECT COALESCE(SUM(LENGTH({column})), 0) FROM {table}").fetchone()[0]
+            for table, column in (("checkpoints", "checkpoint"), ("blobs", "blob"), ("writes", "value"))
+        )
+        return {'threads': threads, 'checkpoints': checkpoints, 'bytes_retained': retained}
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(
+            lambda: [*self.list(config, filter=filter, before=before, limit=limit)]
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current, channel):
+        # Mismo esquema de versiones que MemorySaver: "<contador>.<aleatorio>"
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+
+# Último checkpointer creado por load_checkpointer(): el que exportan las métricas
+_checkpointer = None
+
+
+def load_checkpointer(kind=CHECKPOINTER):
+    """Crea el checkpointer configurado ('memory' o 'sqlite')."""
+    global _checkpointer
+    if kind == 'memory':
+        _checkpointer = BoundedMemorySaver()
+    elif kind == 'sqlite':
+        _checkpointer = SQLiteSaver(CHECKPOINT_DB)
+        _checkpointer.start_compactor()
+    else:
+        raise ValueError(f"Checkpointer desconocido: {kind}")
+    return _checkpointer
+
+
+metrics.register_collector(metrics.stats_collector(
+    'checkpointer', lambda: _checkpointer.get_stats() if _checkpointer is not None else None,
+    counters=('evicted_threads', 'pruned_checkpoints'), gauges=('threads', 'checkpoints', 'bytes_retained')))
@@ -0,0 +1,150 @@
+from . import metrics
+from functools import wraps
+from collections import deque
+import threading
+import asyncio
+import inspect
+import time
+import os
+
+# Hilos con los que el nodo de herramientas ejecuta en paralelo las llamadas de un mismo paso.
+# LangGraph usa el mismo límite para sus tareas internas: con menos de 2 el grafo se bloquea.
+MAX_PARALLEL_TOOLS = max(2, int(os.getenv('MAX_PARALLEL_TOOLS', '8')))
+# Llamadas simultáneas permitidas por herramienta de Calendar, para no superar las cuotas de Google
+CALENDAR_TOOL_CONCURRENCY = int(os.getenv('CALENDAR_TOOL_CONCURRENCY', '4'))
+# Códigos de verificación emitidos a la vez: cada uno escribe en el almacén de códigos y en la
+# bandeja de salida (SQLite); el envío a Gmail lo hace el worker de la bandeja en lotes
+GMAIL_TOOL_CONCURRENCY = int(os.getenv('GMAIL_TOOL_CONCURRENCY', '2'))
+
+_limits = {}
+
+
+class SharedSlots:
+    """
+    Plazas de ejecución compartidas por hilos y corrutinas: los hilos esperan en
+    una Condition y cada corrutina en un Future de su bucle de eventos, así que
+    esperar nunca bloquea un bucle. Al liberar, la plaza pasa directamente a una
+    corrutina en espera (si la hay) o despierta a un hilo.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.stats = {'limit': limit, 'calls': 0, 'waits': 0, 'wait_time': 0.0, 'in_flight': 0, 'peak': 0}
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._waiters = deque()
+
+    def _started(self, waited, start):
+        # Se llama con el lock tomado
+        self.stats['calls'] += 1
+        if waited:
+            self.stats['waits'] += 1
+            self.stats['wait_time'] += time.perf_counter() - start
+        self.stats['in_flight'] += 1
+        self.stats['peak'] = max(self.stats['peak'], self.stats['in_flight'])
+
+    def acquire(self):
+        start = time.perf_counter()
+        with self._lock:
+            waited = self.stats['in_flight'] >= self.limit
+            while self.stats['in_flight'] >= self.limit:
+                self._available.wait()
+            self._started(waited, start)
+
+    async def aacquire(self):
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.stats['in_flight'] < self.limit:
+                self._started(False, start)
+                return
+            waiter = (loop, loop.create_future(), start)
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = waiter in self._waiters
+                if queued:
+                    self._waiters.remove(waiter)
+            # Si ya se le había cedido la plaza se devuelve: aquí si llegó a entregarse,
+            # o en _grant al encontrar el Future cancelado
+            if not queued and waiter[1].done() and not waiter[1].cancelled():
+                self.release()
+            raise
+
+    def _grant(self, future):
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def release(self):
+        with self._lock:
+            self.stats['in_flight'] -= 1
+            while self._waiters:
+                loop, future, start = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(self._grant, future)
+                except RuntimeError:
+                    continue  # Bucle ya cerrado
+                self._started(True, start)
+                return
+            self._available.notify()
+
+
+def limit_concurrency(limit):
+    """
+    Limita cuántas ejecuciones simultáneas admite la función decorada; las
+    llamadas que exceden el límite esperan su turno. Va debajo de @tool para
+    que la herramienta conserve su nombre, firma y descripción.
+
+    La versión async de una herramienta (a<nombre>, p. ej. acreate_calendar_event)
+    comparte las plazas de la síncrona, así que el límite vale para las dos a la
+    vez; esperar una plaza nunca bloquea el bucle de eventos (ver SharedSlots).
+    """
+    def decorator(func):
+        is_async = inspect.iscoroutinefunction(func)
+        name = func.__name__[1:] if is_async and func.__name__.startswith('a') else func.__name__
+        slots = _limits.get(name)
+        if slots is None:
+            slots = _limits[name] = SharedSlots(limit)
+
+        if is_async:
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                await slots.aacquire()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    slots.release()
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            slots.acquire()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                slots.release()
+
+        return wrapper
+    return decorator
+
+
+def get_concurrency_stats():
+    """Uso de cada límite: llamadas, esperas, tiempo esperando y máximo simultáneo."""
+    result = {}
+    for name, slots in _limits.items():
+        with slots._lock:
+            result[name] = dict(slots.stats)
+    return result
+
+
+metrics.register_collector(lambda: [
+    (f"concurrency_{key}{'_total' if key in ('calls', 'waits') else ''}",
+     'counter' if key in ('calls', 'waits') else 'gauge', {'function': name}, stats[key])
+    for name, stats in get_concurrency_stats().items()
+    for key in ('calls', 'waits', 'wait_time', 'in_flight', 'peak')
+])
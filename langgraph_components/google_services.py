@@ -0,0 +1,319 @@
+# Los módulos de Google se importan de forma diferida (dentro de las funciones)
+# para que app.py y load_graph() no paguen su coste al arrancar.
+from datetime import datetime, timedelta, timezone
+import threading
+import asyncio
+import weakref
+import tempfile
+import pickle
+import time
+import logging
+import os
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Directorio con credentials.json y token.pickle (en Docker, /app/credentials)
+CREDENTIALS_DIR = os.getenv('GOOGLE_CREDENTIALS_DIR', 'credentials')
+TOKEN_FILE = os.path.join(CREDENTIALS_DIR, 'token.pickle')
+CLIENT_SECRETS_FILE = os.path.join(CREDENTIALS_DIR, 'credentials.json')
+
+# Timeout (segundos) de las conexiones HTTP hacia Google
+HTTP_TIMEOUT = 30
+# Conexiones simultáneas del cliente HTTP asíncrono (por bucle de eventos)
+GOOGLE_MAX_CONNECTIONS = int(os.getenv('GOOGLE_MAX_CONNECTIONS', '20'))
+# Cada cuánto (segundos) se comprueba si token.pickle cambió en disco (rotación de credenciales)
+TOKEN_CHECK_INTERVAL = float(os.getenv('GOOGLE_TOKEN_CHECK_INTERVAL', '30'))
+
+SCOPES = [
+    'https://www.googleapis.com/auth/calendar',
+    'https://www.googleapis.com/auth/gmail.send',
+    'https://www.googleapis.com/auth/gmail.compose',
+    'https://www.googleapis.com/auth/gmail.modify'
+]
+
+
+class CredentialManager:
+    """
+    Mantiene las credenciales OAuth en memoria para todo el proceso.
+
+    token.pickle se lee la primera vez y se vuelve a leer si su fecha de
+    modificación cambia (se comprueba como mucho cada `check_interval` segundos)
+    o tras reload(), así que rotar las credenciales en disco no exige reiniciar.
+    El token se refresca de forma proactiva REFRESH_MARGIN antes de expirar; los
+    refrescos concurrentes se agrupan en una sola petición y el archivo se
+    reescribe de forma atómica (temporal + rename) únicamente cuando el token cambia.
+    """
+
+    # Margen antes de la expiración en el que se refresca el token
+    REFRESH_MARGIN = timedelta(minutes=5)
+
+    def __init__(self, token_file=TOKEN_FILE, client_secrets_file=CLIENT_SECRETS_FILE,
+                 check_interval=TOKEN_CHECK_INTERVAL):
+        self.token_file = token_file
+        self.client_secrets_file = client_secrets_file
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._creds = None
+        # Fecha de modificación de token.pickle al leerlo o escribirlo, y última comprobación
+        self._mtime = None
+        self._checked = 0.0
+        self.stats = {'refreshes': 0, 'persists': 0, 'reloads': 0}
+
+    def _needs_refresh(self, creds):
+        if not creds.token:
+            return True
+        if creds.expiry is None:
+            return False
+        # google-auth guarda expiry como datetime UTC sin zona horaria
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return creds.expiry - now <= self.REFRESH_MARGIN
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.token_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _rotated(self):
+        """True si token.pickle cambió desde que se leyó; consulta el disco como mucho cada check_interval."""
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return False
+        self._checked = now
+        mtime = self._file_mtime()
+        return mtime is not None and mtime != self._mtime
+
+    def _load(self):
+        self._mtime = self._file_mtime()
+        self._checked = time.monotonic()
+        if self._mtime is None:
+            return None
+        with open(self.token_file, 'rb') as token:
+            return pickle.load(token)
+
+    def _persist(self, creds):
+        """Escribe token.pickle de forma atómica: archivo temporal en el mismo directorio + rename."""
+        directory = os.path.dirname(self.token_file) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.token.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                pickle.dump(creds, tmp)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            try:
+                os.chmod(tmp_path, 0o666)
+            except OSError as e:
+                logger.warning("No se pudieron establecer permisos en %s: %s", tmp_path, e)
+            os.replace(tmp_path, self.token_file)
+            # Nuestra propia escritura no cuenta como rotación
+            self._mtime = self._file_mtime()
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.stats['persists'] += 1
+
+    def _authorize(self):
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
+        if not os.path.exists(self.client_secrets_file):
+            raise FileNotFoundError(f"No se encuentra el archivo {self.client_secrets_file}")
+        flow = InstalledAppFlow.from_client_secrets_file(self.client_secrets_file, SCOPES)
+        return flow.run_local_server(port=0)
+
+    def get(self):
+        """
+        Devuelve las credenciales vigentes; en el camino rápido no toca la red y del
+        disco solo consulta la fecha de token.pickle (como mucho cada check_interval).
+        """
+        creds = self._creds
+        rotated = creds is not None and self._rotated()
+        if creds is not None and not rotated and not self._needs_refresh(creds):
+            return creds
+
+        # Si el token aún es válido y otro hilo ya lo está refrescando, no esperar
+        if creds is not None and creds.valid and not rotated:
+            if not self._lock.acquire(blocking=False):
+                return creds
+        else:
+            self._lock.acquire()
+
+        try:
+            if rotated:
+                self.stats['reloads'] += 1
+            if self._creds is None or rotated:
+                self._creds = self._load()
+            creds = self._creds
+            if creds is not None and not self._needs_refresh(creds):
+                return creds
+
+            if creds and creds.refresh_token:
+                from google.auth.transport.requests import Request
+
+                previous_token = creds.token
+                creds.refresh(Request())
+                self.stats['refreshes'] += 1
+                if creds.token != previous_token:
+                    self._persist(creds)
+            else:
+                creds = self._authorize()
+                self._creds = creds
+                self._persist(creds)
+            return creds
+        finally:
+            self._lock.release()
+
+    def is_fresh(self):
+        """True si get() puede responder sin tocar disco ni red."""
+        creds = self._creds
+        return creds is not None and not self._needs_refresh(creds)
+
+    def reload(self):
+        """Descarta las credenciales en memoria para releer token.pickle en el próximo get()."""
+        with self._lock:
+            self._creds = None
+            self.stats['reloads'] += 1
+
+
+class ServiceRegistry:
+    """
+    Registro thread-safe de clientes de Google API.
+
+    Cada cliente (api, versión) se construye una vez por proceso y se reutiliza
+    mientras el objeto de credenciales no cambie: un token refrescado sigue en el
+    mismo objeto, y un token.pickle rotado o una nueva autorización crean otro,
+    con lo que el cliente se reconstruye. Las peticiones usan un AuthorizedHttp por
+    hilo (httplib2 no es thread-safe) que conserva las conexiones keep-alive.
+    """
+
+    def __init__(self, credential_manager):
+        self.credential_manager = credential_manager
+        self._lock = threading.Lock()
+        self._services = {}
+        self._local = threading.local()
+        self.stats = {'builds': 0, 'reuses': 0}
+
+    def _authorized_http(self, creds):
+        import google_auth_httplib2
+        import httplib2
+
+        http = getattr(self._local, 'http', None)
+        if http is None or http.credentials is not creds:
+            http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+            self._local.http = http
+        return http
+
+    def _build(self, api, version, creds):
+        from googleapiclient.discovery import build
+        from googleapiclient.http import HttpRequest
+
+        def request_builder(_http, *args, **kwargs):
+            # Ignora el http del cliente y usa el del hilo actual
+            request = HttpRequest(self._authorized_http(creds), *args, **kwargs)
+            # Cada petición se mide como un tramo "google" con el id del método (calendar.events.list...)
+            request.execute = metrics.traced("google", request.methodId)(request.execute)
+            return request
+
+        # static_discovery usa los documentos que trae googleapiclient: sin red y al día con la librería
+        return build(api, version, credentials=creds, requestBuilder=request_builder,
+                     cache_discovery=False, static_discovery=True)
+
+    def get(self, api, version):
+        """Obtiene el cliente de (api, version), construyéndolo solo si hace falta."""
+        creds = self.credential_manager.get()
+        key = (api, version)
+        with self._lock:
+            entry = self._services.get(key)
+            if entry is not None and entry[0] is creds:
+                self.stats['reuses'] += 1
+                return entry[1]
+            service = self._build(api, version, creds)
+            self._services[key] = (creds, service)
+            self.stats['builds'] += 1
+            return service
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, services=len(self._services))
+
+    def clear(self):
+        with self._lock:
+            self._services.clear()
+
+
+class AsyncHttpPool:
+    """
+    Ejecuta de forma asíncrona las peticiones que construye googleapiclient
+    (service.events().list(...), etc.) sobre un httpx.AsyncClient compartido,
+    con conexiones keep-alive. Hay un cliente por bucle de eventos, porque sus
+    conexiones no pueden usarse desde otro bucle.
+    """
+
+    def __init__(self, credential_manager):
+        self.credential_manager = credential_manager
+        self._clients = weakref.WeakKeyDictionary()
+        self.stats = {'requests': 0, 'clients': 0}
+
+    def _client(self):
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=HTTP_TIMEOUT,
+                limits=httpx.Limits(max_connections=GOOGLE_MAX_CONNECTIONS),
+            )
+            self._clients[loop] = client
+            self.stats['clients'] += 1
+        return client
+
+    async def execute(self, request):
+        """Equivalente asíncrono de request.execute(); devuelve lo mismo y lanza HttpError igual."""
+        # Los dobles de prueba (benchmarks/fakes.py) traen su propia versión asíncrona
+        with metrics.span("google", getattr(request, 'methodId', type(request).__name__)):
+            native = getattr(request, 'aexecute', None)
+            if native is not None:
+                return await native()
+            return await self._execute(request)
+
+    async def _execute(self, request):
+        import httplib2
+
+        if self.credential_manager.is_fresh():
+            creds = self.credential_manager.get()
+        else:
+            creds = await asyncio.to_thread(self.credential_manager.get)
+        headers = dict(request.headers)
+        creds.apply(headers)
+        response = await self._client().request(
+            request.method, request.uri, content=request.body, headers=headers
+        )
+        self.stats['requests'] += 1
+        resp = httplib2.Response({'status': response.status_code, **response.headers})
+        # postproc es el modelo de googleapiclient: deserializa el JSON o lanza HttpError
+        return request.postproc(resp, response.content)
+
+    async def aclose(self):
+        """Cierra el cliente del bucle actual (al apagar el servidor)."""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+credential_manager = CredentialManager()
+service_registry = ServiceRegistry(credential_manager)
+async_http = AsyncHttpPool(credential_manager)
+metrics.register_collector(metrics.stats_collector(
+    'google_credentials', lambda: credential_manager.stats, counters=('refreshes', 'persists', 'reloads')))
+metrics.register_collector(metrics.stats_collector(
+    'google_clients', service_registry.get_stats, counters=('builds', 'reuses'), gauges=('services',)))
+metrics.register_collector(metrics.stats_collector(
+    'google_async_http', lambda: async_http.stats, counters=('requests',), gauges=('clients',)))
+
+
+async def aexecute(request):
+    """Ejecuta una petición de googleapiclient con el cliente HTTP asíncrono compartido."""
+    return await async_http.execute(request)
@@ -1,10 +1,17 @@
-from .llm import load_llm_openai, load_llm_deepseek
+from .llm import load_llm, tiered, phase_stats, response_cache
 from .graph_tools import tools
-from langchain_core.prompts import ChatPromptTemplate
+from .history import trim_history
+from .router import route, aroute, served_by_fast_path, fast_path_stats
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage, ToolMessage
 from langgraph_components.states import State
-from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph.prebuilt import ToolNode, tools_condition
+from langgraph.utils.runnable import RunnableCallable
+from .checkpointers import load_checkpointer
+from .concurrency import MAX_PARALLEL_TOOLS
+from .metrics import span, traced, turn
 from langgraph.graph import StateGraph, START, END
+from langgraph.constants import TAG_NOSTREAM
+import time
 import yaml
 
 
@@ -14,27 +21,172 @@ def load_config():
         return yaml.safe_load(file)
 
 
-def load_graph():
+def load_graph(checkpointer=None, llm=None, cache=None, routing_llm=None):
     prompts = load_config()
-    llm = load_llm_openai()
-    # llm = load_llm_deepseek()
-
-    # Configurar el prompt del sistema
-    system_prompt = ChatPromptTemplate.from_messages([
-        ("system", prompts["prompt_assistant"]),
-        ("placeholder", "{messages}")
-    ])
-
-    # Crear el graph con el estado definido
-    graph = create_react_agent(
-        model=llm,
-        tools=tools,
-        state_schema=State,
-        state_modifier=system_prompt,
-        checkpointer=MemorySaver(),
-    )
-
-    return graph
+    # OpenAI y DeepSeek con conmutación por error (ver llm.FailoverChatModel). El paso
+    # que sigue al mensaje del usuario (decidir herramientas) puede usar un modelo más
+    # rápido; las respuestas al usuario las escribe siempre el principal (ver llm.LLM_TIERS)
+    if llm is None:
+        llm = load_llm('answer')
+        if routing_llm is None and tiered():
+            routing_llm = load_llm('routing')
+
+    # Configurar el prompt del sistema. Antes de cada llamada al modelo el historial
+    # se recorta a un presupuesto de tokens (ver history.trim_history); el prompt del
+    # sistema va primero y sin cambios para aprovechar la caché de prefijos del proveedor.
+    system_message = SystemMessage(content=prompts["prompt_assistant"])
+
+    def system_prompt(state):
+        return [system_message] + trim_history(state["messages"])
+
+    model = llm.bind_tools(tools)
+    router_model = routing_llm.bind_tools(tools) if routing_llm is not None else None
+    # Las preguntas generales sin herramientas ni datos personales se responden
+    # desde la caché (ver llm.ResponseCache) sin llamar al modelo
+    cache = cache or response_cache
+
+    def phase(messages):
+        return "routing" if isinstance(messages[-1], HumanMessage) else "answer"
+
+    def routing_config(config):
+        # El borrador del modelo rápido no se emite como tokens: si no pide
+        # herramientas se descarta y la respuesta la escribe el modelo principal
+        return {**config, "tags": [*config.get("tags", []), TAG_NOSTREAM]}
+
+    def call_model(state, config):
+        messages = system_prompt(state)
+        cached = cache.get(messages)
+        if cached is not None:
+            return {"messages": [AIMessage(content=cached)]}
+        if router_model is not None and phase(messages) == "routing":
+            start = time.perf_counter()
+            response = router_model.invoke(messages, routing_config(config))
+            phase_stats.record("routing", time.perf_counter() - start, messages, response)
+            if response.tool_calls:
+                return {"messages": [response]}
+        start = time.perf_counter()
+        response = model.invoke(messages, config)
+        phase_stats.record("answer", time.perf_counter() - start, messages, response)
+        cache.put(messages, response)
+        return {"messages": [response]}
+
+    async def acall_model(state, config):
+        messages = system_prompt(state)
+        cached = cache.get(messages)
+        if cached is not None:
+            return {"messages": [AIMessage(content=cached)]}
+        if router_model is not None and phase(messages) == "routing":
+            start = time.perf_counter()
+            response = await router_model.ainvoke(messages, routing_config(config))
+            phase_stats.record("routing", time.perf_counter() - start, messages, response)
+            if response.tool_calls:
+                return {"messages": [response]}
+        start = time.perf_counter()
+        response = await model.ainvoke(messages, config)
+        phase_stats.record("answer", time.perf_counter() - start, messages, response)
+        cache.put(messages, response)
+        return {"messages": [response]}
+
+    # Agente ReAct (agent <-> tools) precedido por el router, que resuelve sin el
+    # modelo los mensajes triviales (ver router.py) y si no, pasa el turno al agente
+    workflow = StateGraph(State)
+    # Cada nodo se mide como un tramo "node" (ver metrics.py)
+    workflow.add_node("router", RunnableCallable(traced("node", "router")(route), traced("node", "router")(aroute)))
+    workflow.add_node("agent", RunnableCallable(traced("node", "agent")(call_model), traced("node", "agent")(acall_model)))
+    workflow.add_node("tools", TracedToolNode(tools))
+    workflow.add_edge(START, "router")
+    workflow.add_conditional_edges("router", lambda state: END if served_by_fast_path(state) else "agent")
+    workflow.add_conditional_edges("agent", tools_condition)
+    workflow.add_edge("tools", "agent")
+
+    return workflow.compile(checkpointer=checkpointer or load_checkpointer())
+
+
+class TracedToolNode(ToolNode):
+    """ToolNode medido como un tramo "node"; cada herramienta tiene además el suyo."""
+
+    def _func(self, input, config, *, store):
+        with span("node", "tools"):
+            return super()._func(input, config, store=store)
+
+    async def _afunc(self, input, config, *, store):
+        with span("node", "tools"):
+            return await super()._afunc(input, config, store=store)
+
+
+def _stream_events(mode, payload):
+    """Traduce un fragmento de graph.stream/astream a eventos; ("answer", texto) es la respuesta final."""
+    if mode == "messages":
+        chunk, metadata = payload
+        if (metadata.get("langgraph_node") == "agent"
+                and isinstance(chunk, AIMessageChunk) and chunk.content):
+            yield "token", chunk.content
+    elif "agent" in payload:
+        message = payload["agent"]["messages"][-1]
+        if message.tool_calls:
+            for tool_call in message.tool_calls:
+                yield "tool_start", tool_call["name"]
+        else:
+            yield "answer", message.content
+    elif "tools" in payload:
+        for message in payload["tools"]["messages"]:
+            yield "tool_end", message.name
+    elif payload.get("router"):
+        # Turno resuelto por el atajo: llamada a la herramienta, resultado y respuesta
+        for message in payload["router"]["messages"]:
+            if isinstance(message, ToolMessage):
+                yield "tool_end", message.name
+            elif message.tool_calls:
+                for tool_call in message.tool_calls:
+                    yield "tool_start", tool_call["name"]
+            else:
+                yield "token", message.content
+                yield "answer", message.content
+
+
+def stream_response(graph, inputs, config):
+    """
+    Ejecuta el grafo y produce eventos a medida que ocurren:
+    ("token", texto) por cada fragmento generado por el modelo,
+    ("tool_start", nombre) / ("tool_end", nombre) por cada herramienta
+    y ("final", respuesta) al terminar.
+
+    Las llamadas a herramientas de un mismo paso se ejecutan en paralelo en un
+    pool de MAX_PARALLEL_TOOLS hilos (salvo que `config` indique otro max_concurrency).
+    """
+    config = {"max_concurrency": MAX_PARALLEL_TOOLS, **config}
+    final, fast = "", True
+    start = time.perf_counter()
+    with turn(config.get("configurable", {}).get("thread_id")):
+        for mode, payload in graph.stream(inputs, config, stream_mode=["messages", "updates"]):
+            fast = fast and not (mode == "updates" and "agent" in payload)
+            for kind, value in _stream_events(mode, payload):
+                if kind == "answer":
+                    final = value
+                else:
+                    yield kind, value
+    fast_path_stats.record_turn(fast, time.perf_counter() - start)
+    yield "final", final
+
+
+async def astream_response(graph, inputs, config):
+    """
+    Variante asíncrona de stream_response (mismos eventos) sobre graph.astream:
+    las herramientas usan sus versiones async y el modelo su cliente async, así
+    que un solo proceso atiende muchas conversaciones sin ocupar un hilo por cada una.
+    """
+    final, fast = "", True
+    start = time.perf_counter()
+    with turn(config.get("configurable", {}).get("thread_id")):
+        async for mode, payload in graph.astream(inputs, config, stream_mode=["messages", "updates"]):
+            fast = fast and not (mode == "updates" and "agent" in payload)
+            for kind, value in _stream_events(mode, payload):
+                if kind == "answer":
+                    final = value
+                else:
+                    yield kind, value
+    fast_path_stats.record_turn(fast, time.perf_counter() - start)
+    yield "final", final
 
 # graph = load_graph()
 
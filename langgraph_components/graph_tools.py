@@ -1,124 +1,92 @@
 from langchain_core.tools import tool
 from datetime import datetime, timedelta
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from .google_services import service_registry, credential_manager, aexecute
+from .verification_store import get_verification_store
+from .calendar_mirror import get_calendar_mirror, parse_event_time
+from .availability import get_freebusy_index
+from .concurrency import limit_concurrency, CALENDAR_TOOL_CONCURRENCY, GMAIL_TOOL_CONCURRENCY
+from .outbox import get_outbox
+from .rate_limiter import get_rate_limiter
+from .calendar_mutations import if_match
+from . import calendar_mutations
+from .metrics import traced
+from . import metrics
+from langchain_core.runnables.config import var_child_runnable_config
 import os.path
-import pickle
+import functools
+import inspect
+import asyncio
 import json
 import random
+import re
 import string
 from email.mime.text import MIMEText
+import logging
 import base64
 from zoneinfo import ZoneInfo
-import yaml
-import fcntl
-import tempfile
-import shutil
-import stat
-
-# Almacenamiento temporal de códigos de verificación
-VERIFICATION_FILE = '/app/config/verification_codes.yaml'
-
-# Actualizar SCOPES para incluir Gmail
-SCOPES = [
-    'https://www.googleapis.com/auth/calendar',
-    'https://www.googleapis.com/auth/gmail.send',
-    'https://www.googleapis.com/auth/gmail.compose',
-    'https://www.googleapis.com/auth/gmail.modify'
-]
+
+logger = logging.getLogger(__name__)
+
+# Mapeo de días en español
+DIAS_SEMANA = {
+    0: 'lunes',
+    1: 'martes',
+    2: 'miércoles',
+    3: 'jueves',
+    4: 'viernes',
+    5: 'sábado',
+    6: 'domingo'
+}
+
+# Formato de los resultados de las herramientas que el modelo relee en cada paso:
+# 'compact' (una línea por resultado, claves cortas) o 'json' (el formato anterior).
+# TOOL_RESULT_FORMATS permite elegirlo por herramienta: "search_calendar_event=json,..."
+TOOL_RESULT_FORMAT = os.getenv('TOOL_RESULT_FORMAT', 'compact')
+TOOL_RESULT_FORMATS = dict(
+    item.strip().split('=', 1) for item in os.getenv('TOOL_RESULT_FORMATS', '').split(',') if '=' in item
+)
+# Presupuesto común de caracteres por resultado de herramienta (~4 caracteres por token)
+TOOL_RESULT_MAX_CHARS = int(os.getenv('TOOL_RESULT_MAX_CHARS', '2000'))
+# Longitud máxima de la descripción de una cita en el formato compacto
+DESCRIPTION_MAX_CHARS = 80
+# Citas que devuelve como máximo una búsqueda y tamaño de cada página de events().list()
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', '25'))
+SEARCH_PAGE_SIZE = 50
+# Campos que se piden a la API en las búsquedas (los que usan format_events y el filtro por asistente)
+SEARCH_FIELDS = 'nextPageToken,items(id,summary,description,start,attendees(email))'
+# Límites de la verificación por correo (ventanas deslizantes, en segundos):
+# códigos enviados por correo y por conversación, y bloqueo tras N códigos incorrectos
+VERIFICATION_SEND_LIMIT = int(os.getenv('VERIFICATION_SEND_LIMIT', '3'))
+VERIFICATION_SESSION_SEND_LIMIT = int(os.getenv('VERIFICATION_SESSION_SEND_LIMIT', '5'))
+VERIFICATION_SEND_WINDOW = int(os.getenv('VERIFICATION_SEND_WINDOW', '900'))
+VERIFICATION_MAX_FAILURES = int(os.getenv('VERIFICATION_MAX_FAILURES', '3'))
+VERIFICATION_LOCKOUT = int(os.getenv('VERIFICATION_LOCKOUT', '900'))
 
 def get_calendar_service():
-    """Obtiene el servicio de Google Calendar."""
-    creds = None
-    # El archivo token.pickle almacena los tokens de acceso y actualización del usuario
-    if os.path.exists('credentials/token.pickle'):
-        with open('credentials/token.pickle', 'rb') as token:
-            creds = pickle.load(token)
-    
-    # Si no hay credenciales válidas disponibles, permite que el usuario inicie sesión
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                'credentials/credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        # Guarda las credenciales para la próxima ejecución
-        with open('credentials/token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
-
-    return build('calendar', 'v3', credentials=creds)
+    """Obtiene el servicio de Google Calendar (compartido por todo el proceso)."""
+    return service_registry.get('calendar', 'v3')
+
+async def aget_calendar_service():
+    """Como get_calendar_service(), pero si hay que refrescar el token lo hace fuera del bucle de eventos."""
+    if credential_manager.is_fresh():
+        return get_calendar_service()
+    return await asyncio.to_thread(get_calendar_service)
+
+def get_mirror():
+    """Espejo local del calendario (se sincroniza en segundo plano)."""
+    return get_calendar_mirror(get_calendar_service)
+
+def get_availability():
+    """Índice de horarios ocupados (freebusy) compartido por el proceso."""
+    return get_freebusy_index(get_calendar_service)
 
 def get_gmail_service():
-    """Obtiene el servicio de Gmail."""
+    """Obtiene el servicio de Gmail (compartido por todo el proceso)."""
     try:
-        creds = None
-        credentials_dir = '/app/credentials'
-        token_path = os.path.join(credentials_dir, 'token.pickle')
-        
-        # Verificar y crear directorios si no existen
-        os.makedirs(credentials_dir, mode=0o777, exist_ok=True)
-        
-        # Verificar permisos del directorio
-        try:
-            os.chmod(credentials_dir, 0o777)
-        except Exception as e:
-            print(f"Advertencia: No se pudieron establecer permisos en {credentials_dir}: {e}")
-        
-        if os.path.exists(token_path):
-            print(f"Leyendo token desde {token_path}")
-            try:
-                with open(token_path, 'rb') as token:
-                    creds = pickle.load(token)
-            except Exception as e:
-                print(f"Error leyendo token: {str(e)}")
-                creds = None
-        
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                print("Refrescando token expirado")
-                creds.refresh(Request())
-            else:
-                print("Generando nuevo token")
-                credentials_file = os.path.join(credentials_dir, 'credentials.json')
-                if not os.path.exists(credentials_file):
-                    raise FileNotFoundError(f"No se encuentra el archivo {credentials_file}")
-                
-                flow = InstalledAppFlow.from_client_secrets_file(credentials_file, SCOPES)
-                creds = flow.run_local_server(port=0)
-            
-            # Guardar el token directamente (sin usar archivo temporal)
-            print("Guardando nuevo token")
-            try:
-                with open(token_path, 'wb') as token:
-                    pickle.dump(creds, token)
-                    token.flush()
-                    os.fsync(token.fileno())
-                
-                # Intentar establecer permisos
-                try:
-                    os.chmod(token_path, 0o666)
-                except Exception as e:
-                    print(f"Advertencia: No se pudieron establecer permisos en {token_path}: {e}")
-                
-            except Exception as e:
-                print(f"Error guardando token: {str(e)}")
-                raise
-
-        return build('gmail', 'v1', credentials=creds)
-        
+        return service_registry.get('gmail', 'v1')
     except Exception as e:
-        print(f"Error en get_gmail_service: {str(e)}")
-        print(f"Estado del sistema:")
-        print(f"- Directorio actual: {os.getcwd()}")
-        print(f"- Usuario actual: {os.getuid()}:{os.getgid()}")
-        print(f"- Permisos del directorio credentials:")
-        try:
-            print(f"  {os.stat(credentials_dir)}")
-        except Exception as e:
-            print(f"  Error obteniendo permisos: {e}")
+        logger.error("Error en get_gmail_service: %s", e)
+        logger.debug("Directorio actual: %s, usuario: %s:%s", os.getcwd(), os.getuid(), os.getgid())
         raise
 
 def generate_verification_code():
@@ -126,65 +94,139 @@ def generate_verification_code():
     return ''.join(random.choices(string.digits, k=6))
 
 def save_verification_code(email: str, code: str):
-    """Guarda el código en el archivo YAML."""
-    try:
-        print(f"Iniciando guardado de código para {email}")
-        
-        config_dir = '/app/config'
-        verification_file = os.path.join(config_dir, 'verification_codes.yaml')
-        
-        # Asegurar que el directorio existe
-        os.makedirs(config_dir, mode=0o777, exist_ok=True)
-        
-        # Intentar establecer permisos del directorio
-        try:
-            os.chmod(config_dir, 0o777)
-        except Exception as e:
-            print(f"Advertencia: No se pudieron establecer permisos en {config_dir}: {e}")
-        
-        # Leer códigos existentes
-        codes = {}
-        if os.path.exists(verification_file):
-            try:
-                with open(verification_file, 'r') as f:
-                    codes = yaml.safe_load(f) or {}
-            except Exception as e:
-                print(f"Error leyendo archivo: {e}")
-                codes = {}
-        
-        # Preparar nuevo código
-        current = datetime.now(ZoneInfo('America/Bogota'))
-        codes[email] = {
-            'code': str(code),
-            'expires': (current + timedelta(minutes=10)).isoformat()
-        }
-        
-        # Guardar directamente (sin usar archivo temporal)
-        try:
-            with open(verification_file, 'w') as f:
-                yaml.dump(codes, f)
-                f.flush()
-                os.fsync(f.fileno())
+    """Guarda el código en el almacén de verificación (expira en 10 minutos)."""
+    get_verification_store().save(email, code)
+
+def build_verification_message(email: str, code: str):
+    """Cuerpo de la petición users().messages().send() con el código."""
+    message = MIMEText(f"""
+            Hola,
             
-            # Intentar establecer permisos
-            try:
-                os.chmod(verification_file, 0o666)
-            except Exception as e:
-                print(f"Advertencia: No se pudieron establecer permisos en {verification_file}: {e}")
-                
-        except Exception as e:
-            print(f"Error escribiendo archivo: {str(e)}")
-            raise
+            Tu código de verificación es: {code}
             
-    except Exception as e:
-        print(f"Error guardando código: {str(e)}")
-        print(f"Estado del sistema:")
-        print(f"- Directorio actual: {os.getcwd()}")
-        print(f"- Usuario actual: {os.getuid()}:{os.getgid()}")
-        print(f"- Contenido de /app/config: {os.listdir('/app/config')}")
+            Este código expirará en 10 minutos.
+            """)
+    
+    message['to'] = email
+    message['subject'] = 'Código de Verificación - Asistente Legal'
+    
+    return {'raw': base64.urlsafe_b64encode(message.as_bytes()).decode()}
+
+def get_email_outbox():
+    """Bandeja de salida de correos (la envía un worker en segundo plano)."""
+    return get_outbox(get_gmail_service)
+
+SEND_LIMIT_MESSAGE = ("Se alcanzó el límite de códigos de verificación para este cliente. "
+                      "Podrá pedir otro en {minutes} minutos.")
+VERIFY_LOCKED_MESSAGE = ("La verificación está bloqueada por demasiados intentos fallidos. "
+                         "El cliente podrá intentarlo de nuevo en {minutes} minutos.")
+ALREADY_SENT_MESSAGE = ("Ya se envió un código de verificación a este correo hace menos de un minuto. "
+                        "Pide al cliente que revise su bandeja de entrada y la carpeta de spam.")
+CODE_SENT_MESSAGE = "Código de verificación enviado exitosamente."
+
+def template_pattern(template: str):
+    """Expresión que reconoce un mensaje de la plantilla y captura sus minutos (la usa el router)."""
+    return re.compile(re.escape(template).replace(re.escape("{minutes}"), r"(\d+)"))
+
+SEND_LIMIT_PATTERN = template_pattern(SEND_LIMIT_MESSAGE)
+VERIFY_LOCKED_PATTERN = template_pattern(VERIFY_LOCKED_MESSAGE)
+
+def current_session():
+    """thread_id de la conversación que ejecuta la herramienta (None fuera del grafo)."""
+    config = var_child_runnable_config.get() or {}
+    return config.get('configurable', {}).get('thread_id')
+
+def verification_keys(prefix: str, email: str):
+    """Claves del limitador para el correo y, si la hay, la conversación."""
+    keys = [(f"{prefix}:email:{email.strip().lower()}", 'email')]
+    session = current_session()
+    if session is not None:
+        keys.append((f"{prefix}:session:{session}", 'session'))
+    return keys
+
+def minutes_left(seconds: float) -> int:
+    return max(1, int(-(-seconds // 60)))
+
+def send_rejection(email: str):
+    """
+    Mensaje de rechazo si el correo o la conversación ya pidieron demasiados
+    códigos (None si se permite). Un envío rechazado no cuenta en ningún límite.
+    """
+    limiter = get_rate_limiter()
+    limits = {'email': VERIFICATION_SEND_LIMIT, 'session': VERIFICATION_SESSION_SEND_LIMIT}
+    acquired = []
+    for key, scope in reversed(verification_keys('send', email)):
+        wait = limiter.acquire(key, limits[scope], VERIFICATION_SEND_WINDOW)
+        if wait:
+            release_send(acquired)
+            metrics.inc('verification_rejected_total', action='send', reason=scope)
+            return SEND_LIMIT_MESSAGE.format(minutes=minutes_left(wait))
+        acquired.append(key)
+    return None
+
+def release_send(keys):
+    """Devuelve los envíos registrados en `keys` que al final no mandaron ningún código."""
+    limiter = get_rate_limiter()
+    for key in keys:
+        limiter.release(key, VERIFICATION_SEND_WINDOW)
+
+def verify_rejection(email: str):
+    """
+    Mensaje de bloqueo si el correo o la conversación superaron los intentos
+    fallidos (None si no). Si se permite, el intento ya cuenta como fallo: la
+    comprobación y el registro son una sola operación del limitador, para que
+    varios códigos enviados a la vez no pasen todos antes del bloqueo.
+    """
+    limiter = get_rate_limiter()
+    attempted = []
+    for key, scope in verification_keys('verify', email):
+        wait = limiter.attempt(key, VERIFICATION_MAX_FAILURES, VERIFICATION_LOCKOUT, VERIFICATION_LOCKOUT)
+        if wait:
+            release_verify(attempted)
+            metrics.inc('verification_rejected_total', action='verify', reason=scope)
+            return VERIFY_LOCKED_MESSAGE.format(minutes=minutes_left(wait))
+        attempted.append(key)
+    return None
+
+def release_verify(keys):
+    """Devuelve los intentos registrados en `keys` que al final no compararon ningún código."""
+    limiter = get_rate_limiter()
+    for key in keys:
+        limiter.release(key, VERIFICATION_LOCKOUT)
+
+def issue_verification_code(email: str) -> str:
+    """Genera, guarda y encola un código de verificación (lo usan las dos versiones de la herramienta)."""
+    # Límite de envíos antes de tocar SQLite o Gmail: rechazar no cuesta I/O
+    rejection = send_rejection(email)
+    if rejection:
+        return rejection
+
+    try:
+        outbox = get_email_outbox()
+
+        # No enviar otro código si acabamos de enviar uno (el anterior dejaría de valer)
+        if outbox.recently_queued(email):
+            release_send(key for key, _ in verification_keys('send', email))
+            return ALREADY_SENT_MESSAGE
+
+        # Generar código
+        # El código nunca se escribe en los logs: solo va en el correo
+        code = generate_verification_code()
+
+        # Guardar código
+        save_verification_code(email, code)
+
+        # Encolar el correo: el worker de la bandeja de salida lo envía y reintenta si Gmail falla
+        outbox.enqueue(email, build_verification_message(email, code))
+    except Exception:
+        logger.exception("Error en send_verification_code")
+        # Sin código enviado, el intento no cuenta para los límites
+        release_send(key for key, _ in verification_keys('send', email))
         raise
+    return CODE_SENT_MESSAGE
 
 @tool
+@limit_concurrency(GMAIL_TOOL_CONCURRENCY)
 def send_verification_code(email: str) -> str:
     """
     Genera, guarda y envía un código de verificación.
@@ -193,136 +235,178 @@ def send_verification_code(email: str) -> str:
     Returns:
         str: Mensaje de confirmación
     """
+    return issue_verification_code(email)
+
+@limit_concurrency(GMAIL_TOOL_CONCURRENCY)
+async def asend_verification_code(email: str) -> str:
+    # Solo toca SQLite (el envío lo hace el worker): basta con sacarlo del bucle de eventos
+    return await asyncio.to_thread(issue_verification_code, email)
+
+def check_verification_code(email: str, code: str) -> bool | str:
+    """Consume el código y lleva la cuenta de intentos fallidos (lo usan las dos versiones de la herramienta)."""
+    # Bloqueo tras VERIFICATION_MAX_FAILURES códigos incorrectos, comprobado antes de leer el almacén
+    rejection = verify_rejection(email)
+    if rejection:
+        return rejection
+    keys = [key for key, _ in verification_keys('verify', email)]
     try:
-        print(f"Iniciando proceso de envío de código para {email}")
-        
-        # Generar código
-        code = generate_verification_code()
-        print(f"Código generado: {code}")
-        
-        # Verificar permisos del directorio
-        config_dir = '/app/config'
-        print(f"Verificando permisos de {config_dir}")
-        print(f"Permisos actuales: {oct(os.stat(config_dir).st_mode)}")
-        
-        # Guardar código
-        try:
-            save_verification_code(email, code)
-            print("Código guardado exitosamente")
-        except Exception as e:
-            print(f"Error guardando código: {str(e)}")
-            print(f"Stack trace completo:", exc_info=True)
-            raise
-        
-        # Verificar si el archivo existe y sus permisos
-        if os.path.exists(VERIFICATION_FILE):
-            print(f"Archivo existe, permisos: {oct(os.stat(VERIFICATION_FILE).st_mode)}")
-        else:
-            print("El archivo no existe después de intentar guardarlo")
-        
-        # Enviar correo
-        try:
-            service = get_gmail_service()
-            message = MIMEText(f"""
-            Hola,
-            
-            Tu código de verificación es: {code}
-            
-            Este código expirará en 10 minutos.
-            """)
-            
-            message['to'] = email
-            message['subject'] = 'Código de Verificación - Asistente Legal'
-            
-            create_message = {'raw': base64.urlsafe_b64encode(message.as_bytes()).decode()}
-            
-            try:
-                service.users().messages().send(userId="me", body=create_message).execute()
-                print("Correo enviado exitosamente")
-                return "Código de verificación enviado exitosamente."
-            except Exception as e:
-                print(f"Error enviando correo: {str(e)}")
-                raise
-                
-        except Exception as e:
-            print(f"Error con el servicio de Gmail: {str(e)}")
-            raise
-            
+        # Compara y elimina en una sola operación: un código solo se acepta una vez
+        valid = get_verification_store().consume(email, str(code).strip())
     except Exception as e:
-        print(f"Error general en send_verification_code: {str(e)}")
-        raise
+        logger.warning("Error verificando código: %s", e)
+        # Sin código comparado, el intento no cuenta como fallo
+        release_verify(keys)
+        return False
+    # Un código incorrecto ya quedó contado en verify_rejection
+    if valid:
+        limiter = get_rate_limiter()
+        for key in keys:
+            limiter.reset(key)
+    return valid
 
 @tool
-def verify_code(email: str, code: str) -> bool:
+def verify_code(email: str, code: str) -> bool | str:
     """
     Verifica si el código proporcionado es válido.
     Args:
         email (str): Correo del cliente
         code (str): Código a verificar
     Returns:
-        bool: True si el código es válido
+        bool: True si el código es válido (o un mensaje si la verificación está bloqueada)
     """
-    try:
-        if not os.path.exists(VERIFICATION_FILE):
-            print("Archivo de verificación no existe")
-            return False
-            
-        with open(VERIFICATION_FILE, 'r') as f:
-            # Adquirir bloqueo compartido
-            fcntl.flock(f.fileno(), fcntl.LOCK_SH)
-            try:
-                codes = yaml.safe_load(f) or {}
-            finally:
-                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
-        
-        if email not in codes:
-            print(f"No hay código para {email}")
-            return False
-            
-        stored = codes[email]
-        expiry = datetime.fromisoformat(stored['expires'])
-        
-        # Usar la misma zona horaria que usamos al guardar
-        current = datetime.now(ZoneInfo('America/Bogota'))
-        
-        if current > expiry:
-            print(f"Código expirado. Expira: {expiry}, Actual: {current}")
-            # Limpiar código expirado
-            del codes[email]
-            with open(VERIFICATION_FILE, 'w') as f:
-                # Adquirir bloqueo exclusivo
-                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
-                try:
-                    yaml.dump(codes, f)
-                finally:
-                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
-            return False
-            
-        # Asegurar que ambos sean strings
-        stored_code = str(stored['code'])
-        input_code = str(code)
-        
-        # Comparación exacta
-        is_valid = stored_code == input_code
-        # print(f"Comparando códigos: almacenado='{stored_code}' vs ingresado='{input_code}' -> {is_valid}")
-        
-        # Si es válido, limpiar el código usado
-        if is_valid:
-            del codes[email]
-            with open(VERIFICATION_FILE, 'w') as f:
-                # Adquirir bloqueo exclusivo
-                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    return check_verification_code(email, code)
+
+async def averify_code(email: str, code: str) -> bool | str:
+    return await asyncio.to_thread(check_verification_code, email, code)
+
+SLOT_TAKEN_MESSAGE = "Ese horario ya está ocupado. Consulta los horarios disponibles con find_available_slots."
+OFFICE_HOURS_MESSAGE = "Las citas solo se pueden agendar entre las 9:00 AM y las 5:00 PM"
+
+def outside_office_hours(time: str) -> bool:
+    hour = int(time.split(':')[0])
+    return hour < 9 or hour >= 17
+
+def bogota_slot(event_datetime):
+    """Intervalo [inicio, fin) de la cita de una hora que empieza en event_datetime (hora de Bogotá)."""
+    slot_start = event_datetime.replace(tzinfo=ZoneInfo('America/Bogota'))
+    return slot_start, slot_start + timedelta(hours=1)
+
+def build_event(event_datetime, client_name: str, client_email: str, reason: str):
+    return {
+        'summary': f'Cita con {client_name}',
+        'description': f'Motivo: {reason}\nCorreo: {client_email}',
+        'start': {
+            'dateTime': event_datetime.isoformat(),
+            'timeZone': 'America/Bogota',
+        },
+        'end': {
+            'dateTime': (event_datetime + timedelta(hours=1)).isoformat(),
+            'timeZone': 'America/Bogota',
+        },
+        'attendees': [
+            {'email': client_email}
+        ],
+        'reminders': {
+            'useDefault': False,
+            'overrides': [
+                {'method': 'email', 'minutes': 24 * 60},  # 24 horas antes
+                {'method': 'popup', 'minutes': 30}        # 30 minutos antes
+            ]
+        }
+    }
+
+def is_event_owner(event, client_email: str) -> bool:
+    """El correo debe aparecer en la descripción o entre los asistentes de la cita."""
+    description = event.get('description', '')
+    attendees = event.get('attendees', [])
+    email_in_description = f"Correo: {client_email}" in description
+    email_in_attendees = any(att.get('email') == client_email for att in attendees)
+    return email_in_description or email_in_attendees
+
+def new_schedule(event, new_date: str = None, new_time: str = None):
+    """Fecha y hora resultantes de cambiar solo lo indicado: (fecha, hora, datetime)."""
+    start = datetime.fromisoformat(event['start']['dateTime'])
+    date_to_use = new_date if new_date else start.strftime("%d/%m/%Y")
+    time_to_use = new_time if new_time else start.strftime("%H:%M")
+    return date_to_use, time_to_use, datetime.strptime(f"{date_to_use} {time_to_use}", "%d/%m/%Y %H:%M")
+
+def other_bookings(busy, event):
+    """Intervalos ocupados sin contar el horario actual de la propia cita."""
+    old_start, old_end = parse_event_time(event, 'start'), parse_event_time(event, 'end')
+    return [(s, e) for s, e in busy if not (s >= old_start and e <= old_end)]
+
+def reschedule(event, new_datetime):
+    event['start']['dateTime'] = new_datetime.isoformat()
+    event['end']['dateTime'] = (new_datetime + timedelta(hours=1)).isoformat()
+    return event
+
+def record_update(old_event, updated_event, slot_start, slot_end):
+    get_mirror().upsert(updated_event)
+    get_availability().remove_busy(parse_event_time(old_event, 'start'), parse_event_time(old_event, 'end'))
+    get_availability().add_busy(slot_start, slot_end)
+
+def record_cancellation(event):
+    get_mirror().remove(event['id'])
+    old_start, old_end = parse_event_time(event, 'start'), parse_event_time(event, 'end')
+    if old_start and old_end:
+        get_availability().remove_busy(old_start, old_end)
+
+MODIFIED_MESSAGE = "¡Cita modificada exitosamente! Nuevo horario: {date} a las {time}"
+CANCELLED_MESSAGE = "¡Cita cancelada exitosamente! 🗑️ Si necesitas reagendar, ¡estoy aquí para ayudarte! 😊"
+
+def guarded(action: str, verified: bool = False):
+    """
+    Comprobaciones comunes de una herramienta y de su versión asíncrona: con
+    verified=True exige is_verified, y cualquier excepción se devuelve al agente
+    como "Error al {action}: ...". Va debajo de @tool y de limit_concurrency.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def rejection(args, kwargs):
+            if verified and not signature.bind(*args, **kwargs).arguments.get('is_verified', False):
+                return f"Se requiere verificación para {action}"
+            return None
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                message = rejection(args, kwargs)
+                if message:
+                    return message
                 try:
-                    yaml.dump(codes, f)
-                finally:
-                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
-            
-        return is_valid
-    except Exception as e:
-        print(f"Error verificando código: {e}")
-        return False
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    return f"Error al {action}: {str(e)}"
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            message = rejection(args, kwargs)
+            if message:
+                return message
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                return f"Error al {action}: {str(e)}"
+        return wrapper
+    return decorator
+
+def booking_slot(date: str, time: str):
+    """Mensaje de rechazo si la hora está fuera del horario de atención, o (datetime, inicio, fin)."""
+    if outside_office_hours(time):
+        return OFFICE_HOURS_MESSAGE
+    event_datetime = datetime.strptime(f"{date} {time}", "%d/%m/%Y %H:%M")
+    return (event_datetime, *bogota_slot(event_datetime))
+
+def record_creation(event, slot_start, slot_end):
+    get_mirror().upsert(event)
+    get_availability().add_busy(slot_start, slot_end)
+    return f"Cita agendada exitosamente. Enlace: {event.get('htmlLink')}"
 
 @tool
+@limit_concurrency(CALENDAR_TOOL_CONCURRENCY)
+@guarded("agendar la cita", verified=True)
 def create_calendar_event(date: str, time: str, client_name: str, client_email: str, reason: str, is_verified: bool = False) -> str:
     """
     Agenda una cita si está verificada.
@@ -336,48 +420,123 @@ def create_calendar_event(date: str, time: str, client_name: str, client_email:
     Returns:
         str: Resultado de la operación
     """
-    if not is_verified:
-        return "Se requiere verificación para agendar la cita"
-        
-    try:
-        # Validar horario
-        hour = int(time.split(':')[0])
-        if hour < 9 or hour >= 17:
-            return "Las citas solo se pueden agendar entre las 9:00 AM y las 5:00 PM"
-            
-        # Crear evento
-        event_datetime = datetime.strptime(f"{date} {time}", "%d/%m/%Y %H:%M")
-        
-        service = get_calendar_service()
-        event = {
-            'summary': f'Cita con {client_name}',
-            'description': f'Motivo: {reason}\nCorreo: {client_email}',
-            'start': {
-                'dateTime': event_datetime.isoformat(),
-                'timeZone': 'America/Bogota',
-            },
-            'end': {
-                'dateTime': (event_datetime + timedelta(hours=1)).isoformat(),
-                'timeZone': 'America/Bogota',
-            },
-            'attendees': [
-                {'email': client_email}
-            ],
-            'reminders': {
-                'useDefault': False,
-                'overrides': [
-                    {'method': 'email', 'minutes': 24 * 60},  # 24 horas antes
-                    {'method': 'popup', 'minutes': 30}        # 30 minutos antes
-                ]
-            }
-        }
-        
-        event = service.events().insert(calendarId='primary', body=event, sendUpdates='all').execute()
-        return f"Cita agendada exitosamente. Enlace: {event.get('htmlLink')}"
-    except Exception as e:
-        return f"Error al agendar la cita: {str(e)}"
+    slot = booking_slot(date, time)
+    if isinstance(slot, str):
+        return slot
+    event_datetime, slot_start, slot_end = slot
+    # Rechazar choques de horario antes de llamar a la API
+    if not get_availability().is_free(slot_start, slot_end):
+        return SLOT_TAKEN_MESSAGE
+
+    service = get_calendar_service()
+    event = build_event(event_datetime, client_name, client_email, reason)
+    event = service.events().insert(calendarId='primary', body=event, sendUpdates='all').execute()
+    return record_creation(event, slot_start, slot_end)
+
+@limit_concurrency(CALENDAR_TOOL_CONCURRENCY)
+@guarded("agendar la cita", verified=True)
+async def acreate_calendar_event(date: str, time: str, client_name: str, client_email: str, reason: str, is_verified: bool = False) -> str:
+    slot = booking_slot(date, time)
+    if isinstance(slot, str):
+        return slot
+    event_datetime, slot_start, slot_end = slot
+    if not await get_availability().ais_free(slot_start, slot_end):
+        return SLOT_TAKEN_MESSAGE
+
+    service = await aget_calendar_service()
+    event = build_event(event_datetime, client_name, client_email, reason)
+    event = await aexecute(service.events().insert(calendarId='primary', body=event, sendUpdates='all'))
+    return record_creation(event, slot_start, slot_end)
+
+def reschedule_checks(event, client_email, new_date, new_time):
+    """Validaciones de una reprogramación sin consultar la agenda: mensaje de rechazo o el nuevo horario."""
+    if not is_event_owner(event, client_email):
+        return "No tienes permiso para modificar esta cita"
+    if not (new_date or new_time):
+        return "No se especificaron cambios para la cita"
+    date_to_use, time_to_use, _ = new_schedule(event, new_date, new_time)
+    slot = booking_slot(date_to_use, time_to_use)
+    if isinstance(slot, str):
+        return slot
+    return (date_to_use, time_to_use, *slot)
+
+def reschedule_request(service, event, schedule, taken):
+    """
+    patch con el nuevo horario (solo start/end) condicionado al ETag de la cita.
+    `taken` reparte los horarios entre las citas de una misma operación.
+    """
+    date_to_use, time_to_use, new_datetime, slot_start, slot_end = schedule
+    if taken.setdefault(slot_start, event['id']) != event['id']:
+        return SLOT_TAKEN_MESSAGE
+    changes = reschedule({'start': dict(event['start']), 'end': dict(event['end'])}, new_datetime)
+    request = if_match(service.events().patch(calendarId='primary', eventId=event['id'], body=changes), event)
+
+    def done(updated_event):
+        record_update(event, updated_event, slot_start, slot_end)
+        return MODIFIED_MESSAGE.format(date=date_to_use, time=time_to_use)
+    return request, done
+
+def reschedule_plan(service, client_email, changes):
+    """plan() de calendar_mutations.apply para reprogramar; changes: {id: (nueva fecha, nueva hora)}."""
+    taken = {}
+
+    def plan(event):
+        schedule = reschedule_checks(event, client_email, *changes[event['id']])
+        if isinstance(schedule, str):
+            return schedule
+        # Rechazar choques con otras citas (el horario actual de esta cita no cuenta)
+        if other_bookings(get_availability().busy_between(schedule[3], schedule[4]), event):
+            return SLOT_TAKEN_MESSAGE
+        return reschedule_request(service, event, schedule, taken)
+    return plan
+
+def areschedule_plan(service, client_email, changes):
+    taken = {}
+
+    async def plan(event):
+        schedule = reschedule_checks(event, client_email, *changes[event['id']])
+        if isinstance(schedule, str):
+            return schedule
+        if other_bookings(await get_availability().abusy_between(schedule[3], schedule[4]), event):
+            return SLOT_TAKEN_MESSAGE
+        return reschedule_request(service, event, schedule, taken)
+    return plan
+
+def cancel_plan(service, client_email):
+    """plan() de calendar_mutations.apply para cancelar: delete condicionado al ETag de la cita."""
+    def plan(event):
+        if not is_event_owner(event, client_email):
+            return "No tienes permiso para cancelar esta cita"
+        request = if_match(service.events().delete(calendarId='primary', eventId=event['id']), event)
+
+        def done(_):
+            record_cancellation(event)
+            return CANCELLED_MESSAGE
+        return request, done
+    return plan
+
+def parse_changes(changes):
+    """[{event_id, new_date, new_time}] del agente -> {id: (fecha, hora)}; las entradas sin id se ignoran."""
+    return {
+        str(change['event_id']): (change.get('new_date'), change.get('new_time'))
+        for change in changes if isinstance(change, dict) and change.get('event_id')
+    }
+
+def format_outcome(outcome, action):
+    return f"Error al {action} la cita: {str(outcome)}" if isinstance(outcome, Exception) else outcome
+
+def format_outcomes(outcomes, action):
+    """Un resultado por cita, para que el agente sepa cuáles se cambiaron y cuáles no."""
+    if not outcomes:
+        return "No se indicaron citas"
+    return "\n".join(f"{event_id}: {format_outcome(outcome, action)}" for event_id, outcome in outcomes.items())
+
+def unique_ids(event_ids):
+    return list(dict.fromkeys(str(event_id) for event_id in event_ids))
 
 @tool
+@limit_concurrency(CALENDAR_TOOL_CONCURRENCY)
+@guarded("modificar la cita", verified=True)
 def modify_calendar_event(event_id: str, client_email: str, new_date: str = None, new_time: str = None, is_verified: bool = False) -> str:
     """
     Modifica una cita existente.
@@ -390,62 +549,50 @@ def modify_calendar_event(event_id: str, client_email: str, new_date: str = None
     Returns:
         str: Resultado de la operación
     """
-    if not is_verified:
-        return "Se requiere verificación para modificar la cita"
-        
-    try:
-        service = get_calendar_service()
-        
-        # Obtener evento
-        try:
-            event = service.events().get(calendarId='primary', eventId=event_id).execute()
-        except Exception:
-            return "No se encontró la cita especificada"
-            
-        # Verificar que el correo coincida
-        description = event.get('description', '')
-        attendees = event.get('attendees', [])
-        email_in_description = f"Correo: {client_email}" in description
-        email_in_attendees = any(att.get('email') == client_email for att in attendees)
-        
-        if not (email_in_description or email_in_attendees):
-            return "No tienes permiso para modificar esta cita"
-            
-        if new_date or new_time:
-            # Obtener fecha y hora actuales del evento
-            start = datetime.fromisoformat(event['start']['dateTime'])
-            current_date = start.strftime("%d/%m/%Y")
-            current_time = start.strftime("%H:%M")
-            
-            # Actualizar fecha y/o hora
-            date_to_use = new_date if new_date else current_date
-            time_to_use = new_time if new_time else current_time
-            
-            # Validar horario
-            hour = int(time_to_use.split(':')[0])
-            if hour < 9 or hour >= 17:
-                return "Las citas solo se pueden agendar entre las 9:00 AM y las 5:00 PM"
-                
-            # Convertir a datetime
-            new_datetime = datetime.strptime(f"{date_to_use} {time_to_use}", "%d/%m/%Y %H:%M")
-            
-            # Actualizar evento
-            event['start']['dateTime'] = new_datetime.isoformat()
-            event['end']['dateTime'] = (new_datetime + timedelta(hours=1)).isoformat()
-            
-            updated_event = service.events().update(
-                calendarId='primary',
-                eventId=event_id,
-                body=event
-            ).execute()
-            
-            return f"¡Cita modificada exitosamente! Nuevo horario: {date_to_use} a las {time_to_use}"
-        else:
-            return "No se especificaron cambios para la cita"
-    except Exception as e:
-        return f"Error al modificar la cita: {str(e)}"
+    # La cita sale del espejo local si la conoce (si no, se lee de la API) y se
+    # cambia con un patch condicionado a su ETag (ver calendar_mutations.py)
+    service = get_calendar_service()
+    plan = reschedule_plan(service, client_email, {event_id: (new_date, new_time)})
+    return format_outcome(calendar_mutations.apply(service, get_mirror(), [event_id], plan)[event_id], "modificar")
+
+@limit_concurrency(CALENDAR_TOOL_CONCURRENCY)
+@guarded("modificar la cita", verified=True)
+async def amodify_calendar_event(event_id: str, client_email: str, new_date: str = None, new_time: str = None, is_verified: bool = False) -> str:
+    service = await aget_calendar_service()
+    plan = areschedule_plan(service, client_email, {event_id: (new_date, new_time)})
+    outcomes = await calendar_mutations.aapply(service, get_mirror(), [event_id], plan)
+    return format_outcome(outcomes[event_id], "modificar")
+
+@tool
+@limit_concurrency(CALENDAR_TOOL_CONCURRENCY)
+@guarded("modificar las citas", verified=True)
+def modify_calendar_events(changes: list[dict], client_email: str, is_verified: bool = False) -> str:
+    """
+    Reprograma varias citas del mismo cliente en una sola operación.
+    Args:
+        changes (list): Cambios, cada uno {"event_id": ..., "new_date": "DD/MM/YYYY", "new_time": "HH:MM"}
+            (new_date y new_time son opcionales)
+        client_email (str): Correo del cliente
+        is_verified (bool): Si el cliente está verificado
+    Returns:
+        str: Resultado de cada cita, una por línea
+    """
+    service = get_calendar_service()
+    changes = parse_changes(changes)
+    plan = reschedule_plan(service, client_email, changes)
+    return format_outcomes(calendar_mutations.apply(service, get_mirror(), list(changes), plan), "modificar")
+
+@limit_concurrency(CALENDAR_TOOL_CONCURRENCY)
+@guarded("modificar las citas", verified=True)
+async def amodify_calendar_events(changes: list[dict], client_email: str, is_verified: bool = False) -> str:
+    service = await aget_calendar_service()
+    changes = parse_changes(changes)
+    plan = areschedule_plan(service, client_email, changes)
+    return format_outcomes(await calendar_mutations.aapply(service, get_mirror(), list(changes), plan), "modificar")
 
 @tool
+@limit_concurrency(CALENDAR_TOOL_CONCURRENCY)
+@guarded("cancelar la cita", verified=True)
 def cancel_calendar_event(event_id: str, client_email: str, is_verified: bool = False) -> str:
     """
     Cancela una cita existente.
@@ -456,80 +603,246 @@ def cancel_calendar_event(event_id: str, client_email: str, is_verified: bool =
     Returns:
         str: Resultado de la operación
     """
-    if not is_verified:
-        return "Se requiere verificación para cancelar la cita"
-        
-    try:
-        service = get_calendar_service()
-        
-        # Obtener evento
-        try:
-            event = service.events().get(calendarId='primary', eventId=event_id).execute()
-        except Exception:
-            return "No se encontró la cita especificada"
-            
-        # Verificar que el correo coincida
-        description = event.get('description', '')
-        attendees = event.get('attendees', [])
-        email_in_description = f"Correo: {client_email}" in description
-        email_in_attendees = any(att.get('email') == client_email for att in attendees)
-        
-        if not (email_in_description or email_in_attendees):
-            return "No tienes permiso para cancelar esta cita"
-            
-        # Cancelar evento
-        service.events().delete(calendarId='primary', eventId=event_id).execute()
-        return "¡Cita cancelada exitosamente! 🗑️ Si necesitas reagendar, ¡estoy aquí para ayudarte! 😊"
-    except Exception as e:
-        return f"Error al cancelar la cita: {str(e)}"
+    service = get_calendar_service()
+    outcomes = calendar_mutations.apply(service, get_mirror(), [event_id], cancel_plan(service, client_email))
+    return format_outcome(outcomes[event_id], "cancelar")
+
+@limit_concurrency(CALENDAR_TOOL_CONCURRENCY)
+@guarded("cancelar la cita", verified=True)
+async def acancel_calendar_event(event_id: str, client_email: str, is_verified: bool = False) -> str:
+    service = await aget_calendar_service()
+    outcomes = await calendar_mutations.aapply(service, get_mirror(), [event_id], cancel_plan(service, client_email))
+    return format_outcome(outcomes[event_id], "cancelar")
 
 @tool
-def search_calendar_event(query: str = None, time_min: str = None) -> str:
+@limit_concurrency(CALENDAR_TOOL_CONCURRENCY)
+@guarded("cancelar las citas", verified=True)
+def cancel_calendar_events(event_ids: list[str], client_email: str, is_verified: bool = False) -> str:
+    """
+    Cancela varias citas del mismo cliente (por ejemplo una serie) en una sola operación.
+    Args:
+        event_ids (list): IDs de los eventos a cancelar
+        client_email (str): Correo del cliente
+        is_verified (bool): Si el cliente está verificado
+    Returns:
+        str: Resultado de cada cita, una por línea
+    """
+    service = get_calendar_service()
+    outcomes = calendar_mutations.apply(service, get_mirror(), unique_ids(event_ids), cancel_plan(service, client_email))
+    return format_outcomes(outcomes, "cancelar")
+
+@limit_concurrency(CALENDAR_TOOL_CONCURRENCY)
+@guarded("cancelar las citas", verified=True)
+async def acancel_calendar_events(event_ids: list[str], client_email: str, is_verified: bool = False) -> str:
+    service = await aget_calendar_service()
+    outcomes = await calendar_mutations.aapply(service, get_mirror(), unique_ids(event_ids), cancel_plan(service, client_email))
+    return format_outcomes(outcomes, "cancelar")
+
+def parse_window(time_min, time_max):
+    """Fechas DD/MM/YYYY -> [inicio del primer día, fin del último día) en hora de Bogotá."""
+    bogota = ZoneInfo('America/Bogota')
+    start = datetime.strptime(time_min, "%d/%m/%Y").replace(tzinfo=bogota) if time_min else None
+    end = datetime.strptime(time_max, "%d/%m/%Y").replace(tzinfo=bogota) + timedelta(days=1) if time_max else None
+    return start, end
+
+def search_params(query, time_min_obj, time_max_obj=None, attendee=None):
+    """Parámetros de events().list() cuando la búsqueda va a la API."""
+    params = {
+        'calendarId': 'primary',
+        'maxResults': SEARCH_PAGE_SIZE,
+        'singleEvents': True,
+        'orderBy': 'startTime',
+        'fields': SEARCH_FIELDS,
+    }
+    # La búsqueda de texto de Calendar también mira los correos de los asistentes:
+    # con el correo en `q` la API ya devuelve solo (casi) las citas del cliente
+    terms = " ".join(term for term in (query, attendee) if term)
+    if terms:
+        params['q'] = terms
+    if time_min_obj:
+        params['timeMin'] = time_min_obj.isoformat()
+    if time_max_obj:
+        params['timeMax'] = time_max_obj.isoformat()
+    return params
+
+def has_attendee(event, email):
+    email = email.lower()
+    return any(att.get('email', '').lower() == email for att in event.get('attendees', []))
+
+def iter_events(service, params):
+    """Eventos de events().list() página a página: la siguiente solo se pide si se sigue iterando."""
+    page_token = None
+    while True:
+        request_params = dict(params, pageToken=page_token) if page_token else params
+        page = service.events().list(**request_params).execute()
+        yield from page.get('items', [])
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            return
+
+async def aiter_events(service, params):
+    page_token = None
+    while True:
+        request_params = dict(params, pageToken=page_token) if page_token else params
+        page = await aexecute(service.events().list(**request_params))
+        for event in page.get('items', []):
+            yield event
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            return
+
+def result_format(tool_name):
+    return TOOL_RESULT_FORMATS.get(tool_name, TOOL_RESULT_FORMAT)
+
+def short_datetime(value):
+    """'2025-03-10T15:00:00-05:00' -> '10/03 15:00' (hora de Bogotá); las fechas sin hora -> '10/03'."""
+    if 'T' not in value:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%d/%m")
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(ZoneInfo('America/Bogota'))
+    return moment.strftime("%d/%m %H:%M")
+
+def compact_field(text, limit=None):
+    """Texto en una sola línea, sin el separador '|' y recortado a `limit` caracteres."""
+    text = " ".join(str(text).replace('|', '/').split())
+    if limit and len(text) > limit:
+        text = text[:limit - 1].rstrip() + "…"
+    return text
+
+def format_events(events, style=None, more=False):
+    if not events:
+        return "No se encontraron citas."
+    if more:
+        # Se pidió una cita más que el máximo para saber si la lista está completa
+        return format_events(events[:SEARCH_MAX_RESULTS], style) + (
+            f"\nHay más de {SEARCH_MAX_RESULTS} citas: acota la búsqueda por fechas o por correo.")
+
+    if (style or result_format('search_calendar_event')) == 'compact':
+        lines = [f"{len(events)} citas (id|inicio|titulo|descripcion):"]
+        for event in events:
+            start = event['start'].get('dateTime', event['start'].get('date'))
+            lines.append("|".join([
+                event['id'],
+                short_datetime(start),
+                compact_field(event.get('summary', '')),
+                compact_field(event.get('description', '-'), DESCRIPTION_MAX_CHARS),
+            ]))
+        return "\n".join(lines)
+
+    formatted_events = []
+    for event in events:
+        start = event['start'].get('dateTime', event['start'].get('date'))
+        formatted_events.append({
+            'id': event['id'],
+            'titulo': event.get('summary', ''),
+            'inicio': start,
+            'descripcion': event.get('description', 'Sin descripción')
+        })
+        
+    return json.dumps(formatted_events, indent=2, ensure_ascii=False)
+
+def mirror_search(query, time_min_obj, time_max_obj, client_email):
+    """Búsqueda en el espejo local; None si no está listo o está desactualizado."""
+    return get_mirror().search(query=query, time_min=time_min_obj, time_max=time_max_obj,
+                               max_results=SEARCH_MAX_RESULTS + 1, attendee=client_email)
+
+def add_match(events, event, client_email):
+    """Añade la cita si es del cliente; True cuando ya hay una más que el máximo y se puede parar."""
+    if not client_email or has_attendee(event, client_email):
+        events.append(event)
+    return len(events) > SEARCH_MAX_RESULTS
+
+def format_search(events):
+    return format_events(events, more=len(events) > SEARCH_MAX_RESULTS)
+
+@tool
+@limit_concurrency(CALENDAR_TOOL_CONCURRENCY)
+@guarded("buscar citas")
+def search_calendar_event(query: str = None, time_min: str = None, time_max: str = None,
+                          client_email: str = None) -> str:
     """
     Busca citas en Google Calendar.
     Args:
         query (str, optional): Texto a buscar en los eventos
-        time_min (str, optional): Fecha mínima en formato DD/MM/YYYY
+        time_min (str, optional): Primer día de la búsqueda (DD/MM/YYYY)
+        time_max (str, optional): Último día de la búsqueda, incluido (DD/MM/YYYY)
+        client_email (str, optional): Solo las citas a las que asiste este correo
     Returns:
         str: Lista de citas encontradas
     """
-    try:
-        service = get_calendar_service()
-        
-        # Parámetros de búsqueda
-        params = {
-            'calendarId': 'primary',
-            'maxResults': 10,
-            'singleEvents': True,
-            'orderBy': 'startTime'
-        }
-        
-        if query:
-            params['q'] = query
-            
-        if time_min:
-            time_min_obj = datetime.strptime(time_min, "%d/%m/%Y")
-            params['timeMin'] = time_min_obj.isoformat() + 'Z'
+    # Primero el espejo local; si no sirve, la API página a página
+    time_min_obj, time_max_obj = parse_window(time_min, time_max)
+    events = mirror_search(query, time_min_obj, time_max_obj, client_email)
+    if events is None:
+        events = []
+        params = search_params(query, time_min_obj, time_max_obj, client_email)
+        for event in iter_events(get_calendar_service(), params):
+            if add_match(events, event, client_email):
+                break
+    return format_search(events)
 
-        events_result = service.events().list(**params).execute()
-        events = events_result.get('items', [])
+@limit_concurrency(CALENDAR_TOOL_CONCURRENCY)
+@guarded("buscar citas")
+async def asearch_calendar_event(query: str = None, time_min: str = None, time_max: str = None,
+                                 client_email: str = None) -> str:
+    time_min_obj, time_max_obj = parse_window(time_min, time_max)
+    events = mirror_search(query, time_min_obj, time_max_obj, client_email)
+    if events is None:
+        events = []
+        params = search_params(query, time_min_obj, time_max_obj, client_email)
+        async for event in aiter_events(await aget_calendar_service(), params):
+            if add_match(events, event, client_email):
+                break
+    return format_search(events)
 
-        if not events:
-            return "No se encontraron citas."
-            
-        formatted_events = []
-        for event in events:
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            formatted_events.append({
-                'id': event['id'],
-                'titulo': event['summary'],
-                'inicio': start,
-                'descripcion': event.get('description', 'Sin descripción')
-            })
-            
-        return json.dumps(formatted_events, indent=2, ensure_ascii=False)
-    except Exception as e:
-        return f"Error al buscar citas: {str(e)}"
+def format_slots(slots):
+    if not slots:
+        return "No se encontraron horarios disponibles."
+    return "\n".join(
+        f"{DIAS_SEMANA[slot.weekday()]} {slot.strftime('%d/%m/%Y %H:%M')}" for slot in slots
+    )
+
+def slot_query(count: int, from_date: str = None):
+    """Argumentos de find_available_slots -> (cantidad entre 1 y 20, desde cuándo o None)."""
+    after = None
+    if from_date:
+        after = datetime.strptime(from_date, "%d/%m/%Y").replace(tzinfo=ZoneInfo('America/Bogota'))
+    return max(1, min(count, 20)), after
+
+@tool
+@limit_concurrency(CALENDAR_TOOL_CONCURRENCY)
+@guarded("buscar horarios disponibles")
+def find_available_slots(count: int = 5, from_date: str = None) -> str:
+    """
+    Busca los próximos horarios libres para una cita de una hora
+    (lunes a viernes, 9:00 AM a 5:00 PM, hora de Bogotá).
+    Args:
+        count (int, optional): Cantidad de horarios a devolver (máximo 20)
+        from_date (str, optional): Fecha desde la cual buscar (DD/MM/YYYY)
+    Returns:
+        str: Lista de horarios disponibles
+    """
+    count, after = slot_query(count, from_date)
+    return format_slots(get_availability().next_open_slots(count=count, after=after))
+
+@limit_concurrency(CALENDAR_TOOL_CONCURRENCY)
+@guarded("buscar horarios disponibles")
+async def afind_available_slots(count: int = 5, from_date: str = None) -> str:
+    count, after = slot_query(count, from_date)
+    return format_slots(await get_availability().anext_open_slots(count=count, after=after))
+
+@guarded("obtener fecha y hora")
+def current_datetime() -> str:
+    """Fecha y hora actual en Bogotá con el día de la semana (lo usan las dos versiones de la herramienta)."""
+    current = datetime.now(ZoneInfo('America/Bogota'))
+
+    # Formatear fecha y hora
+    fecha = current.strftime("%d/%m/%Y")
+    hora = current.strftime("%I:%M %p")
+    dia = DIAS_SEMANA[current.weekday()]
+
+    return f"Hoy es {dia} {fecha}, {hora}"
 
 @tool
 def get_current_datetime() -> str:
@@ -538,37 +851,72 @@ def get_current_datetime() -> str:
     Returns:
         str: Fecha y hora actual en formato amigable
     """
-    try:
-        # Obtener fecha y hora actual en Bogotá
-        bogota_tz = ZoneInfo('America/Bogota')
-        current = datetime.now(bogota_tz)
-        
-        # Mapeo de días en español
-        dias = {
-            0: 'lunes',
-            1: 'martes',
-            2: 'miércoles',
-            3: 'jueves',
-            4: 'viernes',
-            5: 'sábado',
-            6: 'domingo'
-        }
-        
-        # Formatear fecha y hora
-        fecha = current.strftime("%d/%m/%Y")
-        hora = current.strftime("%I:%M %p")
-        dia = dias[current.weekday()]
-        
-        return f"Hoy es {dia} {fecha}, {hora}"
-    except Exception as e:
-        return f"Error al obtener fecha y hora: {str(e)}"
+    return current_datetime()
+
+async def aget_current_datetime() -> str:
+    return current_datetime()
+
+# Versiones asíncronas de cada herramienta: las usa el grafo con astream/ainvoke
+# (sin ellas LangChain ejecutaría la versión síncrona en un hilo)
+create_calendar_event.coroutine = acreate_calendar_event
+modify_calendar_event.coroutine = amodify_calendar_event
+modify_calendar_events.coroutine = amodify_calendar_events
+cancel_calendar_event.coroutine = acancel_calendar_event
+cancel_calendar_events.coroutine = acancel_calendar_events
+search_calendar_event.coroutine = asearch_calendar_event
+find_available_slots.coroutine = afind_available_slots
+get_current_datetime.coroutine = aget_current_datetime
+send_verification_code.coroutine = asend_verification_code
+verify_code.coroutine = averify_code
 
 tools = [
     create_calendar_event,
     modify_calendar_event,
+    modify_calendar_events,
     cancel_calendar_event,
+    cancel_calendar_events,
     search_calendar_event,
+    find_available_slots,
     get_current_datetime,
     send_verification_code,
     verify_code
 ]
+
+def fit_budget(text, max_chars=None):
+    """
+    Recorta un resultado a TOOL_RESULT_MAX_CHARS caracteres por líneas completas e
+    indica cuántas se omitieron, para que el modelo afine la búsqueda en vez de
+    releer listas enteras en cada paso.
+    """
+    max_chars = max_chars or TOOL_RESULT_MAX_CHARS
+    if not isinstance(text, str) or len(text) <= max_chars:
+        return text
+    lines = text.split("\n")
+    kept, size = [], 0
+    for line in lines:
+        if size + len(line) + 1 > max_chars - 60:
+            break
+        kept.append(line)
+        size += len(line) + 1
+    if not kept:
+        return text[:max_chars - 1] + "…"
+    return "\n".join(kept) + f"\n… ({len(lines) - len(kept)} líneas más; acota la búsqueda para verlas)"
+
+def budgeted(func):
+    """Aplica fit_budget al resultado de una herramienta (síncrona o asíncrona)."""
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            return fit_budget(await func(*args, **kwargs))
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return fit_budget(func(*args, **kwargs))
+    return wrapper
+
+# Cada herramienta (versión síncrona y asíncrona) respeta el presupuesto de tamaño
+# y se mide como un tramo "tool" (ver metrics.py; con METRICS_ENABLED=0 no se mide)
+for _tool in tools:
+    _tool.func = traced("tool", _tool.name)(budgeted(_tool.func))
+    _tool.coroutine = traced("tool", _tool.name)(budgeted(_tool.coroutine))
@@ -0,0 +1,160 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+import os
+
+# Presupuesto aproximado de tokens para el historial que se envía al modelo
+HISTORY_MAX_TOKENS = int(os.getenv('HISTORY_MAX_TOKENS', '3000'))
+# Turnos recientes que se conservan textualmente (si caben en el presupuesto)
+HISTORY_KEEP_TURNS = int(os.getenv('HISTORY_KEEP_TURNS', '6'))
+# Parte del presupuesto reservada para el resumen de turnos antiguos
+SUMMARY_MAX_TOKENS = int(os.getenv('SUMMARY_MAX_TOKENS', '600'))
+# Longitud máxima de cada intervención dentro del resumen (caracteres)
+SUMMARY_SNIPPET_CHARS = 160
+# Máximo de hechos confirmados que se conservan (los más recientes)
+MAX_FACTS = 20
+
+
+def estimate_tokens(text) -> int:
+    """Estimación barata (~4 caracteres por token), suficiente para acotar el prompt."""
+    if not isinstance(text, str):
+        text = str(text)
+    return len(text) // 4 + 1
+
+
+def _message_tokens(message) -> int:
+    tokens = estimate_tokens(message.content)
+    for tool_call in getattr(message, 'tool_calls', None) or []:
+        tokens += estimate_tokens(tool_call['args']) + 10
+    return tokens
+
+
+def split_turns(messages):
+    """Agrupa los mensajes en turnos; cada turno empieza con un mensaje del usuario."""
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def _succeeded(content):
+    """IDs de las citas con resultado correcto en una herramienta por lotes ("<id>: <resultado>" por línea)."""
+    for line in content.splitlines():
+        event_id, _, result = line.partition(': ')
+        if 'exitosamente' in result:
+            yield event_id.strip()
+
+
+def _modified(event_id, change):
+    return f"Cita {event_id} modificada: {change.get('new_date') or ''} {change.get('new_time') or ''}".rstrip()
+
+
+def extract_facts(messages):
+    """
+    Hechos que nunca se descartan: correos verificados y citas agendadas,
+    modificadas o canceladas (también en lote), obtenidos de los resultados
+    de las herramientas.
+    """
+    facts = []
+    tool_calls = {}
+    for message in messages:
+        if isinstance(message, AIMessage):
+            for tool_call in message.tool_calls or []:
+                tool_calls[tool_call['id']] = tool_call
+        elif isinstance(message, ToolMessage):
+            tool_call = tool_calls.get(message.tool_call_id)
+            if tool_call is None:
+                continue
+            name, args = tool_call['name'], tool_call['args']
+            content = str(message.content)
+            if name == 'verify_code' and content.strip().lower() == 'true':
+                found = [f"Correo verificado: {args.get('email')}"]
+            elif name == 'create_calendar_event' and 'exitosamente' in content:
+                found = [f"Cita agendada para {args.get('client_name')} ({args.get('client_email')}) "
+                         f"el {args.get('date')} a las {args.get('time')}"]
+            elif name == 'modify_calendar_event' and 'exitosamente' in content:
+                found = [_modified(args.get('event_id'), args)]
+            elif name == 'cancel_calendar_event' and 'exitosamente' in content:
+                found = [f"Cita {args.get('event_id')} cancelada"]
+            elif name == 'modify_calendar_events':
+                changes = {str(change.get('event_id')): change
+                           for change in args.get('changes') or [] if isinstance(change, dict)}
+                found = [_modified(event_id, changes.get(event_id, {})) for event_id in _succeeded(content)]
+            elif name == 'cancel_calendar_events':
+                found = [f"Cita {event_id} cancelada" for event_id in _succeeded(content)]
+            else:
+                continue
+            for fact in found:
+                if fact not in facts:
+                    facts.append(fact)
+    return facts[-MAX_FACTS:]
+
+
+def _snippet(text):
+    text = " ".join(str(text).split())
+    if len(text) > SUMMARY_SNIPPET_CHARS:
+        text = text[:SUMMARY_SNIPPET_CHARS - 1] + "…"
+    return text
+
+
+def summarize_turns(turns, max_tokens=SUMMARY_MAX_TOKENS):
+    """Resumen extractivo de turnos antiguos; si no cabe, se priorizan los más recientes."""
+    lines = []
+    used = 0
+    for turn in reversed(turns):
+        turn_lines = []
+        for message in turn:
+            if isinstance(message, HumanMessage):
+                turn_lines.append(f"- Cliente: {_snippet(message.content)}")
+            elif isinstance(message, AIMessage) and message.content and not message.tool_calls:
+                turn_lines.append(f"  Asistente: {_snippet(message.content)}")
+        cost = sum(estimate_tokens(line) for line in turn_lines)
+        if used + cost > max_tokens:
+            break
+        lines[:0] = turn_lines
+        used += cost
+    omitted = len(turns) - sum(1 for line in lines if line.startswith("- Cliente"))
+    if omitted > 0:
+        lines.insert(0, f"({omitted} turnos anteriores omitidos)")
+    return "\n".join(lines)
+
+
+def trim_history(messages, max_tokens=HISTORY_MAX_TOKENS, keep_turns=HISTORY_KEEP_TURNS):
+    """
+    Devuelve la vista del historial que se envía al modelo: los últimos turnos
+    textuales que quepan en el presupuesto y, si se descartó algo, un mensaje de
+    sistema con los hechos verificados y un resumen de lo anterior.
+    """
+    turns = split_turns(messages)
+    if not turns:
+        return []
+
+    # El turno en curso siempre se conserva completo (contiene las llamadas a herramientas)
+    recent = [turns[-1]]
+    budget = max_tokens - SUMMARY_MAX_TOKENS
+    used = sum(_message_tokens(m) for m in turns[-1])
+    for turn in reversed(turns[:-1]):
+        if len(recent) >= keep_turns:
+            break
+        cost = sum(_message_tokens(m) for m in turn)
+        if used + cost > budget:
+            break
+        recent.insert(0, turn)
+        used += cost
+
+    older = turns[:len(turns) - len(recent)]
+    kept = [m for turn in recent for m in turn]
+    if not older:
+        return kept
+
+    parts = []
+    facts = extract_facts(messages)
+    if facts:
+        parts.append("Hechos confirmados en esta conversación:\n" + "\n".join(f"- {f}" for f in facts))
+    summary = summarize_turns(older)
+    if summary:
+        parts.append("Resumen de la conversación anterior:\n" + summary)
+    if not parts:
+        return kept
+    return [SystemMessage(content="\n\n".join(parts))] + kept
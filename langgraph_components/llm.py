@@ -1,23 +1,665 @@
 from langchain_openai import ChatOpenAI
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.runnables.config import var_child_runnable_config, ensure_config
+from langchain_core.callbacks import BaseCallbackManager
+from langchain_core.tracers._streaming import _StreamingCallbackHandler
+from .history import estimate_tokens
+from . import metrics
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import OrderedDict, deque
 from dotenv import load_dotenv
+import contextvars
+import openai
+import httpx
+import unicodedata
+import threading
+import asyncio
+import hashlib
+import time
+import re
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 
-def load_llm_openai(temperature=0.5, max_tokens=1000, model="gpt-4o-mini"):
+# Proveedores en orden de preferencia; se usan los que tengan API key
+LLM_PROVIDERS = [name.strip() for name in os.getenv('LLM_PROVIDERS', 'openai,deepseek').split(',') if name.strip()]
+# Tiempo máximo por petición y reintentos del cliente antes de pasar al siguiente proveedor
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '30'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '0'))
+# Fallos consecutivos tras los que un proveedor pasa al final de la lista durante LLM_COOLDOWN segundos
+LLM_FAILURE_THRESHOLD = int(os.getenv('LLM_FAILURE_THRESHOLD', '3'))
+LLM_COOLDOWN = float(os.getenv('LLM_COOLDOWN', '30'))
+# Peticiones de cobertura (hedging): si el primer proveedor tarda más que su p95, se lanza
+# la misma petición al segundo y se usa la primera respuesta. Hasta tener LLM_HEDGE_MIN_SAMPLES
+# latencias medidas se espera LLM_HEDGE_DELAY segundos.
+LLM_HEDGE = os.getenv('LLM_HEDGE', '0') == '1'
+LLM_HEDGE_DELAY = float(os.getenv('LLM_HEDGE_DELAY', '3'))
+LLM_HEDGE_MIN_SAMPLES = 20
+# Hilos para las peticiones con cobertura de la ruta síncrona: cada llamada ocupa dos
+# mientras dura la cobertura; si se agotan, las siguientes esperan turno
+LLM_HEDGE_WORKERS = int(os.getenv('LLM_HEDGE_WORKERS', '8'))
+
+# Modelo por fase del agente: 'routing' (el paso que sigue al mensaje del usuario:
+# decide qué herramientas llamar; si no hacen falta, su texto se descarta) y
+# 'answer' (toda respuesta al usuario, con o sin herramientas). El nombre del modelo aplica a
+# OpenAI; DeepSeek usa siempre deepseek-chat.
+LLM_TIERS = {
+    'routing': {
+        'model': os.getenv('LLM_ROUTING_MODEL', 'gpt-4o-mini'),
+        'max_tokens': int(os.getenv('LLM_ROUTING_MAX_TOKENS', '1000')),
+    },
+    'answer': {
+        'model': os.getenv('LLM_ANSWER_MODEL', 'gpt-4o-mini'),
+        'max_tokens': int(os.getenv('LLM_ANSWER_MAX_TOKENS', '1000')),
+    },
+}
+
+# Caché de respuestas del modelo: entradas máximas (0 la desactiva) y vigencia (segundos)
+LLM_CACHE_SIZE = int(os.getenv('LLM_CACHE_SIZE', '512'))
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', str(60 * 60)))
+# Similitud mínima (Jaccard de trigramas) para reutilizar la respuesta de una pregunta
+# parecida, p. ej. 0.8; por defecto 0: solo coincidencias exactas
+LLM_CACHE_SIMILARITY = float(os.getenv('LLM_CACHE_SIMILARITY', '0'))
+# Correos, teléfonos, códigos, fechas, cédulas...: esas preguntas nunca se cachean
+PERSONAL_DATA_PATTERN = re.compile(r"@|\d{3,}|\d{1,2}[/-]\d{1,2}")
+# Tampoco las que hablan del propio usuario ("soy...", "me llamo...", "mi caso...")
+# (se busca en el texto normalizado: minúsculas y sin tildes)
+SELF_DESCRIPTION_PATTERN = re.compile(r"\b(soy|me llamo|mi nombre|mi|mis|mio|mia|yo|conmigo)\b")
+# Palabras que invierten el sentido de una pregunta: dos preguntas solo se consideran
+# parecidas si tienen las mismas ("quiero agendar" frente a "no quiero agendar")
+NEGATION_WORDS = frozenset({'no', 'nunca', 'tampoco', 'ni', 'jamas', 'nada', 'ningun', 'ninguna', 'ninguno', 'sin'})
+
+
+def load_llm_openai(temperature=0.5, max_tokens=1000, model="gpt-4o-mini", timeout=None, max_retries=2):
     llm = ChatOpenAI(
         temperature=temperature,
         max_tokens=max_tokens,
         model=model,
+        timeout=timeout,
+        max_retries=max_retries,
+        stream_usage=True,
     )
     return llm
 
-def load_llm_deepseek(temperature=0.5, max_tokens=1000, model="deepseek-chat"):
+def load_llm_deepseek(temperature=0.5, max_tokens=1000, model="deepseek-chat", timeout=None, max_retries=2):
     llm = ChatOpenAI(
         temperature=temperature,
         max_tokens=max_tokens,
         model=model,
         api_key=os.getenv("DEEPSEEK_API_KEY"),
         base_url="https://api.deepseek.com",
+        timeout=timeout,
+        max_retries=max_retries,
+        stream_usage=True,
     )
-    return llm
\ No newline at end of file
+    return llm
+
+# Cargador y variable de entorno con la API key de cada proveedor
+PROVIDER_LOADERS = {
+    'openai': (load_llm_openai, 'OPENAI_API_KEY'),
+    'deepseek': (load_llm_deepseek, 'DEEPSEEK_API_KEY'),
+}
+
+
+def load_llm(tier='answer'):
+    """Modelo de una fase del agente: los proveedores configurados detrás de un FailoverChatModel."""
+    settings = LLM_TIERS[tier]
+
+    def load(name):
+        loader = PROVIDER_LOADERS[name][0]
+        kwargs = dict(max_tokens=settings['max_tokens'], timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES)
+        if name == 'openai':
+            kwargs['model'] = settings['model']
+        return loader(**kwargs)
+
+    providers = [
+        (name, load(name))
+        for name in LLM_PROVIDERS
+        if name in PROVIDER_LOADERS and os.getenv(PROVIDER_LOADERS[name][1])
+    ]
+    if not providers:
+        return load_llm_openai(model=settings['model'], max_tokens=settings['max_tokens'])
+    return FailoverChatModel(providers)
+
+
+def tiered():
+    """True si las fases usan modelos distintos (si no, basta con uno)."""
+    return LLM_TIERS['routing'] != LLM_TIERS['answer']
+
+
+def invoke_silently(model, messages, config=None):
+    """
+    model.invoke sin los callbacks del nodo, ni los explícitos ni los heredados
+    del contexto: sus tokens no salen en el streaming del grafo.
+    """
+    def run():
+        var_child_runnable_config.set(None)
+        return model.invoke(messages, {**(config or {}), "callbacks": []})
+    return contextvars.copy_context().run(run)
+
+
+async def ainvoke_silently(model, messages, config=None):
+    async def run():
+        var_child_runnable_config.set(None)
+        return await model.ainvoke(messages, {**(config or {}), "callbacks": []})
+    # La tarea se ejecuta en una copia del contexto
+    return await asyncio.ensure_future(run())
+
+
+def is_provider_error(error):
+    """
+    True si el error es del proveedor (red, timeout, 429, 5xx) y tiene sentido
+    probar con otro; los errores de la propia petición (4xx, credenciales,
+    errores de programación) no.
+    """
+    status = getattr(error, 'status_code', None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(error, (openai.APIConnectionError, httpx.TransportError, TimeoutError, ConnectionError))
+
+
+class _GatedHandler:
+    """Callback que deja de reenviar eventos (on_*) en cuanto se activa `closed`."""
+
+    def __init__(self, handler, closed):
+        self._handler = handler
+        self._closed = closed
+
+    def __getattr__(self, name):
+        attr = getattr(self._handler, name)
+        if not name.startswith('on_') or not callable(attr):
+            return attr
+        closed = self._closed
+
+        def forward(*args, **kwargs):
+            if not closed.is_set():
+                return attr(*args, **kwargs)
+        return forward
+
+
+class _GatedStreamingHandler(_GatedHandler):
+    # Conserva el isinstance(_StreamingCallbackHandler) con el que el modelo decide emitir tokens
+    def tap_output_aiter(self, run_id, output):
+        return self._handler.tap_output_aiter(run_id, output)
+
+    def tap_output_iter(self, run_id, output):
+        return self._handler.tap_output_iter(run_id, output)
+
+
+def gated_config(config, closed):
+    """
+    Config con los callbacks (explícitos o heredados del contexto) envueltos para
+    que una petición deje de emitir eventos cuando se activa `closed`.
+    """
+    config = ensure_config(config)
+    callbacks, proxies = config.get('callbacks'), {}
+
+    def gated(handler):
+        if id(handler) not in proxies:
+            cls = _GatedStreamingHandler if isinstance(handler, _StreamingCallbackHandler) else _GatedHandler
+            proxies[id(handler)] = cls(handler, closed)
+        return proxies[id(handler)]
+
+    if isinstance(callbacks, BaseCallbackManager):
+        manager = callbacks.copy()
+        manager.handlers = [gated(h) for h in callbacks.handlers]
+        manager.inheritable_handlers = [gated(h) for h in callbacks.inheritable_handlers]
+        callbacks = manager
+    elif callbacks:
+        callbacks = [gated(h) for h in callbacks]
+    return {**config, 'callbacks': callbacks}
+
+
+class ProviderHealth:
+    """Latencias recientes y fallos consecutivos de un proveedor."""
+
+    def __init__(self, name, failure_threshold=LLM_FAILURE_THRESHOLD, cooldown=LLM_COOLDOWN):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=200)
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+        self.stats = {'calls': 0, 'failures': 0, 'failovers': 0, 'hedges': 0, 'hedge_wins': 0}
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def record_success(self, seconds):
+        with self._lock:
+            self.stats['calls'] += 1
+            self._latencies.append(seconds)
+            self.consecutive_failures = 0
+            self.down_until = 0.0
+
+    def record_failure(self):
+        with self._lock:
+            self.stats['calls'] += 1
+            self.stats['failures'] += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                self.down_until = time.time() + self.cooldown
+
+    def available(self):
+        return time.time() >= self.down_until
+
+    def percentile(self, q, min_samples=1):
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < min_samples or not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))]
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats, consecutive_failures=self.consecutive_failures)
+        stats.update(available=self.available(), latency_p50=self.percentile(0.5), latency_p95=self.percentile(0.95))
+        return stats
+
+
+_hedge_executor = ThreadPoolExecutor(max_workers=LLM_HEDGE_WORKERS, thread_name_prefix='llm-hedge')
+
+
+class FailoverChatModel:
+    """
+    Reparte las llamadas al modelo entre varios proveedores (p. ej. OpenAI y
+    DeepSeek) con la misma interfaz que el modelo del grafo (bind_tools,
+    invoke, ainvoke).
+
+    Se usa el primer proveedor disponible; si falla (error de red, timeout,
+    429, 5xx) se reintenta con el siguiente. Los que acumulan
+    failure_threshold fallos seguidos pasan al final de la lista durante
+    `cooldown` segundos. Con `hedge`, si el primero tarda más que su p95 se
+    lanza la misma petición al segundo y gana la primera respuesta; la
+    petición de cobertura no emite tokens en streaming para no duplicarlos, y
+    si gana, la principal deja de emitirlos.
+    """
+
+    def __init__(self, providers, health=None, hedge=LLM_HEDGE, hedge_delay=LLM_HEDGE_DELAY):
+        self.providers = list(providers)
+        self.health = health or {name: ProviderHealth(name) for name, _ in self.providers}
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+
+    def bind_tools(self, tools, **kwargs):
+        # Los modelos con herramientas comparten el estado de salud con este
+        return FailoverChatModel([(name, model.bind_tools(tools, **kwargs)) for name, model in self.providers],
+                                 self.health, self.hedge, self.hedge_delay)
+
+    def _ordered(self):
+        available = [p for p in self.providers if self.health[p[0]].available()]
+        return available + [p for p in self.providers if p not in available]
+
+    def _groups(self):
+        """Proveedores en el orden en que se prueban: de dos en dos si hay cobertura."""
+        order = self._ordered()
+        size = 2 if self.hedge else 1
+        return [order[i:i + size] for i in range(0, len(order), size)]
+
+    def _delay(self, name):
+        p95 = self.health[name].percentile(0.95, LLM_HEDGE_MIN_SAMPLES)
+        return p95 if p95 is not None else self.hedge_delay
+
+    def _failed(self, name, error):
+        logger.warning("Fallo del proveedor de LLM %s: %s", name, error)
+        self.health[name].count('failovers')
+
+    # --- Ruta síncrona ---
+
+    def _call(self, name, model, messages, config, stream=True):
+        start = time.perf_counter()
+        with metrics.span("llm", name, hedge=not stream) as span:
+            try:
+                result = model.invoke(messages, config) if stream else invoke_silently(model, messages, config)
+            except Exception as e:
+                self._record_error(name, e)
+                raise
+            self._record_success(name, time.perf_counter() - start, result, span)
+        return result
+
+    def _record_success(self, name, seconds, result, span):
+        self.health[name].record_success(seconds)
+        usage = getattr(result, 'usage_metadata', None) or {}
+        span.set(input_tokens=usage.get('input_tokens'), output_tokens=usage.get('output_tokens'))
+        metrics.inc('llm_requests_total', provider=name, outcome='ok')
+        metrics.inc('llm_tokens_total', usage.get('input_tokens') or 0, provider=name, direction='input')
+        metrics.inc('llm_tokens_total', usage.get('output_tokens') or 0, provider=name, direction='output')
+
+    def _record_error(self, name, error):
+        if is_provider_error(error):
+            self.health[name].record_failure()
+            metrics.inc('llm_requests_total', provider=name, outcome='provider_error')
+        else:
+            metrics.inc('llm_requests_total', provider=name, outcome='request_error')
+
+    def _hedged(self, group, messages, config):
+        (first_name, first), (second_name, second) = group
+        # La petición perdedora no se puede cancelar: si gana la cobertura, la principal
+        # sigue hasta terminar pero deja de emitir tokens y eventos a los callbacks del grafo
+        loser = threading.Event()
+        primary = _hedge_executor.submit(contextvars.copy_context().run, self._call,
+                                         first_name, first, messages, gated_config(config, loser))
+        done, _ = wait([primary], timeout=self._delay(first_name))
+        if done:
+            try:
+                return primary.result()
+            except Exception as e:
+                if not is_provider_error(e):
+                    raise
+                self._failed(first_name, e)
+                return self._call(second_name, second, messages, config)
+
+        self.health[second_name].count('hedges')
+        hedge = _hedge_executor.submit(contextvars.copy_context().run,
+                                       self._call, second_name, second, messages, config, False)
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is hedge:
+                    loser.set()
+                    self.health[second_name].count('hedge_wins')
+                return result
+        raise error
+
+    def invoke(self, messages, config=None):
+        error = None
+        for group in self._groups():
+            try:
+                if len(group) == 2:
+                    return self._hedged(group, messages, config)
+                return self._call(*group[0], messages, config)
+            except Exception as e:
+                if not is_provider_error(e):
+                    raise
+                self._failed(group[-1][0], e)
+                error = e
+        raise error
+
+    # --- Ruta asíncrona ---
+
+    async def _acall(self, name, model, messages, config, stream=True):
+        start = time.perf_counter()
+        with metrics.span("llm", name, hedge=not stream) as span:
+            try:
+                if stream:
+                    result = await model.ainvoke(messages, config)
+                else:
+                    result = await ainvoke_silently(model, messages, config)
+            except Exception as e:
+                self._record_error(name, e)
+                raise
+            self._record_success(name, time.perf_counter() - start, result, span)
+        return result
+
+    async def _ahedged(self, group, messages, config):
+        (first_name, first), (second_name, second) = group
+        primary = asyncio.ensure_future(self._acall(first_name, first, messages, config))
+        done, _ = await asyncio.wait({primary}, timeout=self._delay(first_name))
+        if done:
+            try:
+                return primary.result()
+            except Exception as e:
+                if not is_provider_error(e):
+                    raise
+                self._failed(first_name, e)
+                return await self._acall(second_name, second, messages, config)
+
+        self.health[second_name].count('hedges')
+        hedge = asyncio.ensure_future(self._acall(second_name, second, messages, config, False))
+        pending, error = {primary, hedge}, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task is hedge:
+                        self.health[second_name].count('hedge_wins')
+                    return task.result()
+            raise error
+        finally:
+            # La petición perdedora se cancela (en la ruta síncrona no se puede)
+            for task in pending:
+                task.cancel()
+
+    async def ainvoke(self, messages, config=None):
+        error = None
+        for group in self._groups():
+            try:
+                if len(group) == 2:
+                    return await self._ahedged(group, messages, config)
+                return await self._acall(*group[0], messages, config)
+            except Exception as e:
+                if not is_provider_error(e):
+                    raise
+                self._failed(group[-1][0], e)
+                error = e
+        raise error
+
+    def get_stats(self):
+        return {name: health.get_stats() for name, health in self.health.items()}
+
+
+
+class PhaseStats:
+    """
+    Llamadas, latencia y tokens por fase del agente ('routing' / 'answer'),
+    para ajustar qué modelo usa cada una. Si el proveedor no informa del uso
+    de tokens se estima (~4 caracteres por token).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self.stats = {}
+
+    def _phase(self, phase):
+        if phase not in self.stats:
+            self.stats[phase] = {'calls': 0, 'time': 0.0, 'input_tokens': 0, 'output_tokens': 0}
+            self._latencies[phase] = deque(maxlen=1000)
+        return self.stats[phase]
+
+    def record(self, phase, seconds, messages, response):
+        usage = getattr(response, 'usage_metadata', None) or {}
+        input_tokens = usage.get('input_tokens') or sum(estimate_tokens(m.content) for m in messages)
+        output_tokens = usage.get('output_tokens') or (
+            estimate_tokens(response.content) + sum(estimate_tokens(c['args']) for c in response.tool_calls or []))
+        with self._lock:
+            stats = self._phase(phase)
+            stats['calls'] += 1
+            stats['time'] += seconds
+            stats['input_tokens'] += input_tokens
+            stats['output_tokens'] += output_tokens
+            self._latencies[phase].append(seconds)
+
+    def get_stats(self):
+        with self._lock:
+            stats = {phase: dict(values) for phase, values in self.stats.items()}
+            latencies = {phase: sorted(values) for phase, values in self._latencies.items()}
+        for phase, values in stats.items():
+            calls, ordered = values['calls'], latencies[phase]
+            values.update(
+                avg_latency=values['time'] / calls if calls else None,
+                latency_p95=ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] if ordered else None,
+                avg_output_tokens=values['output_tokens'] / calls if calls else None,
+            )
+        return stats
+
+
+phase_stats = PhaseStats()
+metrics.register_collector(lambda: [
+    (f"llm_phase_{key}_total", 'counter', {'phase': phase}, values[key])
+    for phase, values in phase_stats.get_stats().items()
+    for key in ('calls', 'input_tokens', 'output_tokens')
+])
+
+
+def normalize_text(text) -> str:
+    """Minúsculas, sin tildes, sin puntuación y con espacios simples."""
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+def shingles(text, size=3):
+    """Trigramas de caracteres del texto normalizado (clave de similitud sin embeddings)."""
+    text = f" {text} "
+    return frozenset(text[i:i + size] for i in range(max(1, len(text) - size + 1)))
+
+
+def has_proper_name(text):
+    """Una palabra en mayúscula que no empieza la frase: probablemente un nombre propio."""
+    for sentence in re.split(r"[.!?¿¡\n]+", str(text)):
+        words = re.findall(r"\w+", sentence)
+        if any(word[0].isupper() for word in words[1:]):
+            return True
+    return False
+
+
+def has_personal_data(text):
+    """Datos de contacto, números, nombres propios o frases sobre el propio usuario."""
+    return bool(PERSONAL_DATA_PATTERN.search(str(text)) or has_proper_name(text)
+                or SELF_DESCRIPTION_PATTERN.search(normalize_text(text)))
+
+
+def negations(question):
+    return NEGATION_WORDS.intersection(question.split())
+
+
+def _digest(*parts):
+    return hashlib.sha256("\x00".join(parts).encode()).hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    Caché LRU con TTL de respuestas del modelo para preguntas generales
+    (horario, documentos, cómo agendar...) que el prompt del sistema responde
+    siempre igual.
+
+    Solo se cachean turnos sin herramientas ni datos del usuario: en el prompt
+    no puede haber llamadas ni resultados de herramientas, ningún mensaje del
+    usuario puede contener datos personales (ver has_personal_data) y solo se
+    guardan respuestas de texto (sin tool_calls). La clave es el hash del
+    prompt del sistema, la última respuesta del asistente (el contexto de la
+    pregunta) y la pregunta normalizada. Con similarity > 0, si no hay
+    coincidencia exacta se busca la pregunta más parecida con el mismo
+    contexto y las mismas negaciones.
+    """
+
+    def __init__(self, max_entries=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL, similarity=LLM_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        # (contexto, pregunta) -> (expira, trigramas, respuesta)
+        self._entries = OrderedDict()
+        self.stats = {'hits': 0, 'similar_hits': 0, 'misses': 0, 'skipped': 0,
+                      'stores': 0, 'evictions': 0, 'expired': 0}
+
+    def _key(self, messages):
+        """(contexto, pregunta normalizada) o None si el turno no se puede cachear."""
+        if not messages or not isinstance(messages[-1], HumanMessage):
+            return None
+        system, previous = "", ""
+        for message in messages:
+            if isinstance(message, SystemMessage):
+                system += str(message.content)
+            elif isinstance(message, ToolMessage) or getattr(message, 'tool_calls', None):
+                return None
+            elif isinstance(message, HumanMessage) and has_personal_data(message.content):
+                return None
+        for message in reversed(messages[:-1]):
+            if isinstance(message, AIMessage):
+                previous = normalize_text(message.content)
+                break
+        question = normalize_text(messages[-1].content)
+        if not question:
+            return None
+        return _digest(system, previous), question
+
+    def get(self, messages):
+        """Respuesta cacheada (texto) para este prompt o None."""
+        if not self.max_entries:
+            return None
+        key = self._key(messages)
+        now = time.time()
+        with self._lock:
+            if key is None:
+                self.stats['skipped'] += 1
+                return None
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                self.stats['expired'] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[2]
+            if self.similarity:
+                match = self._most_similar(key, now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.stats['similar_hits'] += 1
+                    return self._entries[match][2]
+            self.stats['misses'] += 1
+            return None
+
+    def _most_similar(self, key, now):
+        context, question = key
+        target, negated = shingles(question), negations(question)
+        best, best_score = None, self.similarity
+        for (entry_context, entry_question), (expires, entry_shingles, _) in self._entries.items():
+            if entry_context != context or expires <= now or negations(entry_question) != negated:
+                continue
+            score = len(target & entry_shingles) / len(target | entry_shingles)
+            if score >= best_score:
+                best, best_score = (entry_context, entry_question), score
+        return best
+
+    def put(self, messages, response):
+        """Guarda la respuesta si es solo texto y el turno se puede cachear."""
+        if not self.max_entries or not isinstance(response, AIMessage):
+            return
+        if response.tool_calls or not response.content or not isinstance(response.content, str):
+            return
+        key = self._key(messages)
+        if key is None:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, shingles(key[1]), response.content)
+            self._entries.move_to_end(key)
+            self.stats['stores'] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats, size=len(self._entries))
+        lookups = stats['hits'] + stats['similar_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['similar_hits']) / lookups if lookups else None
+        return stats
+
+
+response_cache = ResponseCache()
+metrics.register_collector(metrics.stats_collector(
+    'llm_cache', response_cache.get_stats,
+    counters=('hits', 'similar_hits', 'misses', 'skipped', 'stores', 'evictions', 'expired'),
+    gauges=('size',)))
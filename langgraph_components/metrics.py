@@ -0,0 +1,455 @@
+"""
+Métricas y trazas del asistente.
+
+- span(tipo, nombre): mide un tramo (nodo del grafo, herramienta, llamada al
+  modelo, petición a Google) y lo acumula en un histograma de latencias.
+- Los módulos con estadísticas propias (cachés, bandeja de salida, espejo...)
+  las exponen con register_collector(); se leen solo al exportar.
+- render() produce el formato de texto de Prometheus (GET /metrics en api.py o
+  start_metrics_server() para la aplicación de Streamlit).
+- Con TRACE_DIR cada turno (o una muestra, TRACE_SAMPLE_RATE) se guarda como
+  traza JSON con todos sus tramos.
+- Con PROFILE_SLOW_TURNS los turnos más lentos que ese umbral guardan un perfil
+  por muestreo de pilas (formato "folded" para flamegraph.pl o speedscope).
+
+METRICS_ENABLED=0 deja todo en no-op: span() devuelve un objeto compartido que
+no mide nada y turn() no crea trazas.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter
+import contextvars
+import functools
+import hashlib
+import asyncio
+import itertools
+import threading
+import random
+import json
+import time
+import sys
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+# Directorio de las trazas JSON por turno (vacío: no se guardan) y fracción de turnos a guardar
+TRACE_DIR = os.getenv('TRACE_DIR', '')
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))
+# Umbral (segundos) a partir del cual un turno guarda su perfil en PROFILE_DIR (0: desactivado)
+PROFILE_SLOW_TURNS = float(os.getenv('PROFILE_SLOW_TURNS', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'config/profiles')
+# Puerto de start_metrics_server() para la aplicación de Streamlit (vacío: sin servidor)
+METRICS_PORT = os.getenv('METRICS_PORT', '')
+# Interfaz en la que escucha: por defecto solo local, porque /metrics no pide autenticación
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+# Intervalo entre muestras del perfilador (segundos)
+PROFILE_INTERVAL = 0.005
+# Límites de los histogramas de latencia (segundos)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    'span_duration_seconds': 'Duración de los tramos por tipo (node, tool, llm, google) y nombre',
+    'span_errors_total': 'Tramos que terminaron con una excepción',
+    'turn_duration_seconds': 'Duración de un turno completo de la conversación',
+    'llm_tokens_total': 'Tokens enviados (input) y generados (output) por proveedor',
+    'llm_requests_total': 'Peticiones al modelo por proveedor y resultado',
+}
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (f'{key}="{value.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+class MetricsRegistry:
+    """Contadores e histogramas con etiquetas, más colectores que se leen al exportar."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def inc(self, metric, value=1, **labels):
+        key = (metric, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, metric, value, **labels):
+        key = (metric, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    def register_collector(self, collector):
+        """collector() devuelve [(nombre, tipo, etiquetas, valor)]; se llama en cada render()."""
+        self._collectors.append(collector)
+
+    def counter_value(self, metric, **labels):
+        with self._lock:
+            return self._counters.get((metric, _labels(labels)), 0)
+
+    def histogram_count(self, metric, **labels):
+        with self._lock:
+            histogram = self._histograms.get((metric, _labels(labels)))
+            return histogram[2] if histogram else 0
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """Todas las métricas en el formato de texto de Prometheus."""
+        series = {}
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                series.setdefault((name, 'counter'), []).append(f"{name}{_format_labels(labels)} {value}")
+            for (name, labels), (counts, total, count) in self._histograms.items():
+                lines = series.setdefault((name, 'histogram'), [])
+                cumulative = 0
+                for bound, bucket in zip(self.buckets, counts):
+                    cumulative += bucket
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', str(bound))])} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+            collectors = list(self._collectors)
+
+        for collector in collectors:
+            try:
+                for name, kind, labels, value in collector():
+                    if value is None:
+                        continue
+                    series.setdefault((name, kind), []).append(
+                        f"{name}{_format_labels(_labels(labels))} {float(value)}")
+            except Exception as e:
+                logger.warning("Error leyendo métricas: %s", e)
+
+        output = []
+        for (name, kind), lines in sorted(series.items()):
+            if name in HELP:
+                output.append(f"# HELP {name} {HELP[name]}")
+            output.append(f"# TYPE {name} {kind}")
+            output.extend(sorted(lines))
+        return "\n".join(output) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def inc(metric, value=1, **labels):
+    if METRICS_ENABLED:
+        metrics.inc(metric, value, **labels)
+
+
+def observe(metric, value, **labels):
+    if METRICS_ENABLED:
+        metrics.observe(metric, value, **labels)
+
+
+def register_collector(collector):
+    metrics.register_collector(collector)
+
+
+def stats_collector(prefix, get_stats, counters=(), gauges=(), labels=None):
+    """Colector que exporta claves de un get_stats(): contadores como <prefix>_<clave>_total."""
+    def collect():
+        stats = get_stats()
+        if stats is None:
+            return []
+        extra = labels or {}
+        return ([(f"{prefix}_{key}_total", 'counter', extra, stats.get(key)) for key in counters]
+                + [(f"{prefix}_{key}", 'gauge', extra, stats.get(key)) for key in gauges])
+    return collect
+
+
+# --- Tramos y trazas ---
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+_current_span = contextvars.ContextVar('current_span', default=None)
+_span_ids = itertools.count(1)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """Tramo medido: histograma de latencia y, si hay una traza activa, una entrada en ella."""
+
+    __slots__ = ('kind', 'name', 'attributes', 'id', 'parent', 'start', '_token')
+
+    def __init__(self, kind, name, attributes):
+        self.kind = kind
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.id = next(_span_ids)
+        parent = _current_span.get()
+        self.parent = parent.id if parent is not None else None
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self.start
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Cerrado desde otro contexto (p. ej. un generador cancelado)
+            pass
+        metrics.observe('span_duration_seconds', duration, kind=self.kind, name=self.name)
+        if exc_type is not None:
+            metrics.inc('span_errors_total', kind=self.kind, name=self.name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(self, duration, exc)
+        return False
+
+
+def span(kind, name, **attributes):
+    """Mide un tramo: `with span("tool", "create_calendar_event"): ...`."""
+    if not METRICS_ENABLED:
+        return NOOP_SPAN
+    return Span(kind, name, attributes)
+
+
+def _inside(kind, name):
+    current = _current_span.get()
+    return current is not None and current.kind == kind and current.name == name
+
+
+def traced(kind, name):
+    """
+    Decorador que mide cada llamada (síncrona o asíncrona) como un tramo. Si ya
+    está dentro de un tramo igual (la versión async de una herramienta que llama
+    a la síncrona) no abre otro, para no contar la llamada dos veces.
+    """
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _inside(kind, name):
+                    return await func(*args, **kwargs)
+                with Span(kind, name, {}):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _inside(kind, name):
+                return func(*args, **kwargs)
+            with Span(kind, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def anonymize(thread_id):
+    """Huella del thread_id para trazas y logs: agrupa los turnos sin guardar el id (que puede llevar un correo)."""
+    if thread_id is None:
+        return None
+    return hashlib.sha256(str(thread_id).encode()).hexdigest()[:16]
+
+
+class Trace:
+    """Tramos de un turno, para guardarlos como JSON."""
+
+    def __init__(self, thread_id):
+        self.thread_id = anonymize(thread_id)
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def add(self, span, duration, error):
+        entry = {
+            'id': span.id,
+            'parent': span.parent,
+            'kind': span.kind,
+            'name': span.name,
+            'start_ms': round((span.start - self.start) * 1000, 3),
+            'duration_ms': round(duration * 1000, 3),
+        }
+        if span.attributes:
+            entry['attributes'] = span.attributes
+        if error is not None:
+            entry['error'] = repr(error)
+        # list.append es atómico: los tramos llegan desde varios hilos
+        self.spans.append(entry)
+
+    def save(self, directory, duration):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"turn-{int(self.started_at * 1000)}-{os.getpid()}-{id(self):x}.json")
+        with open(path, 'w') as file:
+            json.dump({
+                'thread_id': self.thread_id,
+                'started_at': self.started_at,
+                'duration_ms': round(duration * 1000, 3),
+                'spans': sorted(self.spans, key=lambda s: s['start_ms']),
+            }, file, ensure_ascii=False, indent=1)
+        return path
+
+
+class SamplingProfiler:
+    """
+    Perfilador por muestreo compartido: mientras haya turnos activos, un hilo
+    toma las pilas de todos los hilos cada `interval` segundos y las suma a
+    cada turno activo (en un servidor concurrente incluye a otros turnos).
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._thread = None
+
+    def begin(self):
+        samples = Counter()
+        with self._lock:
+            self._samples[id(samples)] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+        return samples
+
+    def end(self, samples):
+        with self._lock:
+            self._samples.pop(id(samples), None)
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._samples:
+                    self._thread = None
+                    return
+                targets = list(self._samples.values())
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(stack)))
+            for samples in targets:
+                samples.update(stacks)
+            time.sleep(self.interval)
+
+    @staticmethod
+    def save(samples, directory, duration):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"slow-turn-{int(time.time() * 1000)}-{duration:.1f}s.folded")
+        with open(path, 'w') as file:
+            for stack, count in samples.most_common():
+                file.write(f"{stack} {count}\n")
+        return path
+
+
+profiler = SamplingProfiler()
+
+
+class _Turn:
+    """Contexto de un turno: duración, traza JSON (si toca) y perfil si fue lento."""
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.trace = None
+        if TRACE_DIR and random.random() < TRACE_SAMPLE_RATE:
+            self.trace = Trace(self.thread_id)
+        self.previous = _current_trace.get()
+        _current_trace.set(self.trace)
+        self.samples = profiler.begin() if PROFILE_SLOW_TURNS else None
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self.start
+        _current_trace.set(self.previous)
+        metrics.observe('turn_duration_seconds', duration)
+        if self.samples is not None:
+            profiler.end(self.samples)
+            if duration >= PROFILE_SLOW_TURNS:
+                path = SamplingProfiler.save(self.samples, PROFILE_DIR, duration)
+                logger.info("Turno lento (%.1f s): perfil guardado en %s", duration, path)
+        if self.trace is not None:
+            try:
+                self.trace.save(TRACE_DIR, duration)
+            except OSError as e:
+                logger.warning("Error guardando la traza: %s", e)
+        return False
+
+
+def turn(thread_id=None):
+    """Envuelve un turno completo (stream_response / astream_response)."""
+    if not METRICS_ENABLED:
+        return NOOP_SPAN
+    return _Turn(thread_id)
+
+
+# --- Exportación ---
+
+def start_metrics_server(port, host=METRICS_HOST):
+    """
+    Sirve GET /metrics en un hilo daemon (para procesos sin API propia, como
+    Streamlit). No tiene autenticación: escucha en `host` (127.0.0.1 por defecto).
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
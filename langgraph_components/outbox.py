@@ -0,0 +1,310 @@
+from . import metrics
+from collections import deque
+import threading
+import sqlite3
+import random
+import json
+import time
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Cola persistente de correos salientes (SQLite, compartida entre procesos)
+OUTBOX_DB = os.getenv('OUTBOX_DB', 'config/outbox.db')
+# Correos por lote (una sola petición batch a Gmail)
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '10'))
+# Espera tras un encolado para agrupar los correos que lleguen a la vez (segundos)
+OUTBOX_BATCH_WINDOW = float(os.getenv('OUTBOX_BATCH_WINDOW', '0.2'))
+# Intervalo de sondeo del worker cuando la cola está vacía (segundos)
+OUTBOX_POLL_INTERVAL = 1.0
+# Reintentos: backoff exponencial con jitter desde BACKOFF_BASE hasta BACKOFF_MAX segundos
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '6'))
+OUTBOX_BACKOFF_BASE = 2.0
+OUTBOX_BACKOFF_MAX = 300.0
+# Ventana en la que una nueva solicitud para el mismo correo no genera otro envío (segundos)
+OUTBOX_DEDUPE_WINDOW = float(os.getenv('OUTBOX_DEDUPE_WINDOW', '60'))
+# Tiempo tras el que un envío reclamado y no confirmado vuelve a la cola (worker caído)
+OUTBOX_LEASE = 60.0
+# Antigüedad a partir de la cual se borran los envíos terminados
+OUTBOX_RETENTION = 24 * 60 * 60
+
+
+def is_retryable(error):
+    """429, 5xx y errores de red se reintentan; el resto de errores HTTP son definitivos."""
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is None:
+        return True
+    status = int(status)
+    return status == 429 or status >= 500
+
+
+class GmailBatchSender:
+    """Envía un lote de mensajes con una sola petición batch a la API de Gmail."""
+
+    def __init__(self, service_factory):
+        self.service_factory = service_factory
+
+    def __call__(self, messages):
+        """messages: {id: cuerpo de users().messages().send()}. Devuelve {id: None o excepción}."""
+        service = self.service_factory()
+        results = {}
+
+        def callback(request_id, response, exception):
+            results[int(request_id)] = exception
+
+        batch = service.new_batch_http_request(callback=callback)
+        for message_id, body in messages.items():
+            batch.add(service.users().messages().send(userId="me", body=body), request_id=str(message_id))
+        with metrics.span("google", "gmail.batch", messages=len(messages)):
+            batch.execute()
+        return results
+
+
+class EmailOutbox:
+    """
+    Bandeja de salida persistente: la herramienta encola el correo y vuelve de
+    inmediato; un worker en segundo plano lo envía en lotes, reintenta los
+    errores transitorios con backoff exponencial y evita enviar dos veces al
+    mismo destinatario dentro de OUTBOX_DEDUPE_WINDOW.
+
+    Estados: pending -> sending -> sent | failed. Tras enviarse se borra el
+    cuerpo del mensaje (contiene el código de verificación).
+    """
+
+    def __init__(self, sender, path=OUTBOX_DB, batch_size=OUTBOX_BATCH_SIZE,
+                 batch_window=OUTBOX_BATCH_WINDOW, max_attempts=OUTBOX_MAX_ATTEMPTS,
+                 backoff_base=OUTBOX_BACKOFF_BASE, dedupe_window=OUTBOX_DEDUPE_WINDOW):
+        self.sender = sender
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.dedupe_window = dedupe_window
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._worker = None
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self.stats = {'enqueued': 0, 'coalesced': 0, 'sent': 0, 'failed': 0, 'retries': 0, 'batches': 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " recipient TEXT NOT NULL,"
+            " message TEXT,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt REAL NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " sent_at REAL,"
+            " last_error TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_recipient ON outbox (recipient, created_at)")
+
+    def _connection(self):
+        # Una conexión por hilo; autocommit y transacciones explícitas donde hacen falta
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    # --- Encolado ---
+
+    def recently_queued(self, recipient):
+        """True si ya hay un envío pendiente o hecho para este correo dentro de la ventana de deduplicación."""
+        row = self._connection().execute(
+            "SELECT 1 FROM outbox WHERE recipient = ? AND status != 'failed' AND created_at > ? LIMIT 1",
+            (recipient, time.time() - self.dedupe_window)
+        ).fetchone()
+        return row is not None
+
+    def enqueue(self, recipient, message):
+        """
+        Encola el mensaje. Si ya hay uno pendiente para el mismo destinatario se
+        reemplaza su contenido (solo vale el último código) en vez de enviar dos.
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(
+                "UPDATE outbox SET message = ? WHERE recipient = ? AND status = 'pending'",
+                (json.dumps(message), recipient)
+            )
+            coalesced = cursor.rowcount > 0
+            if not coalesced:
+                conn.execute(
+                    "INSERT INTO outbox (recipient, message, status, next_attempt, created_at)"
+                    " VALUES (?, ?, 'pending', ?, ?)",
+                    (recipient, json.dumps(message), now, now)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._count('coalesced' if coalesced else 'enqueued')
+        self._wake.set()
+        return not coalesced
+
+    # --- Envío ---
+
+    def _claim(self):
+        """Reserva el siguiente lote de envíos vencidos (también los reclamados por un worker caído)."""
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, message, attempts, created_at FROM outbox"
+                " WHERE status IN ('pending', 'sending') AND next_attempt <= ?"
+                " ORDER BY next_attempt LIMIT ?",
+                (now, self.batch_size)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET status = 'sending', next_attempt = ? WHERE id = ?",
+                [(now + OUTBOX_LEASE, row[0]) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_base * (2 ** (attempts - 1)), OUTBOX_BACKOFF_MAX)
+        return delay * random.uniform(0.5, 1.0)
+
+    def drain_once(self):
+        """Envía un lote; devuelve cuántos mensajes se intentaron."""
+        rows = self._claim()
+        if not rows:
+            return 0
+        messages = {row[0]: json.loads(row[1]) for row in rows}
+        try:
+            results = self.sender(messages)
+        except Exception as e:
+            # Falló el lote completo (red, credenciales...): todos se reintentan
+            results = {message_id: e for message_id in messages}
+        self._count('batches')
+
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for message_id, _, attempts, created_at in rows:
+                error = results.get(message_id, RuntimeError("Sin respuesta en el lote"))
+                if error is None:
+                    conn.execute(
+                        "UPDATE outbox SET status = 'sent', message = NULL, sent_at = ?, attempts = ?"
+                        " WHERE id = ?",
+                        (now, attempts + 1, message_id)
+                    )
+                    self._count('sent')
+                    with self._stats_lock:
+                        self._latencies.append(now - created_at)
+                elif attempts + 1 >= self.max_attempts or not is_retryable(error):
+                    conn.execute(
+                        "UPDATE outbox SET status = 'failed', message = NULL, attempts = ?, last_error = ?"
+                        " WHERE id = ?",
+                        (attempts + 1, str(error), message_id)
+                    )
+                    self._count('failed')
+                    logger.error("Error definitivo enviando correo %s: %s", message_id, error)
+                else:
+                    conn.execute(
+                        "UPDATE outbox SET status = 'pending', attempts = ?, next_attempt = ?, last_error = ?"
+                        " WHERE id = ?",
+                        (attempts + 1, now + self._backoff(attempts + 1), str(error), message_id)
+                    )
+                    self._count('retries')
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def purge(self, retention=OUTBOX_RETENTION):
+        cursor = self._connection().execute(
+            "DELETE FROM outbox WHERE status IN ('sent', 'failed') AND created_at <= ?",
+            (time.time() - retention,)
+        )
+        return cursor.rowcount
+
+    def start_worker(self, poll_interval=OUTBOX_POLL_INTERVAL):
+        """Inicia el worker en un hilo daemon; se despierta al encolar o cada poll_interval segundos."""
+        if self._worker is not None:
+            return self._worker
+
+        def run():
+            last_purge = time.time()
+            while True:
+                woken = self._wake.wait(poll_interval)
+                self._wake.clear()
+                if woken and self.batch_window:
+                    # Dar tiempo a que lleguen otros correos y salgan en el mismo lote
+                    time.sleep(self.batch_window)
+                try:
+                    while self.drain_once() >= self.batch_size:
+                        pass
+                    if time.time() - last_purge > 3600:
+                        self.purge()
+                        last_purge = time.time()
+                except Exception as e:
+                    logger.warning("Error procesando la bandeja de salida: %s", e)
+
+        self._worker = threading.Thread(target=run, name='email-outbox', daemon=True)
+        self._worker.start()
+        return self._worker
+
+    # --- Métricas ---
+
+    def get_stats(self):
+        """Contadores, profundidad de la cola y latencia encolado -> enviado (segundos)."""
+        now = time.time()
+        depth, oldest = self._connection().execute(
+            "SELECT COUNT(*), MIN(created_at) FROM outbox WHERE status IN ('pending', 'sending')"
+        ).fetchone()
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            stats = dict(self.stats)
+        stats.update(
+            queue_depth=depth,
+            oldest_pending_age=now - oldest if oldest is not None else None,
+            send_latency_p50=latencies[len(latencies) // 2] if latencies else None,
+            send_latency_p95=latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None,
+        )
+        return stats
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox(service_factory):
+    """Bandeja de salida compartida del proceso; se crea y arranca su worker en el primer uso."""
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                _outbox = EmailOutbox(GmailBatchSender(service_factory))
+                _outbox.start_worker()
+    return _outbox
+
+
+metrics.register_collector(metrics.stats_collector(
+    'outbox', lambda: _outbox.get_stats() if _outbox is not None else None,
+    counters=('enqueued', 'coalesced', 'sent', 'failed', 'retries', 'batches'),
+    gauges=('queue_depth', 'oldest_pending_age', 'send_latency_p95')))
@@ -0,0 +1,393 @@
+"""
+Límites de frecuencia y bloqueos de la verificación por correo.
+
+Cada clave ("send:email:ana@...", "verify:session:<thread_id>"...) guarda un
+contador de ventana deslizante aproximada: el conteo de la ventana fija actual
+y el de la anterior, ponderado por la parte de esa ventana que aún cae dentro
+de los últimos `window` segundos. Comprobar y registrar un intento es O(1) en
+tiempo y memoria por clave, sin guardar la marca de tiempo de cada intento.
+
+Los fallos (códigos incorrectos) se cuentan igual y al llegar al límite la
+clave queda bloqueada `lockout` segundos. attempt() cuenta el intento como
+fallo antes de conocer el resultado, en la misma operación que comprueba el
+bloqueo: así varios intentos simultáneos no pasan todos la comprobación.
+
+El backend 'memory' no hace I/O (un proceso); 'sqlite' comparte los contadores
+entre procesos (varios workers de la API) con el mismo archivo.
+"""
+from . import metrics
+from abc import ABC, abstractmethod
+import threading
+import sqlite3
+import time
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', 'config/rate_limits.db')
+
+# Intervalo entre barridos de claves sin actividad reciente (segundos)
+SWEEP_INTERVAL = 60
+
+
+def slide(state, now, window):
+    """Avanza (ventana, anterior, actual) a la ventana fija de `now`."""
+    index, previous, current = state
+    now_index = int(now // window)
+    if now_index == index:
+        return index, previous, current
+    if now_index == index + 1:
+        return now_index, current, 0
+    return now_index, 0, 0
+
+
+def estimate(state, now, window):
+    """Intentos estimados en los últimos `window` segundos."""
+    _, previous, current = state
+    return previous * (1 - (now % window) / window) + current
+
+
+def unacquire(state):
+    """Resta un intento: de la ventana actual o, si acaba de cambiar, de la anterior."""
+    index, previous, current = state
+    if current > 0:
+        return index, previous, current - 1
+    return index, max(0, previous - 1), current
+
+
+def retry_after(state, now, window, limit):
+    """Segundos hasta que el conteo estimado baje del límite."""
+    _, previous, current = state
+    offset = now % window
+    if current < limit and previous:
+        # Cuando la ventana anterior pese lo suficiente menos
+        return max(0.0, (1 - (limit - current) / previous) * window - offset)
+    if current < limit:
+        return 0.0
+    # La ventana actual ya basta para rechazar: pasa a ser la anterior y tiene que perder peso
+    return window - offset + (1 - limit / current) * window
+
+
+class RateLimiter(ABC):
+    """
+    Interfaz común de los backends.
+
+    acquire() comprueba y registra un intento en una sola operación; failure()
+    registra un fallo y bloquea la clave al llegar al límite; attempt() hace lo
+    mismo solo si la clave no está ya bloqueada. Las tres devuelven los segundos
+    que hay que esperar (0 si el intento se permite). release() devuelve un
+    intento registrado con acquire() o attempt() que al final no se usó.
+    """
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self.stats = {'checks': 0, 'rejected': 0, 'lockouts': 0}
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    @abstractmethod
+    def acquire(self, key: str, limit: int, window: float) -> float:
+        ...
+
+    @abstractmethod
+    def release(self, key: str, window: float):
+        ...
+
+    @abstractmethod
+    def failure(self, key: str, limit: int, window: float, lockout: float) -> float:
+        ...
+
+    @abstractmethod
+    def attempt(self, key: str, limit: int, window: float, lockout: float) -> float:
+        ...
+
+    @abstractmethod
+    def locked_for(self, key: str) -> float:
+        ...
+
+    @abstractmethod
+    def reset(self, key: str):
+        ...
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['keys'] = self.count()
+        return stats
+
+    def start_sweeper(self, interval: float = SWEEP_INTERVAL):
+        """Inicia un hilo daemon que elimina las claves sin actividad reciente."""
+        if getattr(self, '_sweeper', None) is not None:
+            return self._sweeper
+
+        def sweep():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.purge_expired()
+                except Exception as e:
+                    logger.warning("Error limpiando límites de frecuencia: %s", e)
+
+        self._sweeper = threading.Thread(target=sweep, name='rate-limit-sweeper', daemon=True)
+        self._sweeper.start()
+        return self._sweeper
+
+
+class MemoryRateLimiter(RateLimiter):
+    """Contadores en un diccionario del proceso: ninguna comprobación hace I/O."""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        # clave -> [ventana, anterior, actual, tamaño de ventana, bloqueada hasta]
+        self._entries = {}
+
+    def _entry(self, key, window, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = [int(now // window), 0, 0, window, 0.0]
+        else:
+            entry[0:3] = slide(entry[0:3], now, window)
+        return entry
+
+    def acquire(self, key, limit, window):
+        now = time.time()
+        self._count('checks')
+        with self._lock:
+            entry = self._entry(key, window, now)
+            wait = entry[4] - now
+            if wait <= 0 and estimate(entry[0:3], now, window) < limit:
+                entry[2] += 1
+                return 0.0
+            wait = max(wait, retry_after(entry[0:3], now, window, limit))
+        self._count('rejected')
+        return wait
+
+    def release(self, key, window):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[0:3] = unacquire(slide(entry[0:3], time.time(), window))
+
+    def failure(self, key, limit, window, lockout):
+        now = time.time()
+        with self._lock:
+            entry = self._entry(key, window, now)
+            entry[2] += 1
+            if estimate(entry[0:3], now, window) < limit:
+                return 0.0
+            entry[4] = now + lockout
+        self._count('lockouts')
+        return lockout
+
+    def attempt(self, key, limit, window, lockout):
+        now = time.time()
+        self._count('checks')
+        with self._lock:
+            entry = self._entry(key, window, now)
+            wait = entry[4] - now
+            if wait <= 0:
+                entry[2] += 1
+                locked = estimate(entry[0:3], now, window) >= limit
+                if locked:
+                    entry[4] = now + lockout
+        if wait > 0:
+            self._count('rejected')
+            return wait
+        if locked:
+            self._count('lockouts')
+        return 0.0
+
+    def locked_for(self, key):
+        self._count('checks')
+        with self._lock:
+            entry = self._entries.get(key)
+            wait = entry[4] - time.time() if entry else 0.0
+        if wait > 0:
+            self._count('rejected')
+            return wait
+        return 0.0
+
+    def reset(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            # Sin intentos en las dos últimas ventanas ni bloqueo vigente: la clave ya no cuenta
+            stale = [key for key, (index, _, _, window, locked) in self._entries.items()
+                     if int(now // window) > index + 1 and locked <= now]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def count(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteRateLimiter(RateLimiter):
+    """Contadores en SQLite (modo WAL), compartidos por todos los procesos que usen el mismo archivo."""
+
+    def __init__(self, path=RATE_LIMIT_DB):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            " key TEXT PRIMARY KEY,"
+            " window_index INTEGER NOT NULL,"
+            " previous REAL NOT NULL,"
+            " current REAL NOT NULL,"
+            " window REAL NOT NULL,"
+            " locked_until REAL NOT NULL DEFAULT 0)"
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _update(self, key, window, change):
+        """Lee, avanza y reescribe la fila de `key` en una transacción; change(estado, bloqueo, ahora) decide."""
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT window_index, previous, current, locked_until FROM rate_limits WHERE key = ?", (key,)
+            ).fetchone()
+            state = slide(row[:3], now, window) if row else (int(now // window), 0, 0)
+            locked_until = row[3] if row else 0.0
+            state, locked_until, result = change(state, locked_until, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limits (key, window_index, previous, current, window, locked_until)"
+                " VALUES (?, ?, ?, ?, ?, ?)", (key, *state, window, locked_until)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def acquire(self, key, limit, window):
+        self._count('checks')
+
+        def change(state, locked_until, now):
+            wait = locked_until - now
+            if wait <= 0 and estimate(state, now, window) < limit:
+                return (state[0], state[1], state[2] + 1), locked_until, 0.0
+            return state, locked_until, max(wait, retry_after(state, now, window, limit))
+
+        wait = self._update(key, window, change)
+        if wait:
+            self._count('rejected')
+        return wait
+
+    def release(self, key, window):
+        self._update(key, window, lambda state, locked_until, now: (unacquire(state), locked_until, None))
+
+    def failure(self, key, limit, window, lockout):
+        def change(state, locked_until, now):
+            state = (state[0], state[1], state[2] + 1)
+            if estimate(state, now, window) < limit:
+                return state, locked_until, 0.0
+            return state, now + lockout, lockout
+
+        wait = self._update(key, window, change)
+        if wait:
+            self._count('lockouts')
+        return wait
+
+    def attempt(self, key, limit, window, lockout):
+        self._count('checks')
+
+        def change(state, locked_until, now):
+            if locked_until > now:
+                return state, locked_until, (locked_until - now, False)
+            state = (state[0], state[1], state[2] + 1)
+            if estimate(state, now, window) < limit:
+                return state, locked_until, (0.0, False)
+            return state, now + lockout, (0.0, True)
+
+        wait, locked = self._update(key, window, change)
+        if wait:
+            self._count('rejected')
+        if locked:
+            self._count('lockouts')
+        return wait
+
+    def locked_for(self, key):
+        self._count('checks')
+        row = self._connection().execute("SELECT locked_until FROM rate_limits WHERE key = ?", (key,)).fetchone()
+        wait = row[0] - time.time() if row else 0.0
+        if wait > 0:
+            self._count('rejected')
+            return wait
+        return 0.0
+
+    def reset(self, key):
+        self._connection().execute("DELETE FROM rate_limits WHERE key = ?", (key,))
+
+    def purge_expired(self):
+        now = time.time()
+        cursor = self._connection().execute(
+            "DELETE FROM rate_limits WHERE CAST(? / window AS INTEGER) > window_index + 1 AND locked_until <= ?",
+            (now, now)
+        )
+        return cursor.rowcount
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0]
+
+
+def load_rate_limiter(backend=RATE_LIMIT_BACKEND, path=RATE_LIMIT_DB, sweep=True):
+    """Crea el limitador configurado y, opcionalmente, arranca su barrido de claves inactivas."""
+    if backend == 'memory':
+        limiter = MemoryRateLimiter()
+    elif backend == 'sqlite':
+        limiter = SQLiteRateLimiter(path)
+    else:
+        raise ValueError(f"Backend de límites de frecuencia desconocido: {backend}")
+    if sweep:
+        limiter.start_sweeper()
+    return limiter
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Devuelve el limitador compartido del proceso (se crea en el primer uso)."""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = load_rate_limiter()
+    return _limiter
+
+
+metrics.register_collector(metrics.stats_collector(
+    'rate_limiter', lambda: _limiter.get_stats() if _limiter is not None else None,
+    counters=('checks', 'rejected', 'lockouts'), gauges=('keys',)))
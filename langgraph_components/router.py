@@ -0,0 +1,224 @@
+"""
+Atajos deterministas para mensajes triviales y muy frecuentes: se responden
+con la herramienta adecuada y una plantilla, sin llamar al modelo. Ante
+cualquier duda el mensaje sigue al agente.
+"""
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from .graph_tools import (get_current_datetime, send_verification_code, verify_code,
+                          ALREADY_SENT_MESSAGE, SEND_LIMIT_PATTERN, VERIFY_LOCKED_PATTERN)
+from . import metrics
+import threading
+import logging
+import uuid
+import re
+
+logger = logging.getLogger(__name__)
+
+# Expresiones compartidas con la validación de la interfaz (app.validate_email)
+EMAIL_PATTERN = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
+CODE_PATTERN = re.compile(r"^\d{3}\s?\d{3}$")
+TIME_QUESTION_PATTERN = re.compile(
+    r"^¿?\s*(qu[eé]\s+hora\s+es|qu[eé]\s+d[ií]a\s+es(\s+hoy)?|qu[eé]\s+fecha\s+es(\s+hoy)?"
+    r"|cu[aá]l\s+es\s+la\s+fecha(\s+de\s+hoy)?)(\s+(ahora|hoy))?\s*\??[.!]*$",
+    re.IGNORECASE,
+)
+
+VERIFIED_MESSAGE = "¡Listo, tu correo quedó verificado! ✅ ¿Quieres agendar, modificar o cancelar una cita?"
+INVALID_CODE_MESSAGE = "El código no es válido o ya expiró. ¿Quieres que te envíe uno nuevo?"
+CODE_SENT_MESSAGE = "Te envié un código de verificación de 6 dígitos a {email}. 📧 Escríbelo aquí para continuar."
+CODE_ALREADY_SENT_MESSAGE = ("Ya te envié un código a {email} hace menos de un minuto. "
+                             "Revisa tu bandeja de entrada (y la carpeta de spam) y escríbelo aquí.")
+CODE_LIMIT_MESSAGE = ("Ya pediste varios códigos en poco tiempo. Podrás pedir otro en {minutes} minutos; "
+                      "mientras tanto revisa tu bandeja de entrada (y la carpeta de spam).")
+VERIFICATION_LOCKED_MESSAGE = ("Por seguridad bloqueé la verificación tras varios códigos incorrectos. "
+                               "Podrás intentarlo de nuevo en {minutes} minutos.")
+
+
+def validate_email(email: str) -> bool:
+    """Valida que el email tenga un formato correcto"""
+    return bool(EMAIL_PATTERN.match(email.strip()))
+
+
+def _last_ai_text(messages):
+    for message in reversed(messages[:-1]):
+        if isinstance(message, AIMessage) and message.content and not message.tool_calls:
+            return str(message.content)
+    return ""
+
+
+def _pending_verification(messages):
+    """Correo al que se envió el último código, si aún no se verificó en esta conversación."""
+    results = {m.tool_call_id: str(m.content).strip().lower() for m in messages if isinstance(m, ToolMessage)}
+    for message in reversed(messages):
+        if not isinstance(message, AIMessage):
+            continue
+        for tool_call in reversed(message.tool_calls or []):
+            if tool_call['name'] == 'verify_code' and results.get(tool_call['id']) == 'true':
+                return None
+            if tool_call['name'] == 'send_verification_code':
+                return tool_call['args'].get('email')
+    return None
+
+
+def _verified_emails(messages):
+    results = {m.tool_call_id: str(m.content).strip().lower() for m in messages if isinstance(m, ToolMessage)}
+    return {
+        tool_call['args'].get('email')
+        for m in messages if isinstance(m, AIMessage)
+        for tool_call in m.tool_calls or []
+        if tool_call['name'] == 'verify_code' and results.get(tool_call['id']) == 'true'
+    }
+
+
+def _messages(tool_call, result, answer):
+    return [
+        AIMessage(content="", tool_calls=[tool_call]),
+        result,
+        AIMessage(content=answer(str(result.content))),
+    ]
+
+
+def _call(tool, args, answer):
+    """
+    Mensajes de un turno resuelto con una herramienta: llamada, resultado y
+    respuesta. Si la herramienta falla no devuelve nada y el turno sigue al agente.
+    """
+    tool_call = {"name": tool.name, "args": args, "id": f"fast-{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+    try:
+        result = tool.invoke(tool_call)
+    except Exception as e:
+        logger.warning("Atajo %s fallido, el turno pasa al agente: %s", tool.name, e)
+        return []
+    return _messages(tool_call, result, answer)
+
+
+async def _acall(tool, args, answer):
+    tool_call = {"name": tool.name, "args": args, "id": f"fast-{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+    try:
+        result = await tool.ainvoke(tool_call)
+    except Exception as e:
+        logger.warning("Atajo %s fallido, el turno pasa al agente: %s", tool.name, e)
+        return []
+    return _messages(tool_call, result, answer)
+
+
+def _code_answer(result):
+    if result.lower() == "true":
+        return VERIFIED_MESSAGE
+    # Los rechazos se reconocen por las plantillas de graph_tools, no por su texto
+    locked = VERIFY_LOCKED_PATTERN.fullmatch(result)
+    if locked:
+        return VERIFICATION_LOCKED_MESSAGE.format(minutes=locked.group(1))
+    return INVALID_CODE_MESSAGE
+
+
+def match(messages):
+    """
+    Reconoce el mensaje del usuario: devuelve (intención, herramienta, args,
+    plantilla) o None si no es un caso seguro y debe responder el modelo.
+    """
+    if not messages or not isinstance(messages[-1], HumanMessage):
+        return None
+    text = str(messages[-1].content).strip()
+
+    if TIME_QUESTION_PATTERN.match(text):
+        return "time", get_current_datetime, {}, lambda result: f"{result} (hora de Bogotá)."
+
+    if CODE_PATTERN.match(text):
+        email = _pending_verification(messages)
+        if email:
+            code = text.replace(" ", "")
+            return "code", verify_code, {"email": email, "code": code}, _code_answer
+
+    if validate_email(text):
+        # Solo si el asistente acaba de pedir el correo y aún no está verificado
+        if "correo" in _last_ai_text(messages).lower() and text not in _verified_emails(messages):
+            def answer(result):
+                if result == ALREADY_SENT_MESSAGE:
+                    return CODE_ALREADY_SENT_MESSAGE.format(email=text)
+                limited = SEND_LIMIT_PATTERN.fullmatch(result)
+                if limited:
+                    return CODE_LIMIT_MESSAGE.format(minutes=limited.group(1))
+                return CODE_SENT_MESSAGE.format(email=text)
+            return "email", send_verification_code, {"email": text}, answer
+
+    return None
+
+
+class FastPathStats:
+    """Proporción de turnos resueltos por el atajo y latencia ahorrada frente a los que van al modelo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {'turns': 0, 'fast_path': 0, 'fast_time': 0.0, 'llm_time': 0.0, 'by_intent': {}}
+
+    def record_intent(self, intent):
+        with self._lock:
+            self.stats['by_intent'][intent] = self.stats['by_intent'].get(intent, 0) + 1
+
+    def record_turn(self, fast, seconds):
+        with self._lock:
+            self.stats['turns'] += 1
+            if fast:
+                self.stats['fast_path'] += 1
+                self.stats['fast_time'] += seconds
+            else:
+                self.stats['llm_time'] += seconds
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats, by_intent=dict(self.stats['by_intent']))
+        fast, llm = stats['fast_path'], stats['turns'] - stats['fast_path']
+        avg_fast = stats['fast_time'] / fast if fast else None
+        avg_llm = stats['llm_time'] / llm if llm else None
+        stats.update(
+            share=fast / stats['turns'] if stats['turns'] else None,
+            avg_fast_latency=avg_fast,
+            avg_llm_latency=avg_llm,
+            latency_saved=fast * (avg_llm - avg_fast) if avg_fast is not None and avg_llm is not None else None,
+        )
+        return stats
+
+
+fast_path_stats = FastPathStats()
+
+
+def _collect_fast_path():
+    stats = fast_path_stats.get_stats()
+    return [
+        ('fast_path_turns_total', 'counter', {}, stats['turns']),
+        ('fast_path_served_total', 'counter', {}, stats['fast_path']),
+    ] + [('fast_path_intents_total', 'counter', {'intent': intent}, count)
+         for intent, count in stats['by_intent'].items()]
+
+
+metrics.register_collector(_collect_fast_path)
+
+
+def route(state):
+    """Nodo del grafo: resuelve el turno con el atajo o no devuelve nada (sigue el modelo)."""
+    matched = match(state["messages"])
+    if matched is None:
+        return {"messages": []}
+    intent, tool, args, answer = matched
+    messages = _call(tool, args, answer)
+    if messages:
+        fast_path_stats.record_intent(intent)
+    return {"messages": messages}
+
+
+async def aroute(state):
+    matched = match(state["messages"])
+    if matched is None:
+        return {"messages": []}
+    intent, tool, args, answer = matched
+    messages = await _acall(tool, args, answer)
+    if messages:
+        fast_path_stats.record_intent(intent)
+    return {"messages": messages}
+
+
+def served_by_fast_path(state):
+    """Condición tras el nodo router: si ya hay respuesta, el turno termina."""
+    last = state["messages"][-1]
+    return isinstance(last, AIMessage) and not last.tool_calls
@@ -0,0 +1,178 @@
+from abc import ABC, abstractmethod
+import threading
+import sqlite3
+import time
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Vigencia de los códigos de verificación (segundos)
+CODE_TTL = 10 * 60
+
+# Intervalo entre barridos de códigos expirados (segundos)
+SWEEP_INTERVAL = 60
+
+# Backend por defecto: 'sqlite' (compartido entre procesos) o 'memory'
+VERIFICATION_BACKEND = os.getenv('VERIFICATION_BACKEND', 'sqlite')
+VERIFICATION_DB = os.getenv('VERIFICATION_DB', 'config/verification_codes.db')
+
+
+class VerificationStore(ABC):
+    """
+    Interfaz común de los almacenes de códigos de verificación.
+
+    Las búsquedas son por email (O(1)) y consume() compara y elimina el código
+    en una sola operación atómica, de modo que un código solo se acepta una vez.
+    """
+
+    @abstractmethod
+    def save(self, email: str, code: str, ttl: float = CODE_TTL):
+        ...
+
+    @abstractmethod
+    def consume(self, email: str, code: str) -> bool:
+        ...
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    def start_sweeper(self, interval: float = SWEEP_INTERVAL):
+        """Inicia un hilo daemon que elimina los códigos expirados periódicamente."""
+        if getattr(self, '_sweeper', None) is not None:
+            return self._sweeper
+
+        def sweep():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.purge_expired()
+                except Exception as e:
+                    logger.warning("Error limpiando códigos expirados: %s", e)
+
+        self._sweeper = threading.Thread(target=sweep, name='verification-sweeper', daemon=True)
+        self._sweeper.start()
+        return self._sweeper
+
+
+class MemoryVerificationStore(VerificationStore):
+    """Almacén en memoria, para pruebas o despliegues de un solo proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._codes = {}
+
+    def save(self, email, code, ttl=CODE_TTL):
+        with self._lock:
+            self._codes[email] = (str(code), time.time() + ttl)
+
+    def consume(self, email, code):
+        with self._lock:
+            stored = self._codes.get(email)
+            if stored is None:
+                return False
+            stored_code, expires = stored
+            if time.time() >= expires:
+                del self._codes[email]
+                return False
+            if stored_code != str(code):
+                return False
+            del self._codes[email]
+            return True
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [email for email, (_, expires) in self._codes.items() if expires <= now]
+            for email in expired:
+                del self._codes[email]
+        return len(expired)
+
+    def count(self):
+        with self._lock:
+            return len(self._codes)
+
+
+class SQLiteVerificationStore(VerificationStore):
+    """Almacén SQLite en modo WAL, compartido por todos los procesos que usen el mismo archivo."""
+
+    def __init__(self, path=VERIFICATION_DB):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS verification_codes ("
+            " email TEXT PRIMARY KEY,"
+            " code TEXT NOT NULL,"
+            " expires REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_verification_expires ON verification_codes (expires)"
+        )
+
+    def _connection(self):
+        # Una conexión por hilo; autocommit para que cada sentencia sea su propia transacción
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def save(self, email, code, ttl=CODE_TTL):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO verification_codes (email, code, expires) VALUES (?, ?, ?)",
+            (email, str(code), time.time() + ttl)
+        )
+
+    def consume(self, email, code):
+        cursor = self._connection().execute(
+            "DELETE FROM verification_codes WHERE email = ? AND code = ? AND expires > ?",
+            (email, str(code), time.time())
+        )
+        return cursor.rowcount == 1
+
+    def purge_expired(self):
+        cursor = self._connection().execute(
+            "DELETE FROM verification_codes WHERE expires <= ?", (time.time(),)
+        )
+        return cursor.rowcount
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM verification_codes").fetchone()[0]
+
+
+def load_verification_store(backend=VERIFICATION_BACKEND, path=VERIFICATION_DB, sweep=True):
+    """Crea el almacén configurado y, opcionalmente, arranca su barrido de expirados."""
+    if backend == 'memory':
+        store = MemoryVerificationStore()
+    elif backend == 'sqlite':
+        store = SQLiteVerificationStore(path)
+    else:
+        raise ValueError(f"Backend de verificación desconocido: {backend}")
+    if sweep:
+        store.start_sweeper()
+    return store
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_verification_store():
+    """Devuelve el almacén compartido del proceso (se crea en el primer uso)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = load_verification_store()
+    return _store
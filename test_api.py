@@ -0,0 +1,88 @@
+import pytest
+from langgraph.checkpoint.memory import MemorySaver
+from starlette.testclient import TestClient
+from benchmarks.fakes import ScriptedAgentModel
+from langgraph_components.graph import load_graph
+from langgraph_components.llm import ResponseCache
+import api
+from api import create_app
+
+AUTH = {"Authorization": "Bearer secreto"}
+graphs = []
+
+
+@pytest.fixture(autouse=True)
+def api_token(monkeypatch):
+    monkeypatch.setattr(api, 'API_TOKEN', 'secreto')
+
+
+def fake_graph():
+    model = ScriptedAgentModel(tool_calls=[("get_current_datetime", {})], answer="Hola, ¿en qué te ayudo?")
+    graph = load_graph(checkpointer=MemorySaver(), llm=model, cache=ResponseCache(max_entries=0))
+    graphs.insert(0, graph)
+    return graph
+
+
+def client_for(graph_factory):
+    return TestClient(create_app(graph_factory), headers=AUTH)
+
+
+def new_thread(client):
+    return client.post("/threads", json={"email": "a@example.com"}).json()["thread_id"]
+
+
+def test_rest_turn_is_stored_under_the_thread_id():
+    with client_for(fake_graph) as client:
+        thread_id = new_thread(client)
+        # El thread_id lo genera el servidor y no lleva datos del cliente
+        assert "a@example.com" not in thread_id
+
+        response = client.post(f"/threads/{thread_id}/messages", json={"content": "Hola"})
+        assert response.status_code == 200
+        assert response.json() == {"thread_id": thread_id, "response": "Hola, ¿en qué te ayudo?",
+                                   "tools": ["get_current_datetime"]}
+
+        client.post(f"/threads/{thread_id}/messages", json={"content": "Otra pregunta"})
+        assert client.post(f"/threads/{thread_id}/messages", json={}).status_code == 400
+    history = graphs[0].get_state({"configurable": {"thread_id": thread_id}}).values["messages"]
+    assert [m.content for m in history if m.type == "human"] == ["Hola", "Otra pregunta"]
+
+
+def test_sse_stream_emits_tool_and_final_events():
+    with client_for(fake_graph) as client:
+        with client.stream("POST", f"/threads/{new_thread(client)}/stream", json={"content": "Hola"}) as response:
+            assert response.headers["content-type"].startswith("text/event-stream")
+            events = [line.split(": ", 1)[1] for line in response.iter_lines() if line.startswith("event: ")]
+    # La respuesta llega palabra a palabra antes del evento final
+    assert events == ["tool_start", "tool_end"] + ["token"] * 5 + ["final"]
+
+
+def test_websocket_keeps_the_conversation_open():
+    with client_for(fake_graph) as client:
+        with client.websocket_connect(f"/threads/{new_thread(client)}/ws") as ws:
+            for _ in range(2):
+                ws.send_json({"content": "Hola"})
+                kinds = []
+                while not kinds or kinds[-1] != "final":
+                    kinds.append(ws.receive_json()["type"])
+                assert kinds == ["tool_start", "tool_end"] + ["token"] * 5 + ["final"]
+
+
+def test_client_chosen_or_forged_thread_ids_are_rejected():
+    with client_for(fake_graph) as client:
+        thread_id = new_thread(client)
+        for forged in ("a@example.com-1234", thread_id[:-1] + ("0" if thread_id[-1] != "0" else "1")):
+            response = client.post(f"/threads/{forged}/messages", json={"content": "Hola"})
+            assert response.status_code == 404
+        assert client.post(f"/threads/{thread_id}/messages", json={"content": "Hola"},
+                           headers={"Authorization": "Bearer otro"}).status_code == 401
+
+
+def test_api_refuses_to_start_without_a_token(monkeypatch):
+    monkeypatch.setattr(api, 'API_TOKEN', None)
+    with pytest.raises(RuntimeError):
+        with TestClient(create_app(fake_graph)):
+            pass
+    monkeypatch.setattr(api, 'API_INSECURE_DEV', True)
+    with TestClient(create_app(fake_graph)) as client:
+        assert client.post("/threads").status_code == 201
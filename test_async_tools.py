@@ -0,0 +1,97 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from benchmarks.fakes import FakeCalendarService
+from langgraph_components import graph_tools, rate_limiter, verification_store
+from langgraph_components.availability import FreeBusyIndex
+from langgraph_components.calendar_mirror import CalendarMirror
+from langgraph_components.rate_limiter import MemoryRateLimiter
+from langgraph_components.verification_store import MemoryVerificationStore
+from test_calendar_mirror import make_event
+
+NEXT_MONDAY = (datetime.now() + timedelta(days=7 - datetime.now().weekday())).strftime("%d/%m/%Y")
+
+CASES = [
+    ("create_calendar_event", {"date": NEXT_MONDAY, "time": "10:00", "client_name": "Ana",
+                               "client_email": "ana@example.com", "reason": "Asesoría", "is_verified": True}),
+    ("create_calendar_event", {"date": NEXT_MONDAY, "time": "18:00", "client_name": "Ana",
+                               "client_email": "ana@example.com", "reason": "Asesoría", "is_verified": True}),
+    ("create_calendar_event", {"date": "31/02/2025", "time": "10:00", "client_name": "Ana",
+                               "client_email": "ana@example.com", "reason": "Asesoría", "is_verified": True}),
+    ("create_calendar_event", {"date": NEXT_MONDAY, "time": "10:00", "client_name": "Ana",
+                               "client_email": "ana@example.com", "reason": "Asesoría"}),
+    ("modify_calendar_event", {"event_id": "evt1", "client_email": "ana@example.com", "new_time": "15:00",
+                               "is_verified": True}),
+    ("modify_calendar_event", {"event_id": "evt4", "client_email": "ana@example.com", "new_time": "15:00",
+                               "is_verified": True}),
+    ("modify_calendar_events", {"changes": [{"event_id": "evt1", "new_time": "15:00"},
+                                            {"event_id": "evt2", "new_date": "03/03/2025", "new_time": "15:00"}],
+                                "client_email": "ana@example.com", "is_verified": True}),
+    ("cancel_calendar_event", {"event_id": "evt2", "client_email": "ana@example.com", "is_verified": True}),
+    ("cancel_calendar_events", {"event_ids": ["evt1", "evt3", "evt4", "no-existe"],
+                                "client_email": "ana@example.com", "is_verified": True}),
+    ("cancel_calendar_events", {"event_ids": ["evt1"], "client_email": "ana@example.com"}),
+    ("search_calendar_event", {"time_min": "01/03/2025", "time_max": "31/03/2025",
+                               "client_email": "ana@example.com"}),
+    ("find_available_slots", {"count": 3, "from_date": NEXT_MONDAY}),
+    ("find_available_slots", {"count": 3, "from_date": "mañana"}),
+    ("get_current_datetime", {}),
+    ("send_verification_code", {"email": "ana@example.com"}),
+    ("verify_code", {"email": "ana@example.com", "code": "123456"}),
+    ("verify_code", {"email": "ana@example.com", "code": "000000"}),
+]
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.queued = []
+
+    def recently_queued(self, email):
+        return email in self.queued
+
+    def enqueue(self, email, message):
+        self.queued.append(email)
+
+
+def environment(monkeypatch):
+    """Calendario, espejo, índice de horarios, códigos y límites nuevos para cada llamada."""
+    service = FakeCalendarService()
+    for day, email in ((3, 'ana@example.com'), (4, 'ana@example.com'), (5, 'ana@example.com'),
+                       (6, 'luis@example.com')):
+        make_event(service, day, 10, email)
+    mirror = CalendarMirror(lambda: service, past_days=None)
+    mirror.sync()
+    availability = FreeBusyIndex(lambda: service)
+    store = MemoryVerificationStore()
+    store.save("ana@example.com", "123456")
+    outbox = FakeOutbox()
+    monkeypatch.setattr(graph_tools, 'get_calendar_service', lambda: service)
+    monkeypatch.setattr(graph_tools, 'get_mirror', lambda: mirror)
+    monkeypatch.setattr(graph_tools, 'get_availability', lambda: availability)
+    monkeypatch.setattr(graph_tools, 'get_email_outbox', lambda: outbox)
+    monkeypatch.setattr(graph_tools, 'generate_verification_code', lambda: '123456')
+    monkeypatch.setattr(verification_store, '_store', store)
+    monkeypatch.setattr(rate_limiter, '_limiter', MemoryRateLimiter())
+    return service, outbox
+
+
+def outcome(service, outbox):
+    """Estado que deja la herramienta: citas (también las canceladas) y correos encolados."""
+    # 'updated' es la hora de la escritura: puede cambiar de segundo entre las dos ejecuciones
+    events = {event_id: {key: value for key, value in event.items() if key != 'updated'}
+              for event_id, event in service.all_events.items()}
+    return events, outbox.queued
+
+
+@pytest.mark.parametrize("name,args", CASES)
+def test_async_tool_matches_the_sync_tool(name, args, monkeypatch):
+    tool = next(t for t in graph_tools.tools if t.name == name)
+
+    env = environment(monkeypatch)
+    result = tool.invoke(dict(args))
+    state = outcome(*env)
+
+    env = environment(monkeypatch)
+    async_result = asyncio.run(tool.ainvoke(dict(args)))
+    assert async_result == result
+    assert outcome(*env) == state
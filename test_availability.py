@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from benchmarks.fakes import FakeCalendarService
+from langgraph_components.availability import FreeBusyIndex
+
+BOGOTA = ZoneInfo('America/Bogota')
+
+
+def book(service, start):
+    body = {
+        'summary': 'Cita',
+        'start': {'dateTime': start.replace(tzinfo=None).isoformat(), 'timeZone': 'America/Bogota'},
+        'end': {'dateTime': (start + timedelta(hours=1)).replace(tzinfo=None).isoformat(), 'timeZone': 'America/Bogota'},
+    }
+    return service.events().insert(calendarId='primary', body=body).execute()
+
+
+def next_monday():
+    today = datetime.now(BOGOTA).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today + timedelta(days=7 - today.weekday())
+
+
+def test_next_open_slots_skips_busy_hours_and_weekends():
+    service = FakeCalendarService()
+    monday = next_monday()
+    for hour in range(9, 16):
+        book(service, monday.replace(hour=hour))
+    index = FreeBusyIndex(lambda: service)
+
+    slots = index.next_open_slots(count=4, after=monday)
+    assert slots[0] == monday.replace(hour=16)
+    assert slots[1:] == [monday.replace(hour=h) + timedelta(days=1) for h in (9, 10, 11)]
+    assert index.stats['queries'] == 1
+
+    friday_afternoon = monday.replace(hour=16) + timedelta(days=4)
+    assert index.next_open_slots(count=2, after=friday_afternoon) == [
+        friday_afternoon, monday.replace(hour=9) + timedelta(days=7)
+    ]
+
+
+def test_own_bookings_update_the_index_without_new_queries():
+    service = FakeCalendarService()
+    monday = next_monday()
+    index = FreeBusyIndex(lambda: service)
+    slot = monday.replace(hour=10)
+    assert index.is_free(slot, slot + timedelta(hours=1))
+
+    index.add_busy(slot, slot + timedelta(hours=1))
+    assert not index.is_free(slot, slot + timedelta(hours=1))
+    index.remove_busy(slot, slot + timedelta(hours=1))
+    assert index.is_free(slot, slot + timedelta(hours=1))
+    assert index.stats['queries'] == 1
+
+
+def test_booking_during_an_async_query_is_not_overwritten():
+    service = FakeCalendarService(latency=0.05)
+    monday = next_monday()
+    index = FreeBusyIndex(lambda: service)
+    slot = monday.replace(hour=11)
+
+    async def run():
+        query = asyncio.ensure_future(index.abusy_between(monday, monday + timedelta(days=1)))
+        await asyncio.sleep(0.01)
+        # La cita se agenda mientras freebusy responde con el calendario de antes
+        index.add_busy(slot, slot + timedelta(hours=1))
+        await query
+    asyncio.run(run())
+
+    assert not index.is_free(slot, slot + timedelta(hours=1))
+    assert index.stats['queries'] == 1
+
+
+def test_far_future_lookups_keep_the_near_term_window():
+    service = FakeCalendarService()
+    monday = next_monday()
+    index = FreeBusyIndex(lambda: service)
+    index.is_free(monday.replace(hour=9), monday.replace(hour=10))
+    far = monday + timedelta(days=45)
+    index.is_free(far.replace(hour=9), far.replace(hour=10))
+    index.is_free(monday.replace(hour=15), monday.replace(hour=16))
+    assert index.stats == {'queries': 2, 'hits': 1}
+    assert index.get_stats()['windows'] == 2
+
+
+def test_sync_query_runs_outside_the_index_lock():
+    service = FakeCalendarService(latency=0.2)
+    monday = next_monday()
+    index = FreeBusyIndex(lambda: service)
+    slot = monday.replace(hour=11)
+
+    query = threading.Thread(target=index.busy_between, args=(monday, monday + timedelta(days=1)))
+    query.start()
+    time.sleep(0.05)
+    # Mientras freebusy responde, el índice sigue disponible para otras operaciones
+    start = time.perf_counter()
+    index.add_busy(slot, slot + timedelta(hours=1))
+    assert time.perf_counter() - start < 0.1
+    query.join()
+
+    assert not index.is_free(slot, slot + timedelta(hours=1))
+    assert index.stats['queries'] == 1
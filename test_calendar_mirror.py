@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from benchmarks.fakes import FakeCalendarService
+from langgraph_components.calendar_mirror import CalendarMirror
+
+BOGOTA = ZoneInfo('America/Bogota')
+
+
+def make_event(service, day, hour, email, summary="Cita con Ana"):
+    body = {
+        'summary': summary,
+        'description': f'Motivo: Asesoría\nCorreo: {email}',
+        'start': {'dateTime': f'2025-03-{day:02d}T{hour:02d}:00:00', 'timeZone': 'America/Bogota'},
+        'end': {'dateTime': f'2025-03-{day:02d}T{hour + 1:02d}:00:00', 'timeZone': 'America/Bogota'},
+        'attendees': [{'email': email}],
+    }
+    return service.events().insert(calendarId='primary', body=body).execute()
+
+
+def test_search_reads_from_mirror_after_sync():
+    service = FakeCalendarService()
+    for day in range(1, 6):
+        make_event(service, day, 10, 'ana@example.com')
+    make_event(service, 3, 11, 'luis@example.com', summary="Cita con Luis")
+    mirror = CalendarMirror(lambda: service, past_days=None)
+    assert mirror.search() is None  # sin sincronizar: el llamador debe ir a la API
+
+    mirror.sync()
+    calls = service.calls
+    since = datetime(2025, 3, 3, tzinfo=ZoneInfo('America/Bogota'))
+    results = mirror.search(query="ana", time_min=since)
+    assert [e['start']['dateTime'][:10] for e in results] == ['2025-03-03', '2025-03-04', '2025-03-05']
+    assert [e['summary'] for e in mirror.search(attendee='LUIS@example.com')] == ["Cita con Luis"]
+    until = datetime(2025, 3, 4, tzinfo=ZoneInfo('America/Bogota'))
+    assert len(mirror.search(query="ana", time_min=since, time_max=until)) == 1
+    assert service.calls == calls
+    assert mirror.get_stats()['hits'] == 3
+
+
+def test_incremental_sync_applies_changes_and_deletions():
+    service = FakeCalendarService()
+    first = make_event(service, 1, 10, 'ana@example.com')
+    second = make_event(service, 2, 10, 'ana@example.com')
+    mirror = CalendarMirror(lambda: service, past_days=None)
+    mirror.sync()
+
+    moved = dict(second, start={'dateTime': '2025-03-09T15:00:00', 'timeZone': 'America/Bogota'})
+    service.events().update(calendarId='primary', eventId=second['id'], body=moved).execute()
+    service.events().delete(calendarId='primary', eventId=first['id']).execute()
+    make_event(service, 4, 9, 'nuevo@example.com')
+    mirror.sync()
+
+    assert mirror.get(first['id']) is None
+    assert mirror.get(second['id'])['start']['dateTime'] == '2025-03-09T15:00:00'
+    assert [e['start']['dateTime'] for e in mirror.search()] == ['2025-03-04T09:00:00', '2025-03-09T15:00:00']
+    assert mirror.stats['incremental_syncs'] == 1
+
+
+def test_expired_sync_token_triggers_full_resync():
+    service = FakeCalendarService()
+    make_event(service, 1, 10, 'ana@example.com')
+    mirror = CalendarMirror(lambda: service, past_days=None)
+    mirror.sync()
+    make_event(service, 2, 10, 'ana@example.com')
+    service.expire_sync_tokens()
+    mirror.sync()
+    assert mirror.stats['full_syncs'] == 2
+    assert len(mirror.search()) == 2
+
+
+def test_stale_mirror_falls_back_to_api():
+    service = FakeCalendarService()
+    event = make_event(service, 1, 10, 'ana@example.com')
+    mirror = CalendarMirror(lambda: service, max_staleness=0, past_days=None)
+    mirror.sync()
+    mirror._last_sync -= 1
+    assert mirror.search() is None
+    assert mirror.get(event['id']) is None
+    assert mirror.get_stats()['misses'] == 2
+
+
+def event_at(service, start, email='ana@example.com'):
+    body = {
+        'summary': 'Cita con Ana',
+        'start': {'dateTime': start.strftime('%Y-%m-%dT%H:00:00'), 'timeZone': 'America/Bogota'},
+        'end': {'dateTime': (start + timedelta(hours=1)).strftime('%Y-%m-%dT%H:00:00'), 'timeZone': 'America/Bogota'},
+        'attendees': [{'email': email}],
+    }
+    return service.events().insert(calendarId='primary', body=body).execute()
+
+
+def test_full_sync_only_copies_recent_events():
+    service = FakeCalendarService()
+    today = datetime.now(BOGOTA).replace(hour=10, minute=0, second=0, microsecond=0)
+    old = event_at(service, today - timedelta(days=60))
+    recent = event_at(service, today - timedelta(days=5))
+    mirror = CalendarMirror(lambda: service, past_days=30)
+    mirror.sync()
+
+    assert mirror.get_stats()['events'] == 1
+    assert mirror.get(old['id']) is None
+    assert [e['id'] for e in mirror.search(time_min=today - timedelta(days=7))] == [recent['id']]
+    # Antes del límite (o sin fecha inicial) el espejo no sabe la respuesta completa
+    assert mirror.search(time_min=today - timedelta(days=90)) is None
+    assert mirror.search(attendee='ana@example.com') is None
+
+
+def test_own_changes_during_a_full_sync_survive_the_snapshot():
+    service = FakeCalendarService()
+    cancelled = make_event(service, 1, 10, 'ana@example.com')
+    mirror = CalendarMirror(lambda: service, past_days=None)
+    list_pages = mirror._list_pages
+    created = []
+
+    def pages(service, **params):
+        yield from list_pages(service, **params)
+        # Cita agendada y otra cancelada cuando la API ya respondió pero aún no se cambia el espejo
+        created.append(make_event(service, 2, 10, 'luis@example.com'))
+        mirror.upsert(created[0])
+        service.events().delete(calendarId='primary', eventId=cancelled['id']).execute()
+        mirror.remove(cancelled['id'])
+    mirror._list_pages = pages
+    mirror.sync()
+
+    assert mirror.get(created[0]['id']) is not None
+    assert mirror.get(cancelled['id']) is None
+    assert [e['id'] for e in mirror.search()] == [created[0]['id']]
@@ -0,0 +1,62 @@
+import asyncio
+from benchmarks.fakes import FakeCalendarService
+from langgraph_components import graph_tools
+from langgraph_components.availability import FreeBusyIndex
+from langgraph_components.calendar_mirror import CalendarMirror
+from test_calendar_mirror import make_event
+
+
+def calendar(monkeypatch):
+    service = FakeCalendarService()
+    events = [make_event(service, day, 10, 'ana@example.com') for day in (3, 4, 5)]
+    events.append(make_event(service, 6, 10, 'luis@example.com'))
+    mirror = CalendarMirror(lambda: service, past_days=None)
+    mirror.sync()
+    monkeypatch.setattr(graph_tools, 'get_calendar_service', lambda: service)
+    monkeypatch.setattr(graph_tools, 'get_mirror', lambda: mirror)
+    monkeypatch.setattr(graph_tools, 'get_availability', lambda: FreeBusyIndex(lambda: service))
+    return service, [event['id'] for event in events]
+
+
+def test_stale_copy_is_patched_after_an_etag_conflict(monkeypatch):
+    service, (first, *_) = calendar(monkeypatch)
+    # Otra persona edita la cita después de la sincronización del espejo
+    service.events().patch(calendarId='primary', eventId=first, body={'location': 'Oficina 2'}).execute()
+
+    result = graph_tools.modify_calendar_event.invoke({
+        "event_id": first, "client_email": "ana@example.com", "new_time": "15:00", "is_verified": True})
+    assert result.startswith("¡Cita modificada exitosamente!")
+    event = service.all_events[first]
+    assert event['start']['dateTime'] == '2025-03-03T15:00:00'
+    assert event['location'] == 'Oficina 2'  # el patch no pisa el cambio ajeno
+
+
+def test_series_is_cancelled_in_one_batch_with_a_result_per_appointment(monkeypatch):
+    service, (first, second, _, other) = calendar(monkeypatch)
+    calls = service.calls
+
+    result = graph_tools.cancel_calendar_events.invoke({
+        "event_ids": [first, second, other, "no-existe"], "client_email": "ana@example.com", "is_verified": True})
+    lines = result.splitlines()
+    assert lines[0].startswith(f"{first}: ¡Cita cancelada")
+    assert lines[1].startswith(f"{second}: ¡Cita cancelada")
+    assert lines[2] == f"{other}: No tienes permiso para cancelar esta cita"
+    assert lines[3] == "no-existe: No se encontró la cita especificada"
+    # Un get de la cita desconocida y un batch con las dos cancelaciones
+    assert service.calls - calls == 2
+    assert service.batches == 1
+    assert service.all_events[first]['status'] == 'cancelled'
+    assert service.all_events[other]['status'] == 'confirmed'
+
+
+def test_batch_reschedule_does_not_double_book_a_slot(monkeypatch):
+    service, (first, second, third, _) = calendar(monkeypatch)
+    changes = [{"event_id": first, "new_date": "10/03/2025", "new_time": "09:00"},
+               {"event_id": second, "new_date": "10/03/2025", "new_time": "09:00"},
+               {"event_id": third, "new_time": "20:00"}]
+
+    lines = asyncio.run(graph_tools.amodify_calendar_events(changes, "ana@example.com", True)).splitlines()
+    assert lines[0].startswith(f"{first}: ¡Cita modificada")
+    assert lines[1] == f"{second}: {graph_tools.SLOT_TAKEN_MESSAGE}"
+    assert lines[2] == f"{third}: {graph_tools.OFFICE_HOURS_MESSAGE}"
+    assert service.all_events[first]['start']['dateTime'] == '2025-03-10T09:00:00'
@@ -0,0 +1,53 @@
+import asyncio
+from benchmarks.fakes import FakeCalendarService
+from langgraph_components import graph_tools
+from langgraph_components.calendar_mirror import CalendarMirror
+from test_calendar_mirror import make_event
+
+
+def calendar(monkeypatch, synced):
+    service = FakeCalendarService()
+    for day in range(1, 11):
+        for hour in range(9, 17):
+            make_event(service, day, hour, 'ana@example.com' if hour % 2 else 'luis@example.com')
+    mirror = CalendarMirror(lambda: service, past_days=None)
+    if synced:
+        mirror.sync()
+    monkeypatch.setattr(graph_tools, 'get_calendar_service', lambda: service)
+    monkeypatch.setattr(graph_tools, 'get_mirror', lambda: mirror)
+    monkeypatch.setattr(graph_tools, 'TOOL_RESULT_FORMAT', 'compact')
+    return service
+
+
+def search(**args):
+    return graph_tools.search_calendar_event.invoke(args).splitlines()
+
+
+def test_api_search_filters_by_window_and_attendee(monkeypatch):
+    service = calendar(monkeypatch, synced=False)
+    monkeypatch.setattr(graph_tools, 'SEARCH_PAGE_SIZE', 3)
+
+    lines = search(time_min="03/03/2025", time_max="04/03/2025", client_email="ana@example.com")
+    assert lines[0].startswith("8 citas")
+    assert [line.split("|")[1] for line in lines[1:3]] == ["03/03 09:00", "03/03 11:00"]
+    assert lines[-1].split("|")[1] == "04/03 15:00"
+    # 8 citas en páginas de 3: la API se consulta 3 veces
+    assert service.calls == 80 + 3
+
+    async_lines = asyncio.run(graph_tools.asearch_calendar_event(
+        time_min="03/03/2025", time_max="04/03/2025", client_email="ana@example.com")).splitlines()
+    assert async_lines == lines
+
+
+def test_pages_are_fetched_lazily_up_to_the_limit(monkeypatch):
+    for synced in (False, True):
+        service = calendar(monkeypatch, synced)
+        monkeypatch.setattr(graph_tools, 'SEARCH_PAGE_SIZE', 4)
+        monkeypatch.setattr(graph_tools, 'SEARCH_MAX_RESULTS', 5)
+        calls = service.calls
+
+        lines = search(client_email="luis@example.com")
+        assert lines[0].startswith("5 citas")
+        assert "Hay más de 5 citas" in lines[-1]
+        # 6 citas (una más que el máximo) en páginas de 4; con el espejo, ninguna petición
+        assert service.calls - calls == (0 if synced else 2)
@@ -0,0 +1,80 @@
+from langchain_core.messages import AIMessage
+from langgraph.graph import StateGraph, MessagesState, START, END
+from langgraph_components import metrics
+from langgraph_components.checkpointers import BoundedMemorySaver, SQLiteSaver, load_checkpointer
+
+
+def echo_graph(checkpointer):
+    """Grafo mínimo sin modelo: responde repitiendo el último mensaje."""
+    def echo(state):
+        return {"messages": [AIMessage(content=f"eco: {state['messages'][-1].content}")]}
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("echo", echo)
+    builder.add_edge(START, "echo")
+    builder.add_edge("echo", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+def talk(graph, thread_id, *texts):
+    config = {"configurable": {"thread_id": thread_id}}
+    for text in texts:
+        graph.invoke({"messages": [("user", text)]}, config)
+    return [m.content for m in graph.get_state(config).values.get("messages", [])]
+
+
+def test_pruned_thread_keeps_its_latest_state():
+    saver = BoundedMemorySaver(max_threads=2, max_checkpoints_per_thread=3)
+    graph = echo_graph(saver)
+
+    assert talk(graph, "a", "1", "2", "3", "4", "5")[-2:] == ["5", "eco: 5"]
+    checkpoints = saver.storage["a"][""]
+    assert len(checkpoints) == 3
+    assert saver.stats['pruned_checkpoints'] > 0
+    # Los blobs que quedan son exactamente los que referencian los checkpoints conservados
+    referenced = {(thread_id, ns, channel, version)
+                  for (thread_id, ns, _), versions in saver._versions.items()
+                  for channel, version in versions.items()}
+    assert set(saver.blobs) <= referenced
+    assert all(snapshot.values for snapshot in graph.get_state_history({"configurable": {"thread_id": "a"}}))
+
+    # La conversación podada sigue con todo su historial
+    messages = talk(graph, "a", "6")
+    assert len(messages) == 12 and messages[-1] == "eco: 6"
+
+    # Con max_threads=2 la conversación menos usada se expulsa entera
+    talk(graph, "b", "hola")
+    talk(graph, "c", "hola")
+    assert "a" not in saver.storage and not any(key[0] == "a" for key in saver.blobs)
+    assert talk(graph, "a") == []
+    assert saver.get_stats()['threads'] == 2
+
+
+def test_sqlite_checkpoints_survive_a_restart_and_compaction(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    talk(echo_graph(SQLiteSaver(path)), "t1", "1", "2", "3")
+
+    # Otro proceso (o un reinicio) abre el mismo archivo
+    saver = SQLiteSaver(path)
+    graph = echo_graph(saver)
+    assert len(talk(graph, "t1", "4")) == 8
+
+    assert saver.compact(keep_last=2) > 0
+    assert saver.get_stats()['checkpoints'] == 2
+    # Tras compactar, el último estado está completo y la conversación continúa
+    messages = talk(graph, "t1", "5")
+    assert messages[:2] == ["1", "eco: 1"] and messages[-1] == "eco: 5" and len(messages) == 10
+
+    # Las conversaciones inactivas más allá del TTL se eliminan enteras
+    saver.compact(ttl=-1)
+    assert saver.get_stats() == {'threads': 0, 'checkpoints': 0, 'bytes_retained': 0}
+
+
+def test_loaded_checkpointer_is_exported_as_metrics():
+    graph = echo_graph(load_checkpointer('memory'))
+    talk(graph, "a", "1")
+    talk(graph, "b", "1")
+    rendered = metrics.metrics.render()
+    assert "checkpointer_threads 2.0" in rendered
+    assert "checkpointer_bytes_retained " in rendered
+    assert "checkpointer_evicted_threads_total 0.0" in rendered
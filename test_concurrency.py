@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import time
+from langgraph_components.concurrency import get_concurrency_stats, limit_concurrency
+
+
+def test_sync_and_async_versions_share_one_limit():
+    running = []
+    peak = []
+
+    def enter():
+        running.append(1)
+        peak.append(len(running))
+
+    @limit_concurrency(2)
+    def lookup_shared():
+        enter()
+        time.sleep(0.05)
+        running.pop()
+
+    @limit_concurrency(2)
+    async def alookup_shared():
+        enter()
+        await asyncio.sleep(0.05)
+        running.pop()
+
+    async def run_async():
+        await asyncio.gather(*(alookup_shared() for _ in range(4)))
+
+    threads = [threading.Thread(target=lookup_shared) for _ in range(4)]
+    threads.append(threading.Thread(target=asyncio.run, args=(run_async(),)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 2
+    stats = get_concurrency_stats()['lookup_shared']
+    assert stats['calls'] == 8 and stats['in_flight'] == 0 and stats['peak'] == 2
+    assert 'alookup_shared' not in get_concurrency_stats()
+
+
+def test_cancelled_waiter_gives_its_slot_back():
+    @limit_concurrency(1)
+    async def acancel_shared():
+        await asyncio.sleep(0.05)
+
+    async def run():
+        first = asyncio.create_task(acancel_shared())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(acancel_shared())
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await first
+        await asyncio.wait_for(acancel_shared(), 1)
+
+    asyncio.run(run())
+    assert get_concurrency_stats()['cancel_shared']['in_flight'] == 0
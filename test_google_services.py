@@ -0,0 +1,136 @@
+import os
+import pickle
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import pytest
+from langgraph_components.google_services import CredentialManager, ServiceRegistry
+
+
+def utcnow():
+    # google-auth guarda expiry como datetime UTC sin zona horaria
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class FakeCredentials:
+    """Credenciales OAuth mínimas: refresh() tarda un poco y cambia el token."""
+
+    refreshes = 0
+
+    def __init__(self, token="viejo", expired=True):
+        self.token = token
+        self.refresh_token = "refresh"
+        self.expiry = utcnow() + (timedelta(minutes=-1) if expired else timedelta(hours=1))
+
+    @property
+    def valid(self):
+        return self.expiry > utcnow()
+
+    def refresh(self, request):
+        time.sleep(0.05)
+        FakeCredentials.refreshes += 1
+        self.token = f"nuevo-{FakeCredentials.refreshes}"
+        self.expiry = utcnow() + timedelta(hours=1)
+
+
+def write_token(path, creds):
+    with open(path, 'wb') as f:
+        pickle.dump(creds, f)
+
+
+def test_concurrent_refreshes_share_one_request(tmp_path):
+    token_file = str(tmp_path / "token.pickle")
+    write_token(token_file, FakeCredentials())
+    manager = CredentialManager(token_file=token_file)
+    FakeCredentials.refreshes = 0
+
+    barrier = threading.Barrier(8)
+    tokens = []
+
+    def worker():
+        barrier.wait()
+        tokens.append(manager.get().token)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert FakeCredentials.refreshes == 1
+    assert tokens == ["nuevo-1"] * 8
+    assert manager.stats == {'refreshes': 1, 'persists': 1, 'reloads': 0}
+    with open(token_file, 'rb') as f:
+        assert pickle.load(f).token == "nuevo-1"
+    # Con el token vigente no se vuelve a tocar disco ni red
+    assert manager.is_fresh() and manager.get().token == "nuevo-1"
+
+
+def test_failed_persist_keeps_the_previous_token_file(tmp_path, monkeypatch):
+    token_file = str(tmp_path / "token.pickle")
+    write_token(token_file, FakeCredentials(token="original"))
+    manager = CredentialManager(token_file=token_file)
+
+    def broken_fsync(fd):
+        raise OSError("disco lleno")
+    monkeypatch.setattr(os, 'fsync', broken_fsync)
+
+    with pytest.raises(OSError):
+        manager.get()
+    # Ni archivo a medio escribir ni temporales huérfanos
+    assert os.listdir(tmp_path) == ["token.pickle"]
+    with open(token_file, 'rb') as f:
+        assert pickle.load(f).token == "original"
+
+
+def registry(manager, monkeypatch):
+    services = ServiceRegistry(manager)
+    monkeypatch.setattr(services, '_build', lambda api, version, creds: (api, version, creds.token))
+    return services
+
+
+def test_registry_reuses_clients_until_the_credentials_change(tmp_path, monkeypatch):
+    token_file = str(tmp_path / "token.pickle")
+    write_token(token_file, FakeCredentials(token="uno", expired=False))
+    manager = CredentialManager(token_file=token_file)
+    services = registry(manager, monkeypatch)
+
+    calendar = services.get('calendar', 'v3')
+    assert services.get('calendar', 'v3') is calendar
+    assert services.get_stats() == {'builds': 1, 'reuses': 1, 'services': 1}
+
+    # Tras reload() se relee token.pickle y el cliente se construye con las credenciales nuevas
+    write_token(token_file, FakeCredentials(token="dos", expired=False))
+    manager.reload()
+    assert services.get('calendar', 'v3') == ('calendar', 'v3', 'dos')
+    assert services.get_stats()['builds'] == 2
+
+
+def test_rotated_token_file_is_picked_up_without_reload(tmp_path, monkeypatch):
+    token_file = str(tmp_path / "token.pickle")
+    write_token(token_file, FakeCredentials(token="uno", expired=False))
+    manager = CredentialManager(token_file=token_file, check_interval=0)
+    services = registry(manager, monkeypatch)
+    assert services.get('gmail', 'v1') == ('gmail', 'v1', 'uno')
+
+    write_token(token_file, FakeCredentials(token="rotado", expired=False))
+    os.utime(token_file, ns=(time.time_ns(), time.time_ns() + 10**9))
+    assert services.get('gmail', 'v1') == ('gmail', 'v1', 'rotado')
+    assert manager.stats['reloads'] == 1
+    # Sin más cambios en disco el cliente se reutiliza
+    assert services.get('gmail', 'v1') == ('gmail', 'v1', 'rotado')
+    assert services.get_stats()['builds'] == 2
+
+
+def test_refresh_keeps_the_client_and_does_not_count_as_rotation(tmp_path, monkeypatch):
+    token_file = str(tmp_path / "token.pickle")
+    write_token(token_file, FakeCredentials(expired=False))
+    manager = CredentialManager(token_file=token_file, check_interval=0)
+    services = registry(manager, monkeypatch)
+    calendar = services.get('calendar', 'v3')
+
+    # El token refrescado se escribe en token.pickle, pero es el mismo objeto de credenciales
+    manager._creds.expiry = utcnow()
+    services.get('calendar', 'v3')
+    assert services.get('calendar', 'v3') is calendar
+    assert manager.stats['refreshes'] == 1 and manager.stats['reloads'] == 0
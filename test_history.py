@@ -0,0 +1,83 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langgraph_components.history import estimate_tokens, trim_history, HISTORY_MAX_TOKENS
+
+
+def build_conversation(turns):
+    messages = [
+        HumanMessage(content="Mi correo es cliente@example.com"),
+        AIMessage(content="", tool_calls=[{
+            "name": "verify_code", "args": {"email": "cliente@example.com", "code": "123456"}, "id": "call-verify"
+        }]),
+        ToolMessage(content="true", tool_call_id="call-verify", name="verify_code"),
+        AIMessage(content="", tool_calls=[{
+            "name": "create_calendar_event",
+            "args": {"date": "20/03/2025", "time": "10:00", "client_name": "Ana",
+                     "client_email": "cliente@example.com", "reason": "Asesoría", "is_verified": True},
+            "id": "call-create"
+        }]),
+        ToolMessage(content="Cita agendada exitosamente. Enlace: https://calendar.google.com/x",
+                    tool_call_id="call-create", name="create_calendar_event"),
+        AIMessage(content="Tu cita quedó agendada para el 20/03/2025 a las 10:00."),
+    ]
+    for i in range(turns - 1):
+        messages.append(HumanMessage(content=f"Pregunta número {i} sobre el proceso legal y los documentos " * 3))
+        messages.append(AIMessage(content=f"Respuesta detallada número {i} del asistente virtual. " * 8))
+    return messages
+
+
+def prompt_tokens(messages):
+    return sum(estimate_tokens(m.content) for m in messages)
+
+
+def test_prompt_size_stays_bounded_over_100_turns():
+    sizes = []
+    for turns in range(1, 101):
+        trimmed = trim_history(build_conversation(turns))
+        sizes.append(prompt_tokens(trimmed))
+    assert max(sizes) <= HISTORY_MAX_TOKENS
+    # A partir de cierto punto el tamaño deja de crecer con la conversación
+    assert max(sizes[50:]) <= max(sizes[:50])
+
+
+def test_verified_facts_survive_trimming():
+    messages = build_conversation(100)
+    trimmed = trim_history(messages)
+    assert len(trimmed) < len(messages)
+    assert isinstance(trimmed[0], SystemMessage)
+    assert "Correo verificado: cliente@example.com" in trimmed[0].content
+    assert "20/03/2025 a las 10:00" in trimmed[0].content
+    # El último mensaje del usuario siempre se envía textualmente
+    assert trimmed[-2].content == messages[-2].content
+
+
+def test_short_conversation_is_untouched():
+    messages = build_conversation(2)
+    assert trim_history(messages) == messages
+
+
+def test_batch_results_survive_trimming():
+    messages = build_conversation(2)
+    messages[6:6] = [
+        AIMessage(content="", tool_calls=[{
+            "name": "modify_calendar_events",
+            "args": {"changes": [{"event_id": "evt1", "new_date": "21/03/2025", "new_time": "11:00"},
+                                 {"event_id": "evt2", "new_time": "12:00"}],
+                     "client_email": "cliente@example.com", "is_verified": True},
+            "id": "call-modify"
+        }]),
+        ToolMessage(content="evt1: ¡Cita modificada exitosamente! Nuevo horario: 21/03/2025 a las 11:00\n"
+                            "evt2: Error al modificar la cita: el horario no está disponible",
+                    tool_call_id="call-modify", name="modify_calendar_events"),
+        AIMessage(content="", tool_calls=[{
+            "name": "cancel_calendar_events",
+            "args": {"event_ids": ["evt3", "evt4"], "client_email": "cliente@example.com", "is_verified": True},
+            "id": "call-cancel"
+        }]),
+        ToolMessage(content="evt3: ¡Cita cancelada exitosamente! 🗑️\nevt4: Error al cancelar la cita: no encontrada",
+                    tool_call_id="call-cancel", name="cancel_calendar_events"),
+    ]
+    messages += build_conversation(100)[6:]
+    facts = trim_history(messages)[0].content
+    assert "Cita evt1 modificada: 21/03/2025 11:00" in facts
+    assert "Cita evt3 cancelada" in facts
+    assert "evt2" not in facts and "evt4" not in facts
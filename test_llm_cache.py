@@ -0,0 +1,87 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+from benchmarks.fakes import ScriptedAgentModel
+from langgraph_components.graph import load_graph, stream_response
+from langgraph_components.llm import ResponseCache
+
+
+def ask(graph, thread_id, content):
+    inputs = {"messages": [{"role": "user", "content": content}], "remaining_steps": 10}
+    return list(stream_response(graph, inputs, {"configurable": {"thread_id": thread_id}}))[-1][1]
+
+
+def test_general_questions_are_answered_from_cache():
+    cache = ResponseCache(similarity=0.8)
+    model = ScriptedAgentModel(answer="Atendemos de lunes a viernes de 9 a 17 h.")
+    graph = load_graph(checkpointer=MemorySaver(), llm=model, cache=cache)
+
+    assert ask(graph, "a", "¿Cuál es el horario de atención?") == model.answer
+    assert ask(graph, "b", "cual es el horario de atencion") == model.answer
+    assert ask(graph, "c", "¿Qué documentos debo llevar a la cita?") == model.answer
+    assert ask(graph, "d", "que documentos debo llevar para la cita") == model.answer
+    assert model.calls == 2
+    stats = cache.get_stats()
+    assert stats['hits'] == 1 and stats['similar_hits'] == 1 and stats['misses'] == 2
+
+
+def test_turns_with_tools_or_personal_data_are_not_cached():
+    cache = ResponseCache()
+    system = SystemMessage(content="prompt")
+    answer = AIMessage(content="Listo.")
+
+    with_email = [system, HumanMessage(content="Mi correo es cliente@example.com")]
+    cache.put(with_email, answer)
+    assert cache.get(with_email) is None
+
+    after_tool = [system, HumanMessage(content="¿Qué horarios hay?"),
+                  AIMessage(content="", tool_calls=[{"name": "find_available_slots", "args": {}, "id": "1"}]),
+                  ToolMessage(content="...", tool_call_id="1")]
+    cache.put(after_tool, answer)
+    general = [system, HumanMessage(content="¿Cómo funciona el agendamiento?")]
+    cache.put(general, AIMessage(content="", tool_calls=[{"name": "get_current_datetime", "args": {}, "id": "2"}]))
+    assert cache.get(general) is None
+    assert cache.get_stats()['stores'] == 0
+
+
+def test_lru_eviction_and_ttl():
+    cache = ResponseCache(max_entries=2, similarity=0)
+    system = SystemMessage(content="prompt")
+    prompts = [[system, HumanMessage(content=question)] for question in ("uno", "dos", "tres")]
+    for prompt in prompts:
+        cache.put(prompt, AIMessage(content="respuesta"))
+    assert cache.get(prompts[0]) is None
+    assert cache.get(prompts[2]) == "respuesta"
+    assert cache.get_stats()['evictions'] == 1
+
+    expired = ResponseCache(ttl=0)
+    expired.put(prompts[0], AIMessage(content="respuesta"))
+    assert expired.get(prompts[0]) is None
+    assert expired.get_stats()['expired'] == 1
+
+
+def test_similar_questions_are_opt_in():
+    system = SystemMessage(content="prompt")
+    cache = ResponseCache()
+    cache.put([system, HumanMessage(content="¿Cuál es el horario de atención?")], AIMessage(content="De 9 a 17 h."))
+    assert cache.get([system, HumanMessage(content="cual es el horario de atencion")]) == "De 9 a 17 h."
+    assert cache.get([system, HumanMessage(content="cual es el horario de atencion hoy")]) is None
+    assert cache.get_stats()['similar_hits'] == 0
+
+
+def test_self_descriptions_are_never_shared_between_users():
+    cache = ResponseCache(similarity=0.8)
+    system = SystemMessage(content="prompt")
+    juan = [system, HumanMessage(content="Hola, soy Juan Perez y quiero asesoria de divorcio")]
+    cache.put(juan, AIMessage(content="Hola Juan, con gusto te ayudo con tu divorcio."))
+    assert cache.get([system, HumanMessage(content="Hola, soy Juana Perez y quiero asesoria de divorcio")]) is None
+    # Sin "soy": el nombre propio basta para no cachear el turno
+    cache.put([system, HumanMessage(content="Buenas, Juan Perez por aquí")], AIMessage(content="Hola Juan."))
+    assert cache.get_stats()['stores'] == 0
+
+
+def test_negated_questions_are_not_similar():
+    cache = ResponseCache(similarity=0.8)
+    system = SystemMessage(content="prompt")
+    cache.put([system, HumanMessage(content="Quiero agendar una cita")], AIMessage(content="¿Para qué fecha?"))
+    assert cache.get([system, HumanMessage(content="No quiero agendar una cita")]) is None
+    assert cache.get([system, HumanMessage(content="quiero agendar una cita!")]) == "¿Para qué fecha?"
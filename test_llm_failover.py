@@ -0,0 +1,102 @@
+import asyncio
+import time
+import pytest
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_openai import ChatOpenAI
+from benchmarks.fakes import FakeChatCompletionsServer
+from langgraph_components.llm import FailoverChatModel, ProviderHealth
+
+
+@pytest.fixture
+def servers():
+    openai = FakeChatCompletionsServer(answer="respuesta de openai")
+    deepseek = FakeChatCompletionsServer(answer="respuesta de deepseek")
+    yield openai, deepseek
+    openai.close()
+    deepseek.close()
+
+
+def client(server):
+    return ChatOpenAI(model="fake", api_key="test", base_url=server.base_url, max_retries=0, timeout=5)
+
+
+def failover_model(servers, **kwargs):
+    openai, deepseek = servers
+    return FailoverChatModel([("openai", client(openai)), ("deepseek", client(deepseek))], **kwargs)
+
+
+def test_errors_fail_over_to_the_next_provider(servers):
+    openai, deepseek = servers
+    model = failover_model(servers, health={"openai": ProviderHealth("openai", failure_threshold=2, cooldown=60),
+                                            "deepseek": ProviderHealth("deepseek")})
+    openai.fail_next(503, 429)
+    assert model.invoke("Hola").content == "respuesta de deepseek"
+    assert model.invoke("Hola").content == "respuesta de deepseek"
+    # Tras dos fallos seguidos OpenAI pasa al final: ya no se le pregunta primero
+    assert model.invoke("Hola").content == "respuesta de deepseek"
+    assert openai.requests == 2 and deepseek.requests == 3
+    stats = model.get_stats()
+    assert stats["openai"]["failures"] == 2 and not stats["openai"]["available"]
+
+
+def test_request_errors_are_not_retried_elsewhere(servers):
+    openai, deepseek = servers
+    model = failover_model(servers)
+    for status in (400, 401, 404):
+        openai.fail_next(status)
+        with pytest.raises(Exception):
+            model.invoke("Hola")
+    assert deepseek.requests == 0
+    assert model.get_stats()["openai"]["failures"] == 0
+
+
+def test_unreachable_provider_fails_over(servers):
+    openai, deepseek = servers
+    openai.close()
+    model = failover_model(servers)
+    assert model.invoke("Hola").content == "respuesta de deepseek"
+    assert model.get_stats()["openai"]["failures"] == 1
+
+
+def test_slow_provider_is_hedged(servers):
+    openai, deepseek = servers
+    openai.latency = 1.0
+    model = failover_model(servers, hedge=True, hedge_delay=0.1)
+
+    start = time.perf_counter()
+    assert model.invoke("Hola").content == "respuesta de deepseek"
+    assert time.perf_counter() - start < 0.8
+
+    start = time.perf_counter()
+    assert asyncio.run(model.ainvoke("Hola")).content == "respuesta de deepseek"
+    assert time.perf_counter() - start < 0.8
+    assert model.get_stats()["deepseek"]["hedge_wins"] == 2
+
+    # Sin demora el primero responde y no hace falta cobertura
+    openai.latency = 0
+    assert model.invoke("Hola").content == "respuesta de openai"
+    assert model.get_stats()["deepseek"]["hedges"] == 2
+
+
+class EventLog(BaseCallbackHandler):
+    def __init__(self):
+        self.events = []
+
+    def on_chat_model_start(self, *args, **kwargs):
+        self.events.append("start")
+
+    def on_llm_end(self, *args, **kwargs):
+        self.events.append("end")
+
+
+def test_losing_request_stops_emitting_callbacks(servers):
+    openai, deepseek = servers
+    openai.latency = 0.5
+    model = failover_model(servers, hedge=True, hedge_delay=0.1)
+    log = EventLog()
+
+    assert model.invoke("Hola", {"callbacks": [log]}).content == "respuesta de deepseek"
+    # La petición a OpenAI termina después, pero su fin ya no llega a los callbacks del grafo
+    time.sleep(0.7)
+    assert openai.requests == 1
+    assert log.events == ["start"]
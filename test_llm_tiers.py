@@ -0,0 +1,52 @@
+import asyncio
+from langgraph.checkpoint.memory import MemorySaver
+from benchmarks.fakes import FakeCalendarService, ScriptedAgentModel
+from langgraph_components import graph_tools
+from langgraph_components.graph import load_graph, stream_response, astream_response
+from langgraph_components.llm import ResponseCache, phase_stats
+
+
+def build(monkeypatch, routing_tool_calls, routing_max_tokens=None):
+    service = FakeCalendarService()
+    monkeypatch.setattr(graph_tools, 'get_calendar_service', lambda: service)
+    routing = ScriptedAgentModel(tool_calls=routing_tool_calls, answer="borrador del modelo rápido",
+                                 max_tokens=routing_max_tokens)
+    answer = ScriptedAgentModel(answer="Respuesta del modelo principal.")
+    graph = load_graph(checkpointer=MemorySaver(), llm=answer, routing_llm=routing,
+                       cache=ResponseCache(max_entries=0))
+    return graph, routing, answer
+
+
+def inputs(content):
+    return {"messages": [{"role": "user", "content": content}], "remaining_steps": 10}
+
+
+def test_routing_model_picks_tools_and_main_model_answers(monkeypatch):
+    graph, routing, answer = build(monkeypatch, [("get_current_datetime", {})])
+    before = phase_stats.get_stats().get('routing', {}).get('calls', 0)
+
+    events = list(stream_response(graph, inputs("¿Tienes algo libre el lunes?"), {"configurable": {"thread_id": "1"}}))
+    assert ("tool_start", "get_current_datetime") in events
+    assert events[-1] == ("final", "Respuesta del modelo principal.")
+    assert routing.calls == 1 and answer.calls == 1
+    stats = phase_stats.get_stats()
+    assert stats['routing']['calls'] == before + 1
+    assert stats['answer']['output_tokens'] > 0
+
+
+def test_turn_without_tools_is_answered_by_the_main_model(monkeypatch):
+    # Con un límite de tokens mínimo el borrador del modelo rápido llegaría cortado
+    graph, routing, answer = build(monkeypatch, [], routing_max_tokens=1)
+    config = {"configurable": {"thread_id": "2"}}
+
+    events = list(stream_response(graph, inputs("Hola, buenos días"), config))
+    assert events[-1] == ("final", "Respuesta del modelo principal.")
+    # El borrador descartado no llega al cliente: solo se transmiten los tokens de la respuesta
+    assert "".join(value for kind, value in events if kind == "token") == "Respuesta del modelo principal."
+    assert routing.calls == 1 and answer.calls == 1
+
+    async def run():
+        return [event async for event in astream_response(graph, inputs("¿Cómo estás?"), config)]
+
+    assert asyncio.run(run())[-1] == ("final", "Respuesta del modelo principal.")
+    assert routing.calls == 2 and answer.calls == 2
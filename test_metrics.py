@@ -0,0 +1,116 @@
+import asyncio
+import json
+from langgraph.checkpoint.memory import MemorySaver
+from starlette.testclient import TestClient
+from benchmarks.fakes import ScriptedAgentModel
+from langgraph_components import metrics
+from langgraph_components.graph import load_graph, stream_response, astream_response
+from langgraph_components.llm import ResponseCache
+from langgraph_components.metrics import MetricsRegistry
+import api
+from api import create_app
+
+
+def fake_graph():
+    model = ScriptedAgentModel(tool_calls=[("get_current_datetime", {})], answer="Hola, ¿en qué te ayudo?")
+    return load_graph(checkpointer=MemorySaver(), llm=model, cache=ResponseCache(max_entries=0))
+
+
+def inputs(content="Hola"):
+    return {"messages": [{"role": "user", "content": content}], "remaining_steps": 10}
+
+
+def tool_calls():
+    return metrics.metrics.histogram_count('span_duration_seconds', kind='tool', name='get_current_datetime')
+
+
+def test_render_uses_the_prometheus_text_format():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    registry.inc('requests_total', provider='openai')
+    registry.inc('requests_total', 2, provider='openai')
+    registry.observe('latency_seconds', 0.5, name='x"y')
+    registry.register_collector(lambda: [('queue_depth', 'gauge', {}, 3), ('ignored', 'gauge', {}, None)])
+
+    lines = registry.render().splitlines()
+    assert '# TYPE requests_total counter' in lines
+    assert 'requests_total{provider="openai"} 3' in lines
+    assert 'latency_seconds_bucket{name="x\\"y",le="0.1"} 0' in lines
+    assert 'latency_seconds_bucket{name="x\\"y",le="1.0"} 1' in lines
+    assert 'latency_seconds_bucket{name="x\\"y",le="+Inf"} 1' in lines
+    assert 'latency_seconds_count{name="x\\"y"} 1' in lines
+    assert 'queue_depth 3.0' in lines
+    assert not any(line.startswith('ignored') for line in lines)
+
+
+def test_disabled_metrics_are_a_shared_no_op(monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_ENABLED', False)
+    assert metrics.span("tool", "x") is metrics.NOOP_SPAN
+    assert metrics.turn("t") is metrics.NOOP_SPAN
+
+    def func():
+        return 1
+    assert metrics.traced("tool", "x")(func) is func
+
+
+def test_graph_turn_records_node_and_tool_spans_and_a_trace(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'TRACE_DIR', str(tmp_path))
+    graph = fake_graph()
+    before = tool_calls()
+
+    list(stream_response(graph, inputs(), {"configurable": {"thread_id": "m1"}}))
+    assert tool_calls() == before + 1
+
+    async def run():
+        async for _ in astream_response(graph, inputs("Otra"), {"configurable": {"thread_id": "m1"}}):
+            pass
+    asyncio.run(run())
+    # La versión async de la herramienta no se cuenta dos veces
+    assert tool_calls() == before + 2
+
+    traces = sorted(tmp_path.glob("turn-*.json"))
+    assert len(traces) == 2
+    trace = json.loads(traces[0].read_text())
+    # El thread_id no se guarda tal cual: solo su huella
+    assert trace["thread_id"] == metrics.anonymize("m1") != "m1"
+    spans = {(s["kind"], s["name"]): s for s in trace["spans"]}
+    assert {("node", "router"), ("node", "agent"), ("node", "tools"), ("tool", "get_current_datetime")} <= set(spans)
+    assert spans[("tool", "get_current_datetime")]["parent"] == spans[("node", "tools")]["id"]
+
+
+def test_slow_turn_writes_a_folded_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'PROFILE_SLOW_TURNS', 0.05)
+    monkeypatch.setattr(metrics, 'PROFILE_DIR', str(tmp_path))
+
+    def slow_function():
+        import time
+        time.sleep(0.1)
+
+    with metrics.turn("lento"):
+        slow_function()
+    with metrics.turn("rapido"):
+        pass
+
+    profiles = list(tmp_path.glob("slow-turn-*.folded"))
+    assert len(profiles) == 1
+    assert "slow_function" in profiles[0].read_text()
+
+
+def test_metrics_endpoint(monkeypatch):
+    monkeypatch.setattr(api, 'API_TOKEN', 'secreto')
+    with TestClient(create_app(fake_graph), headers={"Authorization": "Bearer secreto"}) as client:
+        thread_id = client.post("/threads").json()["thread_id"]
+        assert client.post(f"/threads/{thread_id}/messages", json={"content": "Hola"}).status_code == 200
+        response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'span_duration_seconds_count{kind="tool",name="get_current_datetime"}' in response.text
+    assert 'turn_duration_seconds_count' in response.text
+
+
+def test_metrics_server_listens_only_locally_by_default():
+    server = metrics.start_metrics_server(0)
+    try:
+        assert server.server_address[0] == "127.0.0.1"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,54 @@
+from benchmarks.fakes import FakeGmailService
+from langgraph_components.outbox import EmailOutbox, GmailBatchSender
+
+
+def make_outbox(tmp_path, gmail, **kwargs):
+    return EmailOutbox(GmailBatchSender(lambda: gmail), path=str(tmp_path / 'outbox.db'),
+                       backoff_base=0, **kwargs)
+
+
+def test_queued_emails_are_sent_in_one_batch(tmp_path):
+    gmail = FakeGmailService()
+    outbox = make_outbox(tmp_path, gmail)
+    for i in range(3):
+        outbox.enqueue(f'cliente{i}@example.com', {'raw': f'mensaje {i}'})
+    assert outbox.get_stats()['queue_depth'] == 3
+
+    assert outbox.drain_once() == 3
+    assert gmail.batches == 1
+    assert [m['raw'] for m in gmail.sent] == ['mensaje 0', 'mensaje 1', 'mensaje 2']
+    stats = outbox.get_stats()
+    assert stats['sent'] == 3 and stats['queue_depth'] == 0
+    assert stats['send_latency_p50'] is not None
+
+
+def test_repeated_requests_for_same_email_send_once(tmp_path):
+    gmail = FakeGmailService()
+    outbox = make_outbox(tmp_path, gmail)
+    assert not outbox.recently_queued('a@example.com')
+    assert outbox.enqueue('a@example.com', {'raw': 'primer código'})
+    assert not outbox.enqueue('a@example.com', {'raw': 'segundo código'})
+    assert outbox.recently_queued('a@example.com')
+
+    outbox.drain_once()
+    assert [m['raw'] for m in gmail.sent] == ['segundo código']
+    assert outbox.recently_queued('a@example.com')
+
+
+def test_transient_errors_are_retried_and_permanent_ones_fail(tmp_path):
+    gmail = FakeGmailService()
+    outbox = make_outbox(tmp_path, gmail, max_attempts=3)
+    outbox.enqueue('a@example.com', {'raw': 'hola'})
+    gmail.fail_next(503, 429)
+    outbox.drain_once()
+    outbox.drain_once()
+    assert outbox.get_stats()['retries'] == 2
+    outbox.drain_once()
+    assert len(gmail.sent) == 1
+
+    outbox.enqueue('b@example.com', {'raw': 'hola'})
+    gmail.fail_next(400)
+    outbox.drain_once()
+    stats = outbox.get_stats()
+    assert stats['failed'] == 1 and stats['queue_depth'] == 0
+    assert not outbox.recently_queued('b@example.com')
@@ -0,0 +1,150 @@
+import pytest
+import threading
+import time
+from langgraph_components import graph_tools, rate_limiter, verification_store
+from langgraph_components.metrics import metrics
+from langgraph_components.rate_limiter import MemoryRateLimiter, SQLiteRateLimiter
+from langgraph_components.verification_store import MemoryVerificationStore
+
+
+def test_sliding_window_weights_the_previous_window(monkeypatch):
+    limiter = MemoryRateLimiter()
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, 'time', lambda: now[0])
+
+    assert [limiter.acquire("k", 3, 100) for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("k", 3, 100) == 100
+    # A mitad de la ventana siguiente aún cuentan 1.5 de los 3 intentos anteriores
+    now[0] = 1150.0
+    assert limiter.acquire("k", 3, 100) == 0
+    assert limiter.acquire("k", 3, 100) == 0
+    assert limiter.acquire("k", 3, 100) > 0
+    # Dos ventanas después la clave ya no cuenta y el barrido la elimina
+    now[0] = 1300.0
+    assert limiter.purge_expired() == 1
+    assert limiter.get_stats() == {'checks': 7, 'rejected': 2, 'lockouts': 0, 'keys': 0}
+
+
+def test_lockout_after_failures_is_shared_through_sqlite(tmp_path):
+    path = str(tmp_path / "limits.db")
+    first, second = SQLiteRateLimiter(path), SQLiteRateLimiter(path)
+
+    assert first.failure("k", 3, 900, 600) == 0
+    assert second.failure("k", 3, 900, 600) == 0
+    assert first.failure("k", 3, 900, 600) == 600
+    assert 0 < second.locked_for("k") <= 600
+    assert second.acquire("k", 10, 900) > 0
+    second.reset("k")
+    assert first.locked_for("k") == 0
+
+
+def test_verification_is_limited_before_any_io(monkeypatch):
+    monkeypatch.setattr(rate_limiter, '_limiter', MemoryRateLimiter())
+    store = MemoryVerificationStore()
+    monkeypatch.setattr(verification_store, '_store', store)
+
+    def no_outbox():
+        raise AssertionError("la bandeja de salida no debe abrirse")
+    monkeypatch.setattr(graph_tools, 'get_email_outbox', no_outbox)
+
+    def rejected(action, reason):
+        return metrics.counter_value('verification_rejected_total', action=action, reason=reason)
+
+    store.save("ana@example.com", "123456")
+    for _ in range(graph_tools.VERIFICATION_MAX_FAILURES):
+        assert graph_tools.verify_code.func("ana@example.com", "000000") is False
+    before = rejected('verify', 'email')
+    # Bloqueada: ni siquiera el código correcto se compara (ni se consume)
+    assert graph_tools.verify_code.func("ana@example.com", "123456").startswith("La verificación está bloqueada")
+    assert rejected('verify', 'email') == before + 1
+    assert store.count() == 1
+
+    limiter = rate_limiter.get_rate_limiter()
+    for _ in range(graph_tools.VERIFICATION_SEND_LIMIT):
+        limiter.acquire("send:email:bob@example.com", graph_tools.VERIFICATION_SEND_LIMIT,
+                        graph_tools.VERIFICATION_SEND_WINDOW)
+    before = rejected('send', 'email')
+    # El rechazo no abre la bandeja de salida (SQLite) ni guarda un código
+    result = graph_tools.send_verification_code.func("Bob@example.com")
+    assert result.startswith("Se alcanzó el límite")
+    assert rejected('send', 'email') == before + 1
+    assert store.count() == 1
+
+
+def test_rejected_or_unsent_codes_do_not_use_up_other_limits(monkeypatch, tmp_path):
+    limiter = SQLiteRateLimiter(str(tmp_path / "limits.db"))
+    monkeypatch.setattr(rate_limiter, '_limiter', limiter)
+    monkeypatch.setattr(verification_store, '_store', MemoryVerificationStore())
+    monkeypatch.setattr(graph_tools, 'get_email_outbox', lambda: FakeOutbox())
+    session = {"configurable": {"thread_id": "s1"}}
+
+    for _ in range(graph_tools.VERIFICATION_SEND_LIMIT):
+        limiter.acquire("send:email:bob@example.com", graph_tools.VERIFICATION_SEND_LIMIT,
+                        graph_tools.VERIFICATION_SEND_WINDOW)
+    # El correo está en su límite: la conversación no gasta su cupo en el intento rechazado
+    for _ in range(graph_tools.VERIFICATION_SESSION_SEND_LIMIT + 1):
+        result = graph_tools.send_verification_code.invoke({"email": "bob@example.com"}, session)
+        assert graph_tools.SEND_LIMIT_PATTERN.fullmatch(result)
+    assert graph_tools.send_verification_code.invoke({"email": "ana@example.com"}, session) == \
+        graph_tools.CODE_SENT_MESSAGE
+
+    # Si la bandeja de salida falla, el envío tampoco cuenta
+    def broken_outbox():
+        raise OSError("disco lleno")
+    monkeypatch.setattr(graph_tools, 'get_email_outbox', broken_outbox)
+    for _ in range(graph_tools.VERIFICATION_SEND_LIMIT):
+        with pytest.raises(OSError):
+            graph_tools.send_verification_code.invoke({"email": "luis@example.com"}, session)
+    monkeypatch.setattr(graph_tools, 'get_email_outbox', lambda: FakeOutbox())
+    assert graph_tools.send_verification_code.invoke({"email": "luis@example.com"}, session) == \
+        graph_tools.CODE_SENT_MESSAGE
+
+
+def test_released_attempts_free_their_slot():
+    with pytest.raises(TypeError):
+        rate_limiter.RateLimiter()
+    limiter = MemoryRateLimiter()
+    assert [limiter.acquire("k", 2, 900) for _ in range(2)] == [0, 0]
+    limiter.release("k", 900)
+    assert limiter.acquire("k", 2, 900) == 0
+    assert limiter.acquire("k", 2, 900) > 0
+
+
+class FakeOutbox:
+    def recently_queued(self, email):
+        return False
+
+    def enqueue(self, email, message):
+        pass
+
+
+def test_concurrent_wrong_codes_cannot_all_pass_the_lockout(monkeypatch, tmp_path):
+    monkeypatch.setattr(rate_limiter, '_limiter', SQLiteRateLimiter(str(tmp_path / "limits.db")))
+    compared = []
+
+    class SlowStore(MemoryVerificationStore):
+        def consume(self, email, code):
+            compared.append(code)
+            time.sleep(0.05)
+            return super().consume(email, code)
+    store = SlowStore()
+    monkeypatch.setattr(verification_store, '_store', store)
+    store.save("ana@example.com", "123456")
+
+    guesses = 10
+    barrier = threading.Barrier(guesses)
+    results = []
+
+    def guess(code):
+        barrier.wait()
+        results.append(graph_tools.verify_code.func("ana@example.com", code))
+    threads = [threading.Thread(target=guess, args=(f"{i:06d}",)) for i in range(guesses)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Solo los primeros VERIFICATION_MAX_FAILURES intentos llegan a comparar un código
+    assert len(compared) == graph_tools.VERIFICATION_MAX_FAILURES
+    assert sum(isinstance(r, str) and r.startswith("La verificación está bloqueada") for r in results) == \
+        guesses - graph_tools.VERIFICATION_MAX_FAILURES
@@ -0,0 +1,83 @@
+import asyncio
+from langgraph.checkpoint.memory import MemorySaver
+from benchmarks.fakes import FakeGmailService, ScriptedAgentModel
+from langgraph_components import graph_tools, verification_store
+from langgraph_components.graph import load_graph, stream_response, astream_response
+from langgraph_components.llm import ResponseCache
+from langgraph_components.outbox import EmailOutbox, GmailBatchSender
+from langgraph_components.router import fast_path_stats
+from langgraph_components.verification_store import MemoryVerificationStore
+
+
+def turn(graph, thread_id, content):
+    inputs = {"messages": [{"role": "user", "content": content}], "remaining_steps": 10}
+    events = list(stream_response(graph, inputs, {"configurable": {"thread_id": thread_id}}))
+    return [value for kind, value in events if kind == "tool_start"], events[-1][1]
+
+
+def test_time_question_skips_the_model():
+    model = ScriptedAgentModel(answer="respuesta del modelo")
+    graph = load_graph(checkpointer=MemorySaver(), llm=model, cache=ResponseCache(max_entries=0))
+    before = fast_path_stats.get_stats()
+
+    tools, answer = turn(graph, "t1", "¿Qué hora es?")
+    assert tools == ["get_current_datetime"]
+    assert "Bogotá" in answer
+    assert model.calls == 0
+
+    tools, answer = turn(graph, "t1", "Quiero agendar una cita")
+    assert answer == "respuesta del modelo"
+    assert model.calls == 1
+    stats = fast_path_stats.get_stats()
+    assert stats['fast_path'] == before['fast_path'] + 1
+    assert stats['turns'] == before['turns'] + 2
+
+
+def test_email_and_code_are_handled_without_the_model(tmp_path, monkeypatch):
+    gmail = FakeGmailService()
+    outbox = EmailOutbox(GmailBatchSender(lambda: gmail), path=str(tmp_path / 'outbox.db'))
+    store = MemoryVerificationStore()
+    monkeypatch.setattr(graph_tools, 'get_email_outbox', lambda: outbox)
+    monkeypatch.setattr(verification_store, '_store', store)
+    monkeypatch.setattr(graph_tools, 'generate_verification_code', lambda: '123456')
+
+    model = ScriptedAgentModel(answer="Para agendar necesito tu correo electrónico.")
+    graph = load_graph(checkpointer=MemorySaver(), llm=model, cache=ResponseCache(max_entries=0))
+
+    turn(graph, "t2", "Hola, quiero una cita")
+    tools, answer = turn(graph, "t2", "cliente@example.com")
+    assert tools == ["send_verification_code"]
+    assert "cliente@example.com" in answer
+    assert outbox.get_stats()['queue_depth'] == 1
+
+    tools, answer = turn(graph, "t2", "123 456")
+    assert tools == ["verify_code"]
+    assert "verificado" in answer
+    assert model.calls == 1
+
+    # Ya verificado: otro correo suelto no es un caso seguro y lo atiende el modelo
+    tools, answer = turn(graph, "t2", "cliente@example.com")
+    assert tools == []
+    assert model.calls == 2
+
+
+def test_failing_fast_path_tool_hands_the_turn_to_the_agent(monkeypatch):
+    def broken_outbox():
+        raise RuntimeError("SQLite no disponible")
+    monkeypatch.setattr(graph_tools, 'get_email_outbox', broken_outbox)
+    monkeypatch.setattr(verification_store, '_store', MemoryVerificationStore())
+
+    model = ScriptedAgentModel(answer="Para agendar necesito tu correo electrónico.")
+    graph = load_graph(checkpointer=MemorySaver(), llm=model, cache=ResponseCache(max_entries=0))
+    turn(graph, "t3", "Hola, quiero una cita")
+
+    tools, answer = turn(graph, "t3", "cliente@example.com")
+    assert tools == [] and answer == model.answer
+    assert model.calls == 2
+
+    async def run():
+        inputs = {"messages": [{"role": "user", "content": "otro@example.com"}], "remaining_steps": 10}
+        return [event async for event in astream_response(graph, inputs, {"configurable": {"thread_id": "t3"}})]
+
+    assert asyncio.run(run())[-1] == ("final", model.answer)
+    assert model.calls == 3
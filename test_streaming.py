@@ -0,0 +1,52 @@
+import asyncio
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+from benchmarks.fakes import ScriptedAgentModel
+from langgraph_components.graph import _stream_events, load_graph, stream_response, astream_response
+from langgraph_components.llm import ResponseCache
+
+
+def inputs(content):
+    return {"messages": [{"role": "user", "content": content}], "remaining_steps": 10}
+
+
+def collect(graph, content, thread_id):
+    config = {"configurable": {"thread_id": thread_id}}
+    sync_events = list(stream_response(graph, inputs(content), config))
+
+    async def run():
+        return [event async for event in astream_response(graph, inputs(content), {"configurable": {"thread_id": f"a{thread_id}"}})]
+
+    return sync_events, asyncio.run(run())
+
+
+def test_stream_events_translate_graph_chunks():
+    tool_call = {"name": "find_available_slots", "args": {}, "id": "1"}
+    chunks = [
+        ("messages", (AIMessageChunk(content="Un momento"), {"langgraph_node": "agent"})),
+        ("messages", (AIMessageChunk(content="ignorado"), {"langgraph_node": "tools"})),
+        ("updates", {"agent": {"messages": [AIMessage(content="Un momento", tool_calls=[tool_call])]}}),
+        ("updates", {"tools": {"messages": [ToolMessage(content="...", tool_call_id="1", name="find_available_slots")]}}),
+        ("updates", {"agent": {"messages": [AIMessage(content="Hay horarios el lunes.")]}}),
+    ]
+    events = [event for mode, payload in chunks for event in _stream_events(mode, payload)]
+    assert events == [("token", "Un momento"), ("tool_start", "find_available_slots"),
+                      ("tool_end", "find_available_slots"), ("answer", "Hay horarios el lunes.")]
+
+
+def test_turn_with_tools_streams_tools_then_tokens_then_final():
+    model = ScriptedAgentModel(tool_calls=[("get_current_datetime", {})], answer="Hoy es lunes.")
+    graph = load_graph(checkpointer=MemorySaver(), llm=model, cache=ResponseCache(max_entries=0))
+    expected = [("tool_start", "get_current_datetime"), ("tool_end", "get_current_datetime"),
+                ("token", "Hoy"), ("token", " es"), ("token", " lunes."), ("final", "Hoy es lunes.")]
+    assert collect(graph, "¿Tienes citas libres?", "t1") == (expected, expected)
+
+
+def test_fast_path_turn_streams_the_same_events():
+    model = ScriptedAgentModel(answer="respuesta del modelo")
+    graph = load_graph(checkpointer=MemorySaver(), llm=model, cache=ResponseCache(max_entries=0))
+    for events in collect(graph, "¿Qué hora es?", "t2"):
+        kinds = [kind for kind, _ in events]
+        assert kinds == ["tool_start", "tool_end", "token", "final"]
+        assert events[-1][1] == events[-2][1] and "Bogotá" in events[-1][1]
+    assert model.calls == 0
@@ -0,0 +1,33 @@
+from langgraph_components import graph_tools
+from langgraph_components.graph_tools import fit_budget, format_events
+
+EVENTS = [
+    {'id': 'evt1', 'summary': 'Cita con Ana', 'start': {'dateTime': '2025-03-10T20:00:00Z'},
+     'description': 'Motivo: asesoría | laboral\nCorreo: ana@example.com'},
+    {'id': 'evt2', 'summary': 'Festivo', 'start': {'date': '2025-03-11'}},
+]
+
+
+def test_compact_events_use_bogota_time_and_one_line_each(monkeypatch):
+    assert format_events(EVENTS, 'compact').splitlines() == [
+        "2 citas (id|inicio|titulo|descripcion):",
+        "evt1|10/03 15:00|Cita con Ana|Motivo: asesoría / laboral Correo: ana@example.com",
+        "evt2|11/03|Festivo|-",
+    ]
+    assert format_events(EVENTS, 'json').startswith('[')
+
+    monkeypatch.setattr(graph_tools, 'TOOL_RESULT_FORMATS', {'search_calendar_event': 'json'})
+    assert format_events(EVENTS).startswith('[')
+
+    long = dict(EVENTS[0], description="x" * 500)
+    assert format_events([long], 'compact').splitlines()[1].endswith("x…")
+
+
+def test_results_over_the_budget_are_cut_at_whole_lines():
+    text = "\n".join(f"linea {i:03d}" for i in range(100))
+    cut = fit_budget(text, max_chars=200)
+    assert len(cut) <= 200
+    assert cut.splitlines()[-2].startswith("linea ")
+    assert "líneas más" in cut.splitlines()[-1]
+    assert fit_budget("corto", max_chars=200) == "corto"
+    assert fit_budget(True, max_chars=1) is True
@@ -0,0 +1,38 @@
+import pytest
+from langgraph_components import verification_store
+from langgraph_components.verification_store import (
+    MemoryVerificationStore,
+    SQLiteVerificationStore,
+    VerificationStore,
+)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryVerificationStore()
+    return SQLiteVerificationStore(str(tmp_path / "codes.db"))
+
+
+def test_code_is_accepted_once_and_expires(store, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(verification_store.time, 'time', lambda: now[0])
+
+    store.save("ana@example.com", "123456")
+    assert store.consume("ana@example.com", "000000") is False
+    assert store.consume("ana@example.com", "123456") is True
+    # Un código solo vale una vez
+    assert store.consume("ana@example.com", "123456") is False
+
+    store.save("ana@example.com", "654321", ttl=60)
+    now[0] += 60
+    assert store.consume("ana@example.com", "654321") is False
+    store.save("bob@example.com", "111111", ttl=60)
+    now[0] += 61
+    assert store.purge_expired() >= 1
+    assert store.count() == 0
+
+
+def test_interface_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        VerificationStore()